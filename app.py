@@ -1,4 +1,4 @@
-from flask import Flask, request,  jsonify, send_from_directory
+from flask import Flask, Request, request,  jsonify, send_from_directory, Response, stream_with_context, url_for
 import re
 from flask_cors import CORS
 import os
@@ -8,33 +8,86 @@ import time
 import threading
 from datetime import datetime
 from werkzeug.utils import secure_filename
-from config import BASE_DIR, UPLOAD_FOLDER, ZIP_MAX_SIZE, TAR_MAX_SIZE, IMAGE_MAX_SIZE
+from config import BASE_DIR, UPLOAD_FOLDER, ZIP_MAX_SIZE, TAR_MAX_SIZE, IMAGE_MAX_SIZE, SUBMISSION_INPUT_MODE, SUBMISSION_SNAPSHOT_HARDLINK
 from logger import logger
 from docker_utils import get_docker_stats, periodic_cleanup
+from executors import get_executor
+from image_cache import organizer_image_cache, participant_image_retention
 from utils import (
     load_users,
-    extract_zip_to_folder,
     allowed_tar_file,
     allowed_zip_file,
     allowed_image_file,
     normalize_rel_path,
     get_disk_free_bytes,
     is_disk_space_sufficient,
+    snapshot_tree,
 )
 from services.contests import (
     generate_contest_id,
     contest_paths,
     get_all_contests,
+    get_contest_cover_path,
     get_contest_submissions,
+    contest_catalog,
+    resolve_submission_dir,
 )
-from services.submissions import append_submission_record
-from task_queue import enqueue_task, queue_size
-from queue_runner import run_queue_worker
+from services.journal import forget_journal
+from services.submissions import (
+    append_submission_record, list_submission_summaries, get_submission_results, summarize_timings
+)
+from services.leaderboard import leaderboards, get_leaderboard, get_participant_rank
+from task_queue import enqueue_task, queue_size, queue_head
+from queue_runner import run_queue_worker, get_scheduler_status
+from log_capture import tail_log
+from chunked_upload import upload_manager, UploadError
+from contest_provisioning import (
+    provisioner, STATUS_PROVISIONING as PROVISION_STATUS_PROVISIONING, STATUS_READY as PROVISION_STATUS_READY,
+    STATUS_FAILED as PROVISION_STATUS_FAILED
+)
+from submission_events import broker as event_broker, stream_events, publish_queued
+from zip_stream import ZipIngestStream
+from service_metrics import (
+    registry as metrics_registry, CONTENT_TYPE as METRICS_CONTENT_TYPE, contests_created_total,
+    submissions_received_total, upload_size_bytes
+)
+
+
+class IngestRequest(Request):
+    """/create 上传的 .zip 数据集在 multipart 解析时边接收边解压，不再整包落盘后再解压"""
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        if self.path == '/create' and filename and allowed_zip_file(filename):
+            return ZipIngestStream(filename, max_size=ZIP_MAX_SIZE)
+        return super()._get_file_stream(total_content_length, content_type, filename, content_length)
+
 
 app = Flask(__name__)
+app.request_class = IngestRequest
 
 STATIC_ROOT = os.path.join(os.path.dirname(__file__), "web")
 
+_SAFE_ID = re.compile(r'[\w-]+')
+
+
+def _is_safe_id(*values):
+    """路径中使用的评测/提交 ID 只允许字母、数字、下划线和连字符"""
+    return all(v and _SAFE_ID.fullmatch(v) for v in values)
+
+
+def _participant_id_arg():
+    """读取可选的 participant_id 查询参数（用于定位旧版按参赛者分目录的提交），非法值忽略"""
+    participant_id = request.args.get('participant_id')
+    return participant_id if participant_id and _is_safe_id(participant_id) else None
+
+# 日志 tail 接口单次返回的字节数
+LOG_TAIL_DEFAULT_LIMIT = 64 * 1024
+LOG_TAIL_MAX_LIMIT = 1024 * 1024
+
+# 封面图缓存时间（秒）：带版本号（?v=）的 URL 内容不会变化，可长期缓存；不带版本号时短期缓存
+COVER_IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+COVER_DEFAULT_MAX_AGE = 300
+
 # 初始化：创建必要的目录
 os.makedirs(BASE_DIR, exist_ok=True)
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
@@ -53,7 +106,9 @@ CORS(app, resources={
 app.secret_key = os.environ.get('FLASK_SECRET_KEY', 'change-me-locally')
 
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
-app.config['MAX_CONTENT_LENGTH'] = ZIP_MAX_SIZE
+# 单个请求体上限：需容纳 /create 一次性上传的镜像 tar、两个 ZIP 与封面图（另留 1MB 给表单字段）；
+# 更大的镜像请使用分块上传（/api/uploads）
+app.config['MAX_CONTENT_LENGTH'] = TAR_MAX_SIZE + 2 * ZIP_MAX_SIZE + IMAGE_MAX_SIZE + 1024 * 1024
 
 
 @app.route('/api/login', methods=['POST'])
@@ -115,10 +170,23 @@ def api_delete_contest():
     contest_dir = os.path.join(BASE_DIR, contest_id)
     if not os.path.exists(contest_dir):
         return jsonify({'code': 2, 'desc': '项目不存在'}), 404
+    if provisioner.is_running(contest_id):
+        return jsonify({'code': 4, 'desc': '评测仍在后台准备中，请稍后再删除'}), 409
+    # 删除目录前先淘汰该评测的主办方缓存镜像（需要读取 info.json 与镜像哈希）及保留的参赛者镜像
+    try:
+        get_executor().evict_contest(contest_id, contest_dir)
+    except Exception:
+        logger.exception('淘汰主办方缓存镜像失败')
+    provisioner.discard(contest_id, contest_dir)
+    event_broker.forget(contest_id)
+    leaderboards.forget(contest_id)
+    forget_journal(contest_paths(contest_id)[3])
     try:
         shutil.rmtree(contest_dir)
     except Exception as e:
         return jsonify({'code': 3, 'desc': f'删除失败: {str(e)}'}), 500
+    finally:
+        contest_catalog.invalidate(contest_id)
     return jsonify({'code': 0, 'desc': '删除成功'})
 @app.route('/api/users/delete', methods=['POST'])
 def api_delete_user():
@@ -179,11 +247,16 @@ def health():
             'status': 'healthy' 或 'degraded',
             'timestamp': ISO 时间戳,
             'queue_size': 当前队列中的任务数,
+            'scheduler': 并发评测数与槽位占用情况,
             'docker': Docker 连接状态,
+            'executor_health': 执行后端连接检查（Docker 后端为共享客户端的 ping 结果与连接池大小）,
             'uptime': 系统运行时间（秒）
         }
     """
     try:
+        # 先检查连接：daemon 重启后共享客户端在这里重置，随后的统计使用新连接
+        executor = get_executor()
+        executor_health = executor.health()
         docker_stats = get_docker_stats()
         docker_status = docker_stats.get('status', 'error')
         # 获取磁盘剩余空间（针对 BASE_DIR 所在分区）
@@ -198,13 +271,18 @@ def health():
             'status': 'healthy',
             'timestamp': datetime.utcnow().isoformat(),
             'queue_size': queue_size(),
+            'scheduler': get_scheduler_status(),
             'docker': docker_status,
+            'executor': executor.name,
+            'executor_health': executor_health,
             'docker_details': {
                 'images': docker_stats.get('images_count', 0),
                 'containers': docker_stats.get('containers_count', 0),
                 'running': docker_stats.get('running_containers', 0),
                 'dangling_images': docker_stats.get('dangling_images', 0)
             },
+            'organizer_image_cache': organizer_image_cache.stats(),
+            'participant_image_retention': participant_image_retention.stats(),
             'disk_free_bytes': disk_free_bytes,
             'disk_free_gb': round(disk_free_gb, 2) if disk_free_gb is not None else None
         }), 200
@@ -218,6 +296,12 @@ def health():
         }), 200  # 返回 200，因为这是健康检查端点
 
 
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus 指标（文本格式），指标定义见 service_metrics"""
+    return Response(metrics_registry.render(), content_type=METRICS_CONTENT_TYPE)
+
+
 
 
 @app.route('/create', methods=['GET', 'POST'])
@@ -237,21 +321,12 @@ def create_contest():
         if not description:
             return jsonify({'error': '算法描述不能为空'}), 400
 
-        # 同名校验：不允许已有同名的算法（按 title 忽略大小写匹配）
+        # 同名校验：不允许已有同名的算法（按 title 忽略大小写匹配，使用评测目录缓存）
         try:
-            for item in os.listdir(BASE_DIR):
-                info_file_path = os.path.join(BASE_DIR, item, 'info', 'info.json')
-                if not os.path.exists(info_file_path):
-                    continue
-                try:
-                    with open(info_file_path, 'r', encoding='utf-8') as _f:
-                        existing = json.load(_f)
-                        existing_title = (existing.get('title') or '').strip()
-                        if existing_title and existing_title.lower() == title.lower():
-                            return jsonify({'error': '已存在同名算法，请使用不同的标题'}), 400
-                except Exception:
-                    # 忽略单条读取失败，继续检查其它条目
-                    continue
+            for existing in get_all_contests():
+                existing_title = (existing.get('title') or '').strip()
+                if existing_title and existing_title.lower() == title.lower():
+                    return jsonify({'error': '已存在同名算法，请使用不同的标题'}), 400
         except Exception:
             # 若遍历出错，不阻止创建；但是记录日志（不抛出）
             try:
@@ -273,51 +348,81 @@ def create_contest():
             except Exception:
                 pass
         
-        # 检查文件
-        if 'image' not in request.files:
+        # 检查文件（每个文件可直接随表单上传，也可先通过 /api/uploads 分块上传后传入 upload_id）
+        image_upload_id = request.form.get('image_upload_id', '').strip()
+        source_upload_id = request.form.get('source_upload_id', '').strip()
+        result_upload_id = request.form.get('result_upload_id', '').strip()
+
+        if not image_upload_id and 'image' not in request.files:
             return jsonify({'error': '没有上传评测镜像文件'}), 400
         
-        if 'source' not in request.files:
+        if not source_upload_id and 'source' not in request.files:
             return jsonify({'error': '没有上传评测数据源文件'}), 400
-        if 'result' not in request.files:
+        if not result_upload_id and 'result' not in request.files:
             return jsonify({'error': '没有上传结果集文件'}), 400
 
-        image_file = request.files['image']
-        source_file = request.files['source']
-        result_file = request.files['result']
+        image_file = None if image_upload_id else request.files['image']
+        source_file = None if source_upload_id else request.files['source']
+        result_file = None if result_upload_id else request.files['result']
+
+        try:
+            image_name = upload_manager.filename(image_upload_id) if image_upload_id else image_file.filename
+            source_name = upload_manager.filename(source_upload_id) if source_upload_id else source_file.filename
+            result_name = upload_manager.filename(result_upload_id) if result_upload_id else result_file.filename
+        except UploadError as e:
+            return jsonify({'error': str(e)}), e.status
 
-        if image_file.filename == '':
+        if image_name == '':
             return jsonify({'error': '镜像文件名为空'}), 400
-        if source_file.filename == '':
+        if source_name == '':
             return jsonify({'error': '评测数据源文件名为空'}), 400
-        if result_file.filename == '':
+        if result_name == '':
             return jsonify({'error': '结果集文件名为空'}), 400
 
-        # if not allowed_tar_file(image_file.filename):
+        # if not allowed_tar_file(image_name):
         #     return jsonify({'error': '评测镜像只支持 .tar 文件'}), 400
-        if not allowed_zip_file(source_file.filename):
+        if not allowed_zip_file(source_name):
             return jsonify({'error': '评测数据源只支持 .zip 文件'}), 400
-        if not allowed_zip_file(result_file.filename):
+        if not allowed_zip_file(result_name):
             return jsonify({'error': '结果集只支持 .zip 文件'}), 400
 
-        # 检查 ZIP 文件大小（500MB 限制）
-        source_file.seek(0, os.SEEK_END)
-        source_size = source_file.tell()
-        source_file.seek(0)
-        result_file.seek(0, os.SEEK_END)
-        result_size = result_file.tell()
-        result_file.seek(0)
+        # 检查 ZIP 文件大小（500MB 限制；分块上传在初始化时已校验）
+        source_size = _uploaded_size(source_file)
+        result_size = _uploaded_size(result_file)
 
-        if source_size > ZIP_MAX_SIZE:
+        if source_size is not None and source_size > ZIP_MAX_SIZE:
             return jsonify({'error': f'评测数据源文件过大（最大 {ZIP_MAX_SIZE / 1024 / 1024:.1f }MB，当前 {source_size / 1024 / 1024:.1f}MB）'}), 400
-        if result_size > ZIP_MAX_SIZE:
+        if result_size is not None and result_size > ZIP_MAX_SIZE:
             return jsonify({'error': f'结果集文件过大（最大 {ZIP_MAX_SIZE / 1024 / 1024:.1f }MB，当前 {result_size / 1024 / 1024:.1f}MB）'}), 400
 
-        # 生成算法ID
+        # 边接收边解压的数据集：路径穿越、解压炸弹、格式等检查未通过时，已解压的内容在接收过程中就已删除
+        for label, uploaded in (('评测数据源', source_file), ('结果集', result_file)):
+            if uploaded is not None and isinstance(uploaded.stream, ZipIngestStream) and uploaded.stream.error:
+                return jsonify({'error': f'{label}解压失败: {uploaded.stream.error}'}), 400
+
+        # 检查评测镜像大小
+        image_size = _uploaded_size(image_file)
+        if image_size is not None and image_size > TAR_MAX_SIZE:
+            return jsonify({'error': f'评测镜像文件过大（最大 {TAR_MAX_SIZE / 1024 / 1024:.1f}MB，当前 {image_size / 1024 / 1024:.1f}MB）'}), 400
+
+        # 检查封面图文件
+        if 'cover_image' not in request.files:
+            return jsonify({'error': '没有上传封面图文件'}), 400
+
+        cover_image_file = request.files['cover_image']
+
+        if cover_image_file.filename == '':
+            return jsonify({'error': '封面图文件名为空'}), 400
+
+        if not allowed_image_file(cover_image_file.filename):
+            return jsonify({'error': '封面图只支持 .jpg 和 .png 文件'}), 400
+
+        # 生成算法ID：以上检查全部通过后才领取分块上传并创建目录，检查失败时上传会话保持不变，可用原 upload_id 重试
         contest_id = generate_contest_id()
 
-        # 创建目录结构: {BASE_DIR}/{contest_id}/info/
+        # 创建目录结构: {BASE_DIR}/{contest_id}/info/；之后任何一步失败都删除整个目录与已移入的数据集 ZIP
         contest_dir = os.path.join(BASE_DIR, contest_id)
+        temp_files.append(contest_dir)
         info_dir = os.path.join(contest_dir, 'info')
         dataset_source_dir = os.path.join(info_dir, 'dataset', 'source')
         dataset_result_dir = os.path.join(info_dir, 'dataset', 'result')
@@ -325,41 +430,26 @@ def create_contest():
         os.makedirs(dataset_source_dir, exist_ok=True)
         os.makedirs(dataset_result_dir, exist_ok=True)
 
-        # 检查并保存评测镜像（检查大小限制）
-        try:
-            image_file.seek(0, os.SEEK_END)
-            image_size = image_file.tell()
-            image_file.seek(0)
-        except Exception:
-            image_size = None
-
-        if image_size is not None and image_size > TAR_MAX_SIZE:
-            return jsonify({'error': f'评测镜像文件过大（最大 {TAR_MAX_SIZE / 1024 / 1024:.1f}MB，当前 {image_size / 1024 / 1024:.1f}MB）'}), 400
-
-        image_filename = secure_filename(image_file.filename)
+        # 保存评测镜像
+        image_filename = secure_filename(image_name)
         image_tar_path = os.path.join(info_dir, image_filename)
-        image_file.save(image_tar_path)
+        _save_uploaded(image_file, image_upload_id, image_tar_path)
         temp_files.append(image_tar_path)
-
-        # 保存并解压评测数据源
-        source_zip_filename = secure_filename(source_file.filename)
-        source_zip_path = os.path.join(UPLOAD_FOLDER, f'{contest_id}_source.zip')
-        source_file.save(source_zip_path)
-        temp_files.append(source_zip_path)
-
-        success, error = extract_zip_to_folder(source_zip_path, dataset_source_dir)
-        if not success:
-            raise Exception(f'评测数据源解压失败: {error}')
-
-        # 保存并解压结果集
-        result_zip_filename = secure_filename(result_file.filename)
-        result_zip_path = os.path.join(UPLOAD_FOLDER, f'{contest_id}_result.zip')
-        result_file.save(result_zip_path)
-        temp_files.append(result_zip_path)
-
-        success, error = extract_zip_to_folder(result_zip_path, dataset_result_dir)
-        if not success:
-            raise Exception(f'结果集解压失败: {error}')
+        upload_size_bytes.observe(os.path.getsize(image_tar_path), kind='contest_image')
+
+        # 保存评测数据源与结果集：随表单上传的已在接收时解压，直接移动到数据集目录；
+        # 分块上传的 ZIP 在后台准备任务中并行解压
+        source_zip_filename = secure_filename(source_name)
+        source_zip_path = _stage_dataset(source_file, source_upload_id,
+                                         os.path.join(UPLOAD_FOLDER, f'{contest_id}_source.zip'), dataset_source_dir)
+        if source_zip_path:
+            temp_files.append(source_zip_path)
+
+        result_zip_filename = secure_filename(result_name)
+        result_zip_path = _stage_dataset(result_file, result_upload_id,
+                                         os.path.join(UPLOAD_FOLDER, f'{contest_id}_result.zip'), dataset_result_dir)
+        if result_zip_path:
+            temp_files.append(result_zip_path)
         
         owner_id = 'system'
         owner_name = '系统'
@@ -371,25 +461,13 @@ def create_contest():
         except Exception:
             pass
 
-        # 检查封面图文件
-        if 'cover_image' not in request.files:
-            return jsonify({'error': '没有上传封面图文件'}), 400
-
-        cover_image_file = request.files['cover_image']
-
-        if cover_image_file.filename == '':
-            return jsonify({'error': '封面图文件名为空'}), 400
-
-        if not allowed_image_file(cover_image_file.filename):
-            return jsonify({'error': '封面图只支持 .jpg 和 .png 文件'}), 400
-
         # 保存封面图
         cover_image_filename = secure_filename(cover_image_file.filename)
         cover_image_path = os.path.join(info_dir, cover_image_filename)
         cover_image_file.save(cover_image_path)
         temp_files.append(cover_image_path)
 
-        # 创建 info.json 文件
+        # 创建 info.json 文件（status 为 provisioning，准备任务全部完成后置为 ready）
         info_data = {
             'title': title,
             'description': description,
@@ -399,24 +477,24 @@ def create_contest():
             'cover_image': cover_image_filename,  # 添加封面图路径
             'owner_id': owner_id,
             'owner_name': owner_name,
-            'createTime': datetime.utcnow().isoformat()
+            'createTime': datetime.utcnow().isoformat(),
+            'status': PROVISION_STATUS_PROVISIONING
         }
         info_file = os.path.join(info_dir, 'info.json')
         with open(info_file, 'w', encoding='utf-8') as f:
             json.dump(info_data, f, ensure_ascii=False, indent=2)
+        contest_catalog.invalidate(contest_id)
         
-        # 清理临时 ZIP 文件
-        for temp_file in temp_files:
-            try:
-                if temp_file.endswith('.zip') and os.path.exists(temp_file):
-                    os.remove(temp_file)
-            except:
-                pass
+        # 后台解压数据集并预加载主办方镜像，请求立即返回；进度通过 /api/contests/<id>/provision 查询
+        provisioner.submit(contest_id, contest_dir, source_zip_path, result_zip_path)
+        contests_created_total.inc()
         
         return jsonify({
             'status': 'success',
-            'message': '算法创建成功',
-            'contest_id': contest_id
+            'message': '算法创建成功，正在后台准备评测数据',
+            'contest_id': contest_id,
+            'provision_status': PROVISION_STATUS_PROVISIONING,
+            'provision_url': url_for('api_contest_provision', contest_id=contest_id)
         }), 201
     
     except Exception as e:
@@ -431,17 +509,67 @@ def create_contest():
             except:
                 pass
         
+        # 分块上传已被其他请求使用或已过期等，按其状态码返回
+        if isinstance(e, UploadError):
+            return jsonify({'error': str(e), 'status': 'error'}), e.status
         return jsonify({'error': str(e), 'status': 'error'}), 500
 
 
 
+@app.route('/api/contests/<contest_id>/provision')
+def api_contest_provision(contest_id):
+    """API: 评测创建后的后台准备任务状态（各阶段进度，status 为 provisioning/ready/failed）"""
+    if not _is_safe_id(contest_id):
+        return jsonify({'error': '非法的评测 ID'}), 400
+    state = provisioner.status(contest_id, os.path.join(BASE_DIR, contest_id))
+    if state is None:
+        return jsonify({'error': '评测不存在'}), 404
+    return jsonify(state)
+
+
+@app.route('/api/contests/<contest_id>/provision', methods=['POST'])
+def api_contest_provision_retry(contest_id):
+    """API: 重试失败的准备任务（已完成的阶段跳过）"""
+    if not _is_safe_id(contest_id):
+        return jsonify({'error': '非法的评测 ID'}), 400
+    contest_dir = os.path.join(BASE_DIR, contest_id)
+    state = provisioner.status(contest_id, contest_dir)
+    if state is None:
+        return jsonify({'error': '评测不存在'}), 404
+    if state.get('status') != PROVISION_STATUS_FAILED:
+        return jsonify({'error': f'评测当前状态为 {state.get("status")}，无需重试', **state}), 409
+    job = provisioner.retry(contest_id, contest_dir)
+    if job is None:
+        return jsonify({'error': '准备任务已在进行中'}), 409
+    contest_catalog.invalidate(contest_id)
+    return jsonify(job.snapshot()), 202
+
+
 @app.route('/api/contests')
 def api_contests():
-    """API: 获取所有算法信息"""
+    """API: 获取所有算法信息（封面图以 URL 返回，不内联图片内容）"""
     contests = get_all_contests()
+    for info in contests:
+        version = info.pop('cover_version', None)
+        if info.get('cover_image'):
+            info['cover_image'] = url_for('api_contest_cover', contest_id=info['id'], v=version, _external=True)
     return jsonify(contests)
 
 
+@app.route('/api/contests/<contest_id>/cover')
+def api_contest_cover(contest_id):
+    """API: 评测封面图（支持 ETag / If-None-Match 条件请求）"""
+    if not _is_safe_id(contest_id):
+        return jsonify({'error': '非法的评测 ID'}), 400
+    cover_path = get_contest_cover_path(contest_id)
+    if not cover_path or not os.path.exists(cover_path):
+        return jsonify({'error': '封面不存在'}), 404
+    max_age = COVER_IMMUTABLE_MAX_AGE if request.args.get('v') else COVER_DEFAULT_MAX_AGE
+    response = send_from_directory(os.path.dirname(cover_path), os.path.basename(cover_path), max_age=max_age)
+    response.cache_control.public = True
+    return response
+
+
 @app.route('/api/upload-config', methods=['GET'])
 def api_upload_config():
     """返回前端用于上传验证的服务端配置（允许的后缀和大小限制）。
@@ -500,13 +628,238 @@ def api_disk_info():
 
 @app.route('/api/contests/<contest_id>/submissions')
 def api_contest_submissions(contest_id):
-    """API: 获取某算法的所有提交（参赛者ID、姓名、提交时间、主办方结果）"""
+    """
+    API: 获取某算法的提交
+
+    携带 page 参数时分页返回摘要（只读提交索引），支持 page_size、participant_id、
+    status（逗号分隔）、sort（time/score）、order（asc/desc）；
+    不带 page 时保持旧行为，返回包含日志与结果的完整列表。
+    """
+    if not _is_safe_id(contest_id):
+        return jsonify({'error': '非法的评测 ID'}), 400
+    try:
+        if 'page' not in request.args:
+            submissions = get_contest_submissions(contest_id)
+            return jsonify(submissions)
+
+        try:
+            page = int(request.args.get('page', 1))
+            page_size = int(request.args.get('page_size', 20))
+        except ValueError:
+            return jsonify({'error': 'page 与 page_size 必须是整数'}), 400
+        sort = request.args.get('sort', 'time')
+        order = request.args.get('order', 'desc')
+        if sort not in ('time', 'score') or order not in ('asc', 'desc'):
+            return jsonify({'error': 'sort 只能是 time/score，order 只能是 asc/desc'}), 400
+        status = request.args.get('status')
+        statuses = {s.strip() for s in status.split(',') if s.strip()} if status else None
+        return jsonify(list_submission_summaries(
+            contest_id,
+            page=page,
+            page_size=page_size,
+            participant_id=request.args.get('participant_id') or None,
+            statuses=statuses,
+            sort=sort,
+            order=order
+        ))
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/contests/<contest_id>/leaderboard')
+def api_contest_leaderboard(contest_id):
+    """API: 排行榜前 limit 名（每个参赛者取最佳提交，排序规则见 info.json 的 leaderboard 字段）"""
+    if not _is_safe_id(contest_id):
+        return jsonify({'error': '非法的评测 ID'}), 400
+    try:
+        limit = int(request.args.get('limit', 20))
+    except ValueError:
+        return jsonify({'error': 'limit 必须是整数'}), 400
+    try:
+        return jsonify(get_leaderboard(contest_id, limit))
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/api/contests/<contest_id>/leaderboard/me')
+def api_contest_leaderboard_me(contest_id):
+    """API: 当前参赛者的名次（优先使用登录用户，其次 participant_id 参数）"""
+    if not _is_safe_id(contest_id):
+        return jsonify({'error': '非法的评测 ID'}), 400
+    from flask import session
+    participant_id = (session.get('user') or {}).get('id') or _participant_id_arg()
+    if not participant_id:
+        return jsonify({'error': '缺少 participant_id'}), 400
+    try:
+        return jsonify(get_participant_rank(contest_id, participant_id))
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/contests/<contest_id>/timings')
+def api_contest_timings(contest_id):
+    """API: 最近 limit 个已完成提交的分阶段耗时分布（可按 participant_id 筛选），用于定位慢阶段"""
+    if not _is_safe_id(contest_id):
+        return jsonify({'error': '非法的评测 ID'}), 400
+    try:
+        limit = int(request.args.get('limit', 500))
+    except ValueError:
+        return jsonify({'error': 'limit 必须是整数'}), 400
     try:
-        submissions = get_contest_submissions(contest_id)
-        return jsonify(submissions)
+        return jsonify(summarize_timings(contest_id, limit, participant_id=_participant_id_arg()))
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/contests/<contest_id>/submissions/<submission_id>/results')
+def api_submission_results(contest_id, submission_id):
+    """API: 按需获取单个提交的主办方结果与参赛者输出"""
+    if not _is_safe_id(contest_id, submission_id):
+        return jsonify({'error': '非法的评测或提交 ID'}), 400
+    participant_id = _participant_id_arg()
+    results = get_submission_results(contest_id, submission_id, participant_id)
+    if results is None:
+        return jsonify({'error': '提交不存在'}), 404
+    return jsonify(results)
+
+@app.route('/api/contests/<contest_id>/submissions/<submission_id>/logs/<kind>')
+def api_submission_logs(contest_id, submission_id, kind):
+    """API: 按需获取单个提交的完整日志（纯文本）"""
+    if kind not in ('participant', 'organizer'):
+        return jsonify({'error': '日志类型只能是 participant 或 organizer'}), 400
+    if not _is_safe_id(contest_id, submission_id):
+        return jsonify({'error': '非法的评测或提交 ID'}), 400
+    participant_id = _participant_id_arg()
+    submission_dir = resolve_submission_dir(contest_id, submission_id, participant_id)
+    filename = f'{kind}_logs.txt'
+    if not submission_dir or not os.path.exists(os.path.join(submission_dir, filename)):
+        return jsonify({'error': '日志不存在'}), 404
+    return send_from_directory(submission_dir, filename, mimetype='text/plain; charset=utf-8')
+
+@app.route('/api/contests/<contest_id>/events')
+def api_contest_events(contest_id):
+    """API: 以 Server-Sent Events 推送评测下提交的状态变化、排队位置与最终结果"""
+    if not _is_safe_id(contest_id):
+        return jsonify({'error': '非法的评测 ID'}), 400
+    # EventSource 重连时通过 Last-Event-ID 头携带上次收到的事件 ID，也允许用查询参数指定
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    return Response(
+        stream_with_context(stream_events(contest_id, last_event_id)),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+@app.route('/api/contests/<contest_id>/submissions/<submission_id>/runtime-series')
+def api_submission_runtime_series(contest_id, submission_id):
+    """API: 获取单个提交的资源时间序列（直接读取提交目录，不加载提交列表）"""
+    if not _is_safe_id(contest_id, submission_id):
+        return jsonify({'error': '非法的评测或提交 ID'}), 400
+    participant_id = _participant_id_arg()
+    submission_dir = resolve_submission_dir(contest_id, submission_id, participant_id)
+    series_path = os.path.join(submission_dir, 'runtime_series.json') if submission_dir else None
+    if not series_path or not os.path.exists(series_path):
+        return jsonify({'error': '未找到资源时间序列'}), 404
+    return send_from_directory(submission_dir, 'runtime_series.json', mimetype='application/json')
+
+@app.route('/api/contests/<contest_id>/submissions/<submission_id>/logs/<kind>/tail')
+def api_submission_log_tail(contest_id, submission_id, kind):
+    """API: 按字节偏移增量读取提交的容器日志（运行中的容器实时读取）"""
+    if kind not in ('participant', 'organizer'):
+        return jsonify({'error': '日志类型只能是 participant 或 organizer'}), 400
+    if not _is_safe_id(contest_id, submission_id):
+        return jsonify({'error': '非法的评测或提交 ID'}), 400
+    try:
+        offset = max(int(request.args.get('offset', 0)), 0)
+        limit = min(max(int(request.args.get('limit', LOG_TAIL_DEFAULT_LIMIT)), 1), LOG_TAIL_MAX_LIMIT)
+    except ValueError:
+        return jsonify({'error': 'offset 与 limit 必须是整数'}), 400
+    participant_id = _participant_id_arg()
+    submission_dir = resolve_submission_dir(contest_id, submission_id, participant_id)
+    if not submission_dir:
+        return jsonify({'error': '提交不存在'}), 404
+    result = tail_log(os.path.join(submission_dir, f'{kind}_logs.txt'), offset, limit)
+    if result is None:
+        return jsonify({'error': '日志尚未生成'}), 404
+    return jsonify(result)
+
+def _uploaded_size(file):
+    """multipart 文件的大小；分块上传（file 为 None）或无法获取时返回 None。"""
+    if file is None:
+        return None
+    try:
+        file.seek(0, os.SEEK_END)
+        size = file.tell()
+        file.seek(0)
+        return size
+    except Exception:
+        return None
+
+
+def _save_uploaded(file, upload_id, dest_path):
+    """保存 multipart 文件，或把已完成的分块上传移动到 dest_path。"""
+    if upload_id:
+        upload_manager.claim(upload_id, dest_path)
+    else:
+        file.save(dest_path)
+
+
+def _stage_dataset(file, upload_id, zip_path, target_dir):
+    """
+    准备数据集 ZIP：已边接收边解压的直接移动到 target_dir 并返回 None，否则保存到 zip_path 留待后台解压
+
+    Returns:
+        待解压的 ZIP 路径或 None
+    """
+    if file is not None and isinstance(file.stream, ZipIngestStream):
+        file.stream.claim(target_dir)
+        return None
+    _save_uploaded(file, upload_id, zip_path)
+    return zip_path
+
+
+def _upload_error(e):
+    return jsonify({'error': str(e), **e.details}), e.status
+
+
+@app.route('/api/uploads', methods=['POST'])
+def api_upload_init():
+    """初始化分块上传：校验文件类型、大小上限与磁盘空间。"""
+    data = request.get_json(silent=True) or {}
+    try:
+        session = upload_manager.init((data.get('filename') or '').strip(), data.get('size'))
+    except UploadError as e:
+        return _upload_error(e)
+    return jsonify(session.status()), 201
+
+
+@app.route('/api/uploads/<upload_id>', methods=['GET'])
+def api_upload_status(upload_id):
+    try:
+        return jsonify(upload_manager.get(upload_id).status())
+    except UploadError as e:
+        return _upload_error(e)
+
+
+@app.route('/api/uploads/<upload_id>', methods=['PUT'])
+def api_upload_chunk(upload_id):
+    """上传一个分块：请求体为原始字节，offset 必须等于服务端已接收的字节数。"""
+    try:
+        offset = int(request.args.get('offset', ''))
+    except ValueError:
+        return jsonify({'error': 'offset 必须是整数'}), 400
+    try:
+        session = upload_manager.get(upload_id)
+        return jsonify(session.write_chunk(offset, request.stream, request.content_length))
+    except UploadError as e:
+        return _upload_error(e)
+
+
+@app.route('/api/uploads/<upload_id>/finalize', methods=['POST'])
+def api_upload_finalize(upload_id):
+    data = request.get_json(silent=True) or {}
+    try:
+        return jsonify(upload_manager.get(upload_id).finalize((data.get('sha256') or '').strip() or None))
+    except UploadError as e:
+        return _upload_error(e)
+
+
 @app.route('/submit', methods=['POST'])
 def submit():
     try:
@@ -530,15 +883,23 @@ def submit():
             if not re.match(r'^[A-Za-z0-9_-]{1,64}$', participant_id):
                 return jsonify({'error': '非法的 participant_id'}), 400
 
-        # 检查文件
-        if 'file' not in request.files:
-            return jsonify({'error': '没有上传文件'}), 400
-        
-        file = request.files['file']
-        if file.filename == '':
+        # 检查文件（直接随表单上传，或先通过 /api/uploads 分块上传后传入 upload_id）
+        upload_id = request.form.get('upload_id', '').strip()
+        if upload_id:
+            file = None
+            try:
+                file_name = upload_manager.filename(upload_id)
+            except UploadError as e:
+                return jsonify({'error': str(e)}), e.status
+        else:
+            if 'file' not in request.files:
+                return jsonify({'error': '没有上传文件'}), 400
+            file = request.files['file']
+            file_name = file.filename
+        if file_name == '':
             return jsonify({'error': '文件名为空'}), 400
         
-        if not allowed_tar_file(file.filename):
+        if not allowed_tar_file(file_name):
             return jsonify({'error': '只支持 .tar,.tar.gz 文件'}), 400
         
         # 验证算法是否存在且包含数据源
@@ -548,6 +909,9 @@ def submit():
         
         if not os.path.exists(dataset_source_dir):
             return jsonify({'error': f'算法 {unique_id} 的数据源不存在'}), 400
+        contest_info = contest_catalog.get(unique_id) or {}
+        if contest_info.get('status', PROVISION_STATUS_READY) != PROVISION_STATUS_READY:
+            return jsonify({'error': f'算法 {unique_id} 尚未准备就绪（{contest_info.get("status")}）'}), 409
 
         # 在提交前检查磁盘剩余空间，低于 10GB 则拒绝提交
         try:
@@ -570,47 +934,36 @@ def submit():
         submission_dir = os.path.join(submissions_root, f'submission_{submission_timestamp}')
         os.makedirs(submission_dir, exist_ok=True)
         
-        # 保存上传的文件到本次提交目录
-        filename = secure_filename(file.filename)
+        # 保存上传的文件到本次提交目录（分块上传的文件直接移动过来，不再复制）
+        filename = secure_filename(file_name)
         image_tar_path = os.path.join(submission_dir, filename)
         # 检查上传 tar 大小限制
-        try:
-            file.seek(0, os.SEEK_END)
-            file_size = file.tell()
-            file.seek(0)
-        except Exception:
-            file_size = None
-
-        try:
-            from config import TAR_MAX_SIZE
-        except Exception:
-            TAR_MAX_SIZE = ZIP_MAX_SIZE
-
+        file_size = _uploaded_size(file)
         if file_size is not None and file_size > TAR_MAX_SIZE:
             return jsonify({'error': f'上传文件过大（最大 {TAR_MAX_SIZE/1024/1024:.1f}MB，当前 {file_size/1024/1024:.1f}MB）'}), 400
 
-        file.save(image_tar_path)
+        try:
+            _save_uploaded(file, upload_id, image_tar_path)
+        except UploadError as e:
+            shutil.rmtree(submission_dir, ignore_errors=True)
+            return jsonify({'error': str(e)}), e.status
+        upload_size_bytes.observe(os.path.getsize(image_tar_path), kind='submission')
 
         # 创建输出目录（用于容器挂载），放在本次提交目录下
         output_dir = os.path.join(submission_dir, 'output')
         if not os.path.exists(output_dir):
             os.makedirs(output_dir, exist_ok=True)
         
-        # 创建输入目录，并复制数据源到该目录
-        input_dir = os.path.join(submission_dir, 'input')
-        if os.path.exists(input_dir):
-            shutil.rmtree(input_dir)
-        os.makedirs(input_dir, exist_ok=True)
-
-        # 复制 dataset/source 下的所有文件到本次提交的 input
-        for item in os.listdir(dataset_source_dir):
-            src = os.path.join(dataset_source_dir, item)
-            dst = os.path.join(input_dir, item)
-            if os.path.isdir(src):
-                shutil.copytree(src, dst)
-            else:
-                shutil.copy2(src, dst)
-        
+        # 评测数据：默认直接只读挂载共享的 dataset/source，不再为每次提交复制数据；
+        # snapshot 模式下以 reflink（不支持时复制）为本次提交生成不可变视图
+        if SUBMISSION_INPUT_MODE == 'snapshot':
+            input_dir = os.path.join(submission_dir, 'input')
+            if os.path.exists(input_dir):
+                shutil.rmtree(input_dir)
+            snapshot_tree(dataset_source_dir, input_dir, allow_hardlink=SUBMISSION_SNAPSHOT_HARDLINK)
+        else:
+            input_dir = dataset_source_dir
+
         # 记录本次提交到 submissions.json（参赛者提交历史），设置排队状态
         try:
             output_rel_path = normalize_rel_path(output_dir, contest_dir)
@@ -628,7 +981,7 @@ def submit():
             print(f"Failed to save submission record: {str(e)}")
 
         # 将任务加入本地队列
-        queue_len = enqueue_task({
+        task = {
             'submission_id': submission_timestamp,
             'contest_id': unique_id,
             'participant_id': participant_id,
@@ -637,7 +990,10 @@ def submit():
             'input_dir': input_dir,
             'contest_dir': contest_dir,
             'submission_dir': submission_dir
-        })
+        }
+        queue_len = enqueue_task(task)
+        submissions_received_total.inc()
+        publish_queued(unique_id, submission_timestamp, task['_queue_id'], queue_len, queue_head())
         
         return jsonify({
             'code': 0,
@@ -646,7 +1002,8 @@ def submit():
             'submission_time': submission_timestamp,
             'submission_id': submission_timestamp,
             'queue_size': queue_len,
-            'queue_ahead': max(queue_len - 1, 0)
+            'queue_ahead': max(queue_len - 1, 0),
+            'queue_id': task['_queue_id']
         })
     
     except Exception as e:
@@ -678,6 +1035,9 @@ if __name__ == '__main__':
     queue_thread = threading.Thread(target=run_queue_worker, daemon=True)
     queue_thread.start()
     logger.info("Queue worker started")
+
+    # 继续上次运行中未完成的评测准备任务
+    provisioner.resume_unfinished(BASE_DIR)
     
     # 启动 Docker 资源清理线程
     cleanup_thread = threading.Thread(
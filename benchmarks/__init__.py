@@ -0,0 +1 @@
+"""Benchmark suite (data generator, HTTP load test)."""
@@ -0,0 +1,163 @@
+"""
+基准测试公共工具：延迟分位数、进程 RSS 采样、运行环境信息、JSON 报告读写与对比
+"""
+
+import json
+import os
+import platform
+import subprocess
+import sys
+import threading
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 报告格式版本，字段含义变化时递增，对比时版本不同会给出提示
+REPORT_VERSION = 1
+
+
+def percentile(sorted_values, q):
+    """线性插值分位数（q 取 0~1），sorted_values 需已排序。"""
+    if not sorted_values:
+        return None
+    pos = (len(sorted_values) - 1) * q
+    low = int(pos)
+    high = min(low + 1, len(sorted_values) - 1)
+    return sorted_values[low] + (sorted_values[high] - sorted_values[low]) * (pos - low)
+
+
+def latency_summary(latencies):
+    """把以秒为单位的延迟列表汇总为毫秒统计。"""
+    values = sorted(latencies)
+    if not values:
+        return {'count': 0, 'mean_ms': None, 'p50_ms': None, 'p95_ms': None, 'p99_ms': None, 'max_ms': None}
+
+    def ms(value):
+        return round(value * 1000, 3)
+
+    return {
+        'count': len(values),
+        'mean_ms': ms(sum(values) / len(values)),
+        'p50_ms': ms(percentile(values, 0.50)),
+        'p95_ms': ms(percentile(values, 0.95)),
+        'p99_ms': ms(percentile(values, 0.99)),
+        'max_ms': ms(values[-1]),
+    }
+
+
+def read_rss_bytes(pid):
+    """读取进程当前 RSS（字节），非 Linux 或进程已退出时返回 None。"""
+    try:
+        with open(f'/proc/{pid}/status', 'r') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        return None
+    return None
+
+
+class RssSampler:
+    """后台线程按固定间隔采样进程 RSS，记录采样期间的峰值。"""
+
+    def __init__(self, pid, interval=0.05):
+        self.pid = pid
+        self.interval = interval
+        self.peak = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _sample(self):
+        rss = read_rss_bytes(self.pid)
+        if rss is not None and (self.peak is None or rss > self.peak):
+            self.peak = rss
+
+    def _loop(self):
+        while not self._stop.is_set():
+            self._sample()
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self._sample()
+        self._thread = threading.Thread(target=self._loop, name='rss-sampler', daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self._sample()
+        return False
+
+
+def mb(value):
+    return round(value / 1024 / 1024, 1) if value is not None else None
+
+
+def environment_info():
+    """记录在报告中的运行环境，便于判断两份报告是否可比。"""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_ROOT, capture_output=True,
+                                text=True, timeout=10).stdout.strip() or None
+    except Exception:
+        commit = None
+    return {
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'git_commit': commit,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    }
+
+
+def write_report(path, report):
+    report = dict(report, version=REPORT_VERSION, environment=environment_info())
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    return report
+
+
+def load_report(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def compare_results(baseline, current, metrics, tolerance):
+    """
+    对比两份报告 results 中同名条目的指标
+
+    Args:
+        metrics: {指标名: True 表示越大越好 / False 表示越小越好}
+        tolerance: 允许的相对退化比例（如 0.1 表示 10%）
+
+    Returns:
+        (rows, regressions)：rows 为 (条目, 指标, 基线值, 当前值, 相对变化)，regressions 为超出容差的行
+    """
+    if baseline.get('version') != current.get('version'):
+        print(f"[compare] 报告版本不同（{baseline.get('version')} vs {current.get('version')}），结果仅供参考")
+    rows = []
+    regressions = []
+    base_results = baseline.get('results') or {}
+    for name, result in (current.get('results') or {}).items():
+        base = base_results.get(name)
+        if not base:
+            continue
+        for metric, higher_is_better in metrics.items():
+            old, new = base.get(metric), result.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            row = (name, metric, old, new, change)
+            rows.append(row)
+            if (-change if higher_is_better else change) > tolerance:
+                regressions.append(row)
+    return rows, regressions
+
+
+def print_comparison(rows, regressions):
+    flagged = set(id(row) for row in regressions)
+    print(f"\n{'条目':<28}{'指标':<16}{'基线':>12}{'当前':>12}{'变化':>10}")
+    for row in rows:
+        name, metric, old, new, change = row
+        mark = '  <-- 退化' if id(row) in flagged else ''
+        print(f'{name:<28}{metric:<16}{old:>12.3f}{new:>12.3f}{change:>+10.1%}{mark}')
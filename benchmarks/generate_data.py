@@ -0,0 +1,316 @@
+"""
+生成基准测试用的 BASE_DIR 数据树
+
+按真实部署的形态生成评测与提交：
+- 提交数按 Zipf 分布落在各评测上（少数热门评测有上千次提交）
+- 大部分评测使用当前布局（evaluation/submissions.json 快照 + 追加日志 + submissions/submission_<id>/），
+  一部分使用旧版按参赛者分目录的布局（evaluation/<participant>/submissions.json + submission_<id>/），
+  两种布局都由 services.contests.get_contest_submissions 处理
+- 每个提交目录包含参赛者/主办方日志、organizer_results.json、output/results.json 与资源时间序列；
+  一部分当前布局的提交记录缺少 score/indicators 等升级后才有的字段，首次列出时会触发回填
+- 同时写出 bench.env（BASE_DIR、上传目录、队列库指向生成目录，执行后端为 fake）与 manifest.json
+  （评测 ID、布局、提交数，供 http_load 选择请求目标）
+
+用法：
+    python -m benchmarks.generate_data --out /tmp/bench                  # 500 个评测、10 万次提交
+    python -m benchmarks.generate_data --out /tmp/bench --contests 50 --submissions 5000
+"""
+
+import argparse
+import io
+import json
+import os
+import random
+import shutil
+import tarfile
+import time
+from datetime import datetime
+
+from benchmarks.common import REPO_ROOT
+from services.journal import journal_path_for
+
+LAYOUT_CURRENT = 'current'
+LAYOUT_LEGACY = 'legacy'
+
+# 评测状态分布：(status_code, status_desc, 权重)
+STATUS_MIX = [
+    (0, '参赛镜像执行成功', 85),
+    (2, '参赛镜像容器执行失败', 8),
+    (1, '参赛镜像执行超时', 4),
+    (3, '执行出错', 3),
+]
+
+LOG_LINES = [
+    'Loading model weights from /opt/model ...',
+    'Reading input files from /input',
+    'Processed batch {i}: loss={v:.4f}',
+    'Writing predictions to /output/results.json',
+    'WARNING: falling back to CPU inference',
+]
+
+
+def _log_text(rng, size):
+    lines = []
+    total = 0
+    i = 0
+    while total < size:
+        line = rng.choice(LOG_LINES).format(i=i, v=rng.random()) + '\n'
+        lines.append(line)
+        total += len(line)
+        i += 1
+    return ''.join(lines)[:size]
+
+
+def _write_json(path, data):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False)
+
+
+def _write_text(path, text):
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(text)
+
+
+def _tiny_tar(path, size=4096):
+    """写一个很小的镜像 tar（fake 执行后端只读取文件，不解析内容）。"""
+    data = os.urandom(size)
+    with tarfile.open(path, 'w') as tar:
+        info = tarfile.TarInfo('layer.tar')
+        info.size = len(data)
+        tar.addfile(info, io.BytesIO(data))
+
+
+def _zipf_counts(rng, total, buckets, exponent):
+    weights = [1 / (i + 1) ** exponent for i in range(buckets)]
+    rng.shuffle(weights)
+    counts = [0] * buckets
+    for index in rng.choices(range(buckets), weights=weights, k=total):
+        counts[index] += 1
+    return counts
+
+
+class DataGenerator:
+    def __init__(self, out_dir, args):
+        self.out_dir = os.path.abspath(out_dir)
+        self.base_dir = os.path.join(self.out_dir, 'projects')
+        self.args = args
+        self.rng = random.Random(args.seed)
+        self.participants = [f'p{i:05d}' for i in range(args.participants)]
+        self.statuses = [s[:2] for s in STATUS_MIX]
+        self.status_weights = [s[2] for s in STATUS_MIX]
+        # 提交时间从一年前开始递增，保证同一评测内的 submission_id（毫秒时间戳）唯一且有序
+        self.clock_ms = int((time.time() - 365 * 86400) * 1000)
+        self.files_written = 0
+
+    def _next_submission_id(self):
+        self.clock_ms += self.rng.randint(1000, 120000)
+        return str(self.clock_ms)
+
+    def _organizer_results(self, runtime):
+        score = round(self.rng.random(), 6)
+        return {
+            'indicator': [
+                {'key': 'score', 'name': 'score', 'value': score},
+                {'key': 'f1', 'name': 'F1', 'value': round(score * self.rng.uniform(0.8, 1.0), 6)},
+            ],
+            'runtimeInfo': {
+                'cpu': round(self.rng.uniform(50, 200), 2),
+                'memory': round(self.rng.uniform(100, 2000), 2),
+                'runtime': runtime,
+                'memoryPeak': round(self.rng.uniform(100, 2000), 2),
+            }
+        }
+
+    def _write_submission_files(self, submission_dir, status_code, organizer_results):
+        args = self.args
+        os.makedirs(os.path.join(submission_dir, 'output'), exist_ok=True)
+        _write_text(os.path.join(submission_dir, 'participant_logs.txt'), _log_text(self.rng, args.log_bytes))
+        _write_text(os.path.join(submission_dir, 'organizer_logs.txt'), _log_text(self.rng, args.log_bytes // 4))
+        self.files_written += 2
+        if status_code == 0:
+            _write_json(os.path.join(submission_dir, 'organizer_results.json'), organizer_results)
+            _write_json(os.path.join(submission_dir, 'output', 'results.json'),
+                        {'predictions': [round(self.rng.random(), 4) for _ in range(args.result_items)]})
+            points = 50
+            _write_json(os.path.join(submission_dir, 'runtime_series.json'), {
+                't': [round(i * 0.5, 2) for i in range(points)],
+                'cpu': [round(self.rng.uniform(0, 200), 1) for _ in range(points)],
+                'memory': [round(self.rng.uniform(0, 2000), 1) for _ in range(points)],
+            })
+            self.files_written += 3
+
+    def _make_record(self, contest_dir, submission_dir, participant_id, upgraded):
+        submission_id = os.path.basename(submission_dir)[len('submission_'):]
+        status_code, status_desc = self.rng.choices(self.statuses, weights=self.status_weights)[0]
+        runtime = round(self.rng.uniform(5, 290), 2)
+        organizer_results = self._organizer_results(runtime) if status_code == 0 else None
+        self._write_submission_files(submission_dir, status_code, organizer_results)
+        record = {
+            'submission_id': submission_id,
+            'timestamp': datetime.fromtimestamp(int(submission_id) / 1000).isoformat(),
+            'status_code': status_code,
+            'status_desc': status_desc,
+            'participant_id': participant_id,
+            'storage_path': os.path.relpath(submission_dir, start=contest_dir),
+            'output_path': os.path.relpath(os.path.join(submission_dir, 'output'), start=contest_dir).replace('\\', '/'),
+        }
+        if upgraded:
+            # 升级后的提交记录带有摘要与排名字段，列表和排行榜无需读取结果文件
+            indicators = {}
+            if organizer_results:
+                indicators = {item['key']: item['value'] for item in organizer_results['indicator']}
+            record.update({
+                'score': indicators.get('score'),
+                'runtime': runtime if organizer_results else None,
+                'indicators': indicators,
+                'runtime_info': organizer_results['runtimeInfo'] if organizer_results else {},
+                'image_load': {'bytes': 0, 'seconds': round(self.rng.uniform(0.5, 20), 3), 'reused': True},
+            })
+        return record
+
+    def _contest_info(self, index, layout):
+        owner = self.rng.choice(self.participants) if self.participants else 'system'
+        return {
+            'title': f'基准测试评测 {index:04d}',
+            'description': '由 benchmarks/generate_data.py 生成的评测' * 5,
+            'image': 'organizer.tar',
+            'source_dataset': 'source.zip',
+            'result_dataset': 'result.zip',
+            'cover_image': None,
+            'owner_id': owner,
+            'owner_name': owner,
+            'createTime': datetime.utcnow().isoformat(),
+            'status': 'ready',
+            'benchmark_layout': layout,
+        }
+
+    def _generate_contest(self, contest_id, index, layout, count):
+        args = self.args
+        contest_dir = os.path.join(self.base_dir, contest_id)
+        info_dir = os.path.join(contest_dir, 'info')
+        for name in ('source', 'result'):
+            dataset_dir = os.path.join(info_dir, 'dataset', name)
+            os.makedirs(dataset_dir, exist_ok=True)
+            _write_text(os.path.join(dataset_dir, 'data.csv'), 'id,value\n' + ''.join(
+                f'{i},{self.rng.random():.6f}\n' for i in range(100)))
+        _tiny_tar(os.path.join(info_dir, 'organizer.tar'))
+        _write_json(os.path.join(info_dir, 'info.json'), self._contest_info(index, layout))
+        evaluation_dir = os.path.join(contest_dir, 'evaluation')
+        os.makedirs(evaluation_dir, exist_ok=True)
+
+        # 同一评测内参赛者也按 Zipf 分布（少数人提交很多次）
+        active = self.rng.sample(self.participants, min(len(self.participants), max(1, count)))
+        weights = [1 / (i + 1) for i in range(len(active))]
+        owners = self.rng.choices(active, weights=weights, k=count)
+
+        if layout == LAYOUT_LEGACY:
+            by_participant = {}
+            for participant_id in owners:
+                submission_dir = os.path.join(evaluation_dir, participant_id,
+                                              f'submission_{self._next_submission_id()}')
+                record = self._make_record(contest_dir, submission_dir, participant_id, upgraded=False)
+                by_participant.setdefault(participant_id, []).append(record)
+            for participant_id, records in by_participant.items():
+                _write_json(os.path.join(evaluation_dir, participant_id, 'submissions.json'), {'submissions': records})
+            return
+
+        submissions_root = os.path.join(evaluation_dir, 'submissions')
+        records = []
+        for participant_id in owners:
+            submission_dir = os.path.join(submissions_root, f'submission_{self._next_submission_id()}')
+            upgraded = self.rng.random() >= args.unupgraded_fraction
+            records.append(self._make_record(contest_dir, submission_dir, participant_id, upgraded))
+
+        # 最近的一部分提交只在追加日志中（尚未压缩进快照）
+        journal_count = min(len(records), args.journal_records)
+        snapshot_records = records[:len(records) - journal_count]
+        submissions_json = os.path.join(evaluation_dir, 'submissions.json')
+        _write_json(submissions_json, {'submissions': snapshot_records})
+        if journal_count:
+            with open(journal_path_for(submissions_json), 'w', encoding='utf-8') as f:
+                for record in records[len(records) - journal_count:]:
+                    f.write(json.dumps({'op': 'add', 'record': record}, ensure_ascii=False) + '\n')
+
+    def _write_env(self):
+        """复制仓库 .env 并覆盖目录、队列库与执行后端，供 http_load 以 ENV_FILE 启动服务。"""
+        overrides = {
+            'BASE_DIR': self.base_dir,
+            'UPLOAD_FOLDER': os.path.join(self.out_dir, 'uploads'),
+            'QUEUE_DB_PATH': os.path.join(self.out_dir, 'task_queue.db'),
+            'EXECUTOR_BACKEND': 'fake',
+            'EVAL_CONCURRENCY': str(self.args.eval_concurrency),
+        }
+        lines = []
+        repo_env = os.path.join(REPO_ROOT, '.env')
+        if os.path.exists(repo_env):
+            with open(repo_env, 'r', encoding='utf-8') as f:
+                for line in f.read().splitlines():
+                    key = line.split('=', 1)[0].strip()
+                    if key not in overrides:
+                        lines.append(line)
+        lines.append('\n# ==================== 基准测试覆盖 ====================')
+        lines.extend(f'{key}={value}' for key, value in overrides.items())
+        os.makedirs(overrides['UPLOAD_FOLDER'], exist_ok=True)
+        _write_text(os.path.join(self.out_dir, 'bench.env'), '\n'.join(lines) + '\n')
+
+    def run(self):
+        args = self.args
+        started = time.monotonic()
+        os.makedirs(self.base_dir, exist_ok=True)
+        counts = _zipf_counts(self.rng, args.submissions, args.contests, args.zipf)
+        legacy_count = int(round(args.contests * args.legacy_fraction))
+        layouts = [LAYOUT_LEGACY] * legacy_count + [LAYOUT_CURRENT] * (args.contests - legacy_count)
+        self.rng.shuffle(layouts)
+
+        contests = []
+        for index, (layout, count) in enumerate(zip(layouts, counts)):
+            contest_id = f'BENCH-{index:04d}'
+            self._generate_contest(contest_id, index, layout, count)
+            contests.append({'id': contest_id, 'layout': layout, 'submissions': count})
+            if (index + 1) % 50 == 0:
+                print(f'[generate] {index + 1}/{args.contests} contests, {self.files_written} files, '
+                      f'{time.monotonic() - started:.1f}s')
+
+        self._write_env()
+        manifest = {
+            'base_dir': self.base_dir,
+            'seed': args.seed,
+            'contests': contests,
+            'participants': self.participants,
+            'total_submissions': sum(counts),
+            'files_written': self.files_written,
+            'generated_seconds': round(time.monotonic() - started, 1),
+        }
+        _write_json(os.path.join(self.out_dir, 'manifest.json'), manifest)
+        print(f"[generate] done: {args.contests} contests ({legacy_count} legacy), {sum(counts)} submissions, "
+              f"{self.files_written} files in {manifest['generated_seconds']}s -> {self.out_dir}")
+        return manifest
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='生成基准测试用的 BASE_DIR 数据树')
+    parser.add_argument('--out', required=True, help='输出目录（生成 projects/、bench.env、manifest.json）')
+    parser.add_argument('--contests', type=int, default=500)
+    parser.add_argument('--submissions', type=int, default=100000)
+    parser.add_argument('--participants', type=int, default=2000)
+    parser.add_argument('--legacy-fraction', type=float, default=0.1, help='使用旧版按参赛者分目录布局的评测比例')
+    parser.add_argument('--unupgraded-fraction', type=float, default=0.2,
+                        help='缺少 score/indicators 等字段（升级前完成）的提交比例')
+    parser.add_argument('--journal-records', type=int, default=20, help='每个评测只写在追加日志中的最近提交数')
+    parser.add_argument('--zipf', type=float, default=1.0, help='提交在评测间分布的 Zipf 指数')
+    parser.add_argument('--log-bytes', type=int, default=4096, help='每个参赛者日志的大小（字节）')
+    parser.add_argument('--result-items', type=int, default=50, help='参赛者 results.json 中的预测条数')
+    parser.add_argument('--eval-concurrency', type=int, default=4, help='写入 bench.env 的 EVAL_CONCURRENCY')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--force', action='store_true', help='输出目录已存在时先删除')
+    args = parser.parse_args(argv)
+
+    if os.path.exists(args.out) and os.listdir(args.out):
+        if not args.force:
+            parser.error(f'{args.out} 已存在且非空，使用 --force 覆盖')
+        shutil.rmtree(args.out)
+    return DataGenerator(args.out, args).run()
+
+
+if __name__ == '__main__':
+    main()
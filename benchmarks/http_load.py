@@ -0,0 +1,311 @@
+"""
+端到端 HTTP 压测
+
+以 generate_data 生成的数据目录启动服务（benchmarks.serve，ENV_FILE 指向 bench.env，执行后端为 fake），
+按场景依次用多个并发客户端请求各接口，每个场景统计：
+- 请求数、错误数（非 2xx 或连接异常）、吞吐（请求/秒）、响应字节数
+- 延迟 p50/p95/p99/最大值/均值，以及预热阶段第一个请求的冷启动延迟
+- 场景执行期间服务进程的峰值 RSS（Linux 下读取 /proc，其他平台为 null）
+
+结果以 JSON 写出（--output），可用 --baseline 与之前的报告对比 p95/p99/吞吐/峰值 RSS。
+
+用法：
+    python -m benchmarks.generate_data --out /tmp/bench
+    python -m benchmarks.http_load --data-dir /tmp/bench --output report.json
+    python -m benchmarks.http_load --data-dir /tmp/bench --baseline report.json --fail-on-regression
+    python -m benchmarks.http_load --data-dir /tmp/bench --url http://127.0.0.1:5000 --server-pid 1234
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tarfile
+import threading
+import time
+
+import requests
+
+from benchmarks.common import (
+    REPO_ROOT, REPORT_VERSION, RssSampler, compare_results, latency_summary, load_report, mb, print_comparison,
+    read_rss_bytes, write_report
+)
+
+# 对比时检查的指标：True 表示越大越好
+COMPARE_METRICS = {'p95_ms': False, 'p99_ms': False, 'throughput_rps': True, 'peak_rss_mb': False}
+
+
+class LoadContext:
+    """场景构造请求所需的数据（来自 manifest.json）。"""
+
+    def __init__(self, manifest, submit_bytes):
+        self.contests = manifest['contests']
+        self.current = [c for c in self.contests if c['layout'] == 'current'] or self.contests
+        self.participants = manifest.get('participants') or ['default']
+        # 提交数最多的评测，单独压测最坏情况
+        self.largest = max(self.contests, key=lambda c: c['submissions'])
+        self.submit_payload = self._make_tar(submit_bytes)
+
+    @staticmethod
+    def _make_tar(size):
+        buffer = io.BytesIO()
+        data = os.urandom(size)
+        with tarfile.open(fileobj=buffer, mode='w') as tar:
+            info = tarfile.TarInfo('layer.tar')
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+        return buffer.getvalue()
+
+
+def _health(ctx, rng):
+    return 'GET', '/health', {}
+
+
+def _metrics(ctx, rng):
+    return 'GET', '/metrics', {}
+
+
+def _contests(ctx, rng):
+    return 'GET', '/api/contests', {}
+
+
+def _submissions_full(ctx, rng):
+    # 不带 page 参数：旧版完整列表（包含日志与结果），覆盖当前布局与旧版布局
+    return 'GET', f"/api/contests/{rng.choice(ctx.contests)['id']}/submissions", {}
+
+
+def _submissions_full_largest(ctx, rng):
+    return 'GET', f"/api/contests/{ctx.largest['id']}/submissions", {}
+
+
+def _submissions_page(ctx, rng):
+    contest = rng.choice(ctx.contests)
+    params = {'page': rng.randint(1, 3), 'page_size': 20, 'sort': rng.choice(['time', 'score'])}
+    return 'GET', f"/api/contests/{contest['id']}/submissions", {'params': params}
+
+
+def _leaderboard(ctx, rng):
+    return 'GET', f"/api/contests/{rng.choice(ctx.contests)['id']}/leaderboard", {}
+
+
+def _submit(ctx, rng):
+    contest = rng.choice(ctx.current)
+    return 'POST', '/submit', {
+        'data': {'unique_id': contest['id'], 'participant_id': rng.choice(ctx.participants)},
+        'files': {'file': ('image.tar', ctx.submit_payload, 'application/x-tar')},
+    }
+
+
+# 场景名 -> 请求构造函数；默认按此顺序执行（写入类场景放在最后，避免影响读场景的数据）
+SCENARIOS = {
+    'health': _health,
+    'metrics': _metrics,
+    'contests': _contests,
+    'submissions_page': _submissions_page,
+    'leaderboard': _leaderboard,
+    'submissions_full': _submissions_full,
+    'submissions_full_largest': _submissions_full_largest,
+    'submit': _submit,
+}
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(data_dir, port):
+    """以 bench.env 启动服务子进程，服务日志写入数据目录下的 server.log。"""
+    env = dict(os.environ)
+    env['ENV_FILE'] = os.path.join(data_dir, 'bench.env')
+    env['PYTHONPATH'] = REPO_ROOT + os.pathsep + env.get('PYTHONPATH', '')
+    log = open(os.path.join(data_dir, 'server.log'), 'ab')
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'benchmarks.serve', '--port', str(port)],
+        cwd=data_dir, env=env, stdout=log, stderr=subprocess.STDOUT
+    )
+    log.close()
+    return process
+
+
+def wait_ready(url, process=None, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process is not None and process.poll() is not None:
+            raise RuntimeError(f'服务进程已退出（exit {process.returncode}），详见 server.log')
+        try:
+            if requests.get(url + '/health', timeout=2).status_code == 200:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f'服务在 {timeout} 秒内未就绪: {url}')
+
+
+def run_scenario(base_url, ctx, build, concurrency, duration, max_requests, warmup, seed, server_pid):
+    def request(session, rng):
+        method, path, kwargs = build(ctx, rng)
+        start = time.perf_counter()
+        try:
+            response = session.request(method, base_url + path, timeout=300, **kwargs)
+            size = len(response.content)
+            status = response.status_code
+        except requests.RequestException:
+            size = 0
+            status = 'error'
+        return time.perf_counter() - start, status, size
+
+    # 预热（单客户端）：第一个请求的延迟即冷启动延迟（目录缓存、排行榜构建、字段回填等）
+    cold = None
+    with requests.Session() as session:
+        rng = random.Random(seed)
+        for i in range(warmup):
+            latency, _, _ = request(session, rng)
+            if i == 0:
+                cold = latency
+
+    lock = threading.Lock()
+    issued = [0]
+    samples = []
+    deadline = time.monotonic() + duration
+
+    def client(index):
+        rng = random.Random(seed * 1000 + index)
+        local = []
+        with requests.Session() as session:
+            while time.monotonic() < deadline:
+                if max_requests:
+                    with lock:
+                        if issued[0] >= max_requests:
+                            break
+                        issued[0] += 1
+                local.append(request(session, rng))
+        with lock:
+            samples.extend(local)
+
+    rss_before = read_rss_bytes(server_pid) if server_pid else None
+    with (RssSampler(server_pid) if server_pid else contextlib.nullcontext()) as sampler:
+        started = time.monotonic()
+        threads = [threading.Thread(target=client, args=(i,), daemon=True) for i in range(concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.monotonic() - started
+
+    status_codes = {}
+    for _, status, _ in samples:
+        status_codes[str(status)] = status_codes.get(str(status), 0) + 1
+    errors = sum(1 for _, status, _ in samples if status == 'error' or not 200 <= status < 300)
+    result = {
+        'requests': len(samples),
+        'errors': errors,
+        'status_codes': status_codes,
+        'seconds': round(elapsed, 3),
+        'throughput_rps': round(len(samples) / elapsed, 2) if elapsed > 0 else None,
+        'bytes_per_request': round(sum(s for _, _, s in samples) / len(samples)) if samples else None,
+        'cold_ms': round(cold * 1000, 3) if cold is not None else None,
+        'rss_before_mb': mb(rss_before),
+        'peak_rss_mb': mb(sampler.peak) if sampler else None,
+    }
+    result.update(latency_summary([latency for latency, _, _ in samples]))
+    return result
+
+
+def print_results(results):
+    print(f"\n{'场景':<26}{'请求':>8}{'错误':>7}{'rps':>10}{'p50':>10}{'p95':>10}{'p99':>10}{'冷启动':>10}{'峰值RSS':>10}")
+    for name, r in results.items():
+        def fmt(value):
+            return f'{value:.1f}' if isinstance(value, (int, float)) else '-'
+        print(f"{name:<26}{r['requests']:>8}{r['errors']:>7}{fmt(r['throughput_rps']):>10}{fmt(r['p50_ms']):>10}"
+              f"{fmt(r['p95_ms']):>10}{fmt(r['p99_ms']):>10}{fmt(r['cold_ms']):>10}{fmt(r['peak_rss_mb']):>10}")
+    print('（延迟单位 ms，RSS 单位 MB）')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='端到端 HTTP 压测')
+    parser.add_argument('--data-dir', required=True, help='generate_data 的输出目录')
+    parser.add_argument('--url', help='压测已运行的服务（不再启动子进程）')
+    parser.add_argument('--server-pid', type=int, help='配合 --url 指定服务进程 PID 以采样 RSS')
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS), help=f"逗号分隔，可选: {','.join(SCENARIOS)}")
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=10, help='每个场景的持续时间（秒）')
+    parser.add_argument('--requests', type=int, default=0, help='每个场景的最大请求数（0 表示只按时间）')
+    parser.add_argument('--warmup', type=int, default=5, help='每个场景正式计时前的预热请求数')
+    parser.add_argument('--submit-bytes', type=int, default=64 * 1024, help='submit 场景上传的镜像大小（字节）')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='JSON 报告输出路径')
+    parser.add_argument('--baseline', help='与之前的 JSON 报告对比')
+    parser.add_argument('--tolerance', type=float, default=0.10, help='对比时允许的相对退化比例')
+    parser.add_argument('--fail-on-regression', action='store_true', help='存在超出容差的退化时以退出码 1 结束')
+    args = parser.parse_args(argv)
+
+    names = [n.strip() for n in args.scenarios.split(',') if n.strip()]
+    unknown = [n for n in names if n not in SCENARIOS]
+    if unknown:
+        parser.error(f"未知场景: {', '.join(unknown)}")
+
+    data_dir = os.path.abspath(args.data_dir)
+    with open(os.path.join(data_dir, 'manifest.json'), 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+    ctx = LoadContext(manifest, args.submit_bytes)
+
+    process = None
+    if args.url:
+        base_url = args.url.rstrip('/')
+        server_pid = args.server_pid
+    else:
+        port = _free_port()
+        base_url = f'http://127.0.0.1:{port}'
+        process = start_server(data_dir, port)
+        server_pid = process.pid
+
+    results = {}
+    try:
+        wait_ready(base_url, process)
+        for name in names:
+            print(f'[http_load] {name} ...', flush=True)
+            results[name] = run_scenario(base_url, ctx, SCENARIOS[name], args.concurrency, args.duration,
+                                         args.requests, args.warmup, args.seed, server_pid)
+    finally:
+        if process is not None:
+            process.terminate()
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+    print_results(results)
+    report = {
+        'benchmark': 'http_load',
+        'version': REPORT_VERSION,
+        'config': {
+            'concurrency': args.concurrency,
+            'duration': args.duration,
+            'requests': args.requests,
+            'warmup': args.warmup,
+            'submit_bytes': args.submit_bytes,
+            'contests': len(manifest['contests']),
+            'submissions': manifest.get('total_submissions'),
+        },
+        'results': results,
+    }
+    if args.output:
+        report = write_report(args.output, report)
+        print(f'[http_load] 报告已写入 {args.output}')
+
+    if args.baseline:
+        rows, regressions = compare_results(load_report(args.baseline), report, COMPARE_METRICS, args.tolerance)
+        print_comparison(rows, regressions)
+        if regressions and args.fail_on_regression:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,161 @@
+"""
+本地构造 docker save 格式的合成镜像 tar（不访问镜像仓库）
+
+镜像由若干随机内容的数据层组成，manifest.json、镜像配置与各层 diff_id 都按 docker save 的格式生成，
+可直接被 image_loader（含分层感知加载）与 docker load 接受：
+- 不指定 base_tar 时是 FROM scratch 的纯数据镜像，只能用于 fake 执行后端
+- 指定 base_tar（例如 `docker save busybox -o busybox.tar`）时在其层之上追加数据层并覆盖 Cmd，
+  可在 Docker 执行后端中真正运行
+"""
+
+import hashlib
+import io
+import json
+import os
+import posixpath
+import tarfile
+import tempfile
+
+# 单个数据文件的最大大小，数据层按此拆分为多个文件
+MAX_BLOB_BYTES = 16 * 1024 * 1024
+WRITE_CHUNK = 1024 * 1024
+
+
+class _HashingWriter:
+    def __init__(self, f):
+        self.f = f
+        self.sha256 = hashlib.sha256()
+
+    def write(self, data):
+        self.sha256.update(data)
+        return self.f.write(data)
+
+
+def _write_layer(path, size, rng_bytes, prefix):
+    """写一个数据层 tar，返回 diff_id（未压缩层 tar 的 sha256）。"""
+    with open(path, 'wb') as raw:
+        writer = _HashingWriter(raw)
+        with tarfile.open(fileobj=writer, mode='w|', format=tarfile.PAX_FORMAT) as tar:
+            remaining = size
+            index = 0
+            while remaining > 0 or index == 0:
+                blob_size = min(remaining, MAX_BLOB_BYTES)
+                info = tarfile.TarInfo(f'{prefix}/blob_{index:04d}.bin')
+                info.size = blob_size
+                info.mode = 0o644
+                tar.addfile(info, _RandomReader(blob_size, rng_bytes))
+                remaining -= blob_size
+                index += 1
+        return 'sha256:' + writer.sha256.hexdigest()
+
+
+class _RandomReader(io.RawIOBase):
+    """按需生成随机字节的只读流（避免把整个数据文件放进内存）。"""
+
+    def __init__(self, size, rng_bytes):
+        self.remaining = size
+        self.rng_bytes = rng_bytes
+
+    def readable(self):
+        return True
+
+    def read(self, n=-1):
+        if n is None or n < 0:
+            n = self.remaining
+        n = min(n, self.remaining, WRITE_CHUNK)
+        self.remaining -= n
+        return self.rng_bytes(n) if n else b''
+
+
+def _read_base(base_tar):
+    """读取基础镜像的 manifest 条目、配置与全部成员（成员数据保留在 tar 中，按需复制）。"""
+    with tarfile.open(base_tar, 'r:*') as tar:
+        manifest = json.load(tar.extractfile('manifest.json'))
+        if len(manifest) != 1:
+            raise ValueError(f'基础镜像 tar 中必须只有一个镜像: {base_tar}')
+        entry = manifest[0]
+        config = json.load(tar.extractfile(entry['Config']))
+    return entry, config
+
+
+def build_image_tar(path, size, layers=1, base_tar=None, cmd=None, compress=False, rng_bytes=os.urandom,
+                    label=None):
+    """
+    构造合成镜像 tar
+
+    Args:
+        path: 输出路径
+        size: 数据层总大小（字节），平均分到 layers 个层
+        base_tar: 可选的基础镜像 tar（docker save 格式）
+        cmd: 覆盖镜像的 Cmd（列表）
+        compress: 是否整体 gzip（对应 .tar.gz 上传）
+        label: 写入镜像配置的标签，改变它即可得到镜像 ID 不同但数据层相同的镜像
+
+    Returns:
+        dict：image_id、diff_ids、file_bytes
+    """
+    if base_tar:
+        base_entry, config = _read_base(base_tar)
+        base_layers = [posixpath.normpath(p) for p in base_entry['Layers']]
+    else:
+        base_entry, base_layers = None, []
+        config = {
+            'architecture': 'amd64',
+            'os': 'linux',
+            'config': {'Env': ['PATH=/usr/local/sbin:/usr/local/bin:/usr/sbin:/usr/bin:/sbin:/bin']},
+            'rootfs': {'type': 'layers', 'diff_ids': []},
+            'history': [],
+        }
+
+    container_config = config.setdefault('config', {}) or {}
+    config['config'] = container_config
+    if cmd is not None:
+        container_config['Cmd'] = list(cmd)
+        container_config['Entrypoint'] = None
+    if label is not None:
+        container_config['Labels'] = dict(container_config.get('Labels') or {}, benchmark=str(label))
+
+    with tempfile.TemporaryDirectory(dir=os.path.dirname(os.path.abspath(path))) as tmp:
+        layer_files = []
+        per_layer = size // max(1, layers)
+        for i in range(max(1, layers)):
+            layer_size = per_layer if i < layers - 1 else size - per_layer * (layers - 1)
+            layer_path = os.path.join(tmp, f'layer_{i}.tar')
+            diff_id = _write_layer(layer_path, layer_size, rng_bytes, f'benchmark/layer_{i}')
+            layer_files.append((f'{diff_id.split(":", 1)[1]}/layer.tar', layer_path))
+            config['rootfs'].setdefault('diff_ids', []).append(diff_id)
+            if 'history' in config:
+                config['history'].append({'created_by': f'benchmark data layer {i}'})
+
+        raw_config = json.dumps(config, separators=(',', ':')).encode('utf-8')
+        config_digest = hashlib.sha256(raw_config).hexdigest()
+        manifest = [{
+            'Config': f'{config_digest}.json',
+            'RepoTags': None,
+            'Layers': base_layers + [name for name, _ in layer_files],
+        }]
+
+        def add_bytes(tar, name, data):
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            info.mode = 0o644
+            tar.addfile(info, io.BytesIO(data))
+
+        with tarfile.open(path, 'w:gz' if compress else 'w', format=tarfile.PAX_FORMAT) as out:
+            if base_tar:
+                skip = {'manifest.json', 'repositories', posixpath.normpath(base_entry['Config'])}
+                with tarfile.open(base_tar, 'r:*') as base:
+                    for member in base:
+                        if posixpath.normpath(member.name) in skip:
+                            continue
+                        out.addfile(member, base.extractfile(member) if member.isfile() else None)
+            for name, layer_path in layer_files:
+                out.add(layer_path, arcname=name)
+            add_bytes(out, f'{config_digest}.json', raw_config)
+            add_bytes(out, 'manifest.json', json.dumps(manifest).encode('utf-8'))
+
+    return {
+        'image_id': f'sha256:{config_digest}',
+        'diff_ids': config['rootfs']['diff_ids'],
+        'file_bytes': os.path.getsize(path),
+    }
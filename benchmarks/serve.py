@@ -0,0 +1,29 @@
+"""
+基准测试用的服务进程：与 app.py 的 __main__ 相同，启动队列处理线程后运行 Flask 服务
+
+由 http_load 以 ENV_FILE=<生成目录>/bench.env 启动，也可以手动运行：
+    ENV_FILE=/tmp/bench/bench.env python -m benchmarks.serve --port 5055
+"""
+
+import argparse
+import threading
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='运行基准测试服务')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5055)
+    args = parser.parse_args(argv)
+
+    from app import app
+    from config import BASE_DIR
+    from contest_provisioning import provisioner
+    from queue_runner import run_queue_worker
+
+    threading.Thread(target=run_queue_worker, daemon=True).start()
+    provisioner.resume_unfinished(BASE_DIR)
+    app.run(debug=False, host=args.host, port=args.port, threaded=True)
+
+
+if __name__ == '__main__':
+    main()
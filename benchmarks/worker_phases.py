@@ -0,0 +1,267 @@
+"""
+run_worker 分阶段微基准
+
+在本地构造小/中/大三档合成镜像 tar（benchmarks.image_tars，不访问镜像仓库），反复执行
+run_worker 的参赛者与主办方流程，统计每个阶段的耗时分布：
+- tar_read：单独按块读取一遍镜像 tar（含 gzip 解压），衡量磁盘与解压开销
+- image_load / container_create / container_start / participant_run / log_drain /
+  organizer_image / organizer_run / cleanup / result_validation / log_close / total：
+  来自 run_worker 返回的 phases（worker.PhaseTimer）
+每个阶段报告均值、标准差、变异系数、最小值、p50/p95/p99 与最大值（毫秒）。
+
+执行后端：
+- fake（默认）：不需要 Docker，衡量平台自身的开销（tar 读取、日志、资源采样、结果校验等）
+- docker：需要 --base-tar 提供一个带 sh 的基础镜像（例如 `docker save busybox -o busybox.tar`），
+  合成数据层追加在其上，参赛者容器输出 --log-lines 行日志并写 results.json，主办方容器写评分
+
+--cache-mode cold（默认）每次迭代重新生成随机数据层，镜像加载需要传输全部数据；
+warm 复用数据层、只改变镜像标签，衡量分层感知加载跳过已有层时的开销。
+
+用法：
+    python -m benchmarks.worker_phases --iterations 5 --output worker.json
+    python -m benchmarks.worker_phases --backend docker --base-tar busybox.tar --sizes small,medium
+    python -m benchmarks.worker_phases --baseline worker.json --fail-on-regression
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+from benchmarks.common import (
+    REPORT_VERSION, compare_results, latency_summary, load_report, print_comparison, write_report
+)
+from benchmarks.image_tars import build_image_tar
+
+# 镜像数据层大小档位（字节），可用 name=MB 自定义
+SIZE_PRESETS = {
+    'small': 4 * 1024 * 1024,
+    'medium': 64 * 1024 * 1024,
+    'large': 512 * 1024 * 1024,
+}
+
+# 对比时检查的指标：True 表示越大越好
+COMPARE_METRICS = {'p50_ms': False, 'p95_ms': False}
+
+ORGANIZER_RESULTS = '{"indicator":[{"key":"score","name":"score","value":0.5}]}'
+
+
+def parse_sizes(value):
+    sizes = {}
+    for item in value.split(','):
+        item = item.strip()
+        if not item:
+            continue
+        if '=' in item:
+            name, size_mb = item.split('=', 1)
+            sizes[name.strip()] = int(float(size_mb) * 1024 * 1024)
+        elif item in SIZE_PRESETS:
+            sizes[item] = SIZE_PRESETS[item]
+        else:
+            raise ValueError(f'未知的镜像档位: {item}（可选 {", ".join(SIZE_PRESETS)} 或 name=MB）')
+    return sizes
+
+
+def participant_cmd(log_lines):
+    script = (f'i=0; while [ $i -lt {log_lines} ]; do echo "benchmark log line $i"; i=$((i+1)); done; '
+              f'echo \'{{"predictions":[0.1,0.2,0.3]}}\' > /output/results.json')
+    return ['sh', '-c', script]
+
+
+def organizer_cmd():
+    return ['sh', '-c', f"echo 'scoring'; echo '{ORGANIZER_RESULTS}' > /output/results.json"]
+
+
+def prepare_contest(root, args):
+    """生成评测目录：info.json、主办方镜像、dataset/source 与 dataset/result。"""
+    contest_dir = os.path.join(root, 'BENCH-WORKER')
+    info_dir = os.path.join(contest_dir, 'info')
+    for name in ('source', 'result'):
+        dataset_dir = os.path.join(info_dir, 'dataset', name)
+        os.makedirs(dataset_dir, exist_ok=True)
+        with open(os.path.join(dataset_dir, 'data.csv'), 'w', encoding='utf-8') as f:
+            f.write('id,value\n' + ''.join(f'{i},{i * 0.5}\n' for i in range(1000)))
+    build_image_tar(os.path.join(info_dir, 'organizer.tar'), 1024 * 1024, base_tar=args.base_tar,
+                    cmd=organizer_cmd() if args.base_tar else None, label='organizer')
+    with open(os.path.join(info_dir, 'info.json'), 'w', encoding='utf-8') as f:
+        json.dump({'title': 'worker benchmark', 'image': 'organizer.tar', 'status': 'ready'}, f)
+    return contest_dir
+
+
+def make_executor(args):
+    from executors import create_executor, set_executor
+    if args.backend == 'fake':
+        from executors.fake import FakeExecutor
+        executor = FakeExecutor(load_seconds=0, run_seconds=args.run_seconds, jitter=0, failure_rate=0)
+    else:
+        executor = create_executor(args.backend)
+    set_executor(executor)
+    return executor
+
+
+def time_tar_read(path):
+    from image_loader import iter_image_tar
+    start = time.monotonic()
+    for _ in iter_image_tar(path):
+        pass
+    return time.monotonic() - start
+
+
+def _seeded_bytes(seed):
+    """确定性的伪随机字节流（warm 模式下每次迭代生成相同的数据层）。"""
+    state = {'counter': 0}
+
+    def rng_bytes(n):
+        out = bytearray()
+        while len(out) < n:
+            out += hashlib.sha256(seed + state['counter'].to_bytes(8, 'little')).digest() * 1024
+            state['counter'] += 1
+        return bytes(out[:n])
+
+    return rng_bytes
+
+
+def run_size(root, contest_dir, size_name, size, args):
+    from worker import run_worker
+
+    size_dir = os.path.join(root, size_name)
+    os.makedirs(size_dir, exist_ok=True)
+    suffix = '.tar.gz' if args.compress else '.tar'
+    cmd = participant_cmd(args.log_lines) if args.base_tar else None
+    phases = {}
+    failures = 0
+    file_bytes = None
+
+    shared_seed = None
+    if args.cache_mode == 'warm':
+        # 数据层内容固定：每次迭代只改变镜像标签，daemon 中已有的层会被跳过
+        shared_seed = os.urandom(32)
+
+    total = args.warmup + args.iterations
+    for iteration in range(total):
+        tar_path = os.path.join(size_dir, f'participant_{iteration}{suffix}')
+        rng_bytes = os.urandom
+        if shared_seed is not None:
+            rng_bytes = _seeded_bytes(shared_seed)
+        info = build_image_tar(tar_path, size, layers=args.layers, base_tar=args.base_tar, cmd=cmd,
+                               compress=args.compress, rng_bytes=rng_bytes, label=f'{size_name}-{iteration}')
+        file_bytes = info['file_bytes']
+
+        submission_dir = os.path.join(size_dir, f'submission_{iteration}')
+        os.makedirs(submission_dir)
+        tar_read = time_tar_read(tar_path)
+        result = run_worker(tar_path, os.path.join(submission_dir, 'output'), contest_dir=contest_dir,
+                            participant_id='benchmark', log_dir=submission_dir)
+        if result.get('code') != 0 or not isinstance(result.get('organizer_results'), dict):
+            failures += 1
+            print(f"[worker_phases] {size_name} #{iteration} 失败: code={result.get('code')} {result.get('desc')}",
+                  file=sys.stderr)
+
+        if iteration >= args.warmup:
+            phases.setdefault('tar_read', []).append(tar_read)
+            for name, seconds in (result.get('phases') or {}).items():
+                phases.setdefault(name, []).append(seconds)
+        print(f"[worker_phases] {size_name} #{iteration}{' (warmup)' if iteration < args.warmup else ''}: "
+              f"total {result.get('phases', {}).get('total', 0):.3f}s", flush=True)
+
+        os.remove(tar_path)
+        shutil.rmtree(submission_dir, ignore_errors=True)
+
+    results = {}
+    for name, values in phases.items():
+        summary = latency_summary(values)
+        summary['min_ms'] = round(min(values) * 1000, 3)
+        summary['stdev_ms'] = round(statistics.stdev(values) * 1000, 3) if len(values) > 1 else 0.0
+        summary['cv'] = round(summary['stdev_ms'] / summary['mean_ms'], 4) if summary['mean_ms'] else None
+        results[f'{size_name}.{name}'] = summary
+    return results, {'size_bytes': size, 'file_bytes': file_bytes, 'failures': failures}
+
+
+def print_results(results):
+    print(f"\n{'阶段':<34}{'mean':>10}{'stdev':>10}{'cv':>8}{'min':>10}{'p50':>10}{'p95':>10}{'max':>10}")
+    for name, r in results.items():
+        print(f"{name:<34}{r['mean_ms']:>10.1f}{r['stdev_ms']:>10.1f}{(r['cv'] or 0):>8.2f}{r['min_ms']:>10.1f}"
+              f"{r['p50_ms']:>10.1f}{r['p95_ms']:>10.1f}{r['max_ms']:>10.1f}")
+    print('（单位 ms）')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='run_worker 分阶段微基准')
+    parser.add_argument('--backend', choices=['fake', 'docker'], default='fake')
+    parser.add_argument('--base-tar', help='docker 后端使用的基础镜像 tar（docker save 格式，需包含 sh）')
+    parser.add_argument('--sizes', default='small,medium,large', help='镜像档位：small,medium,large 或 name=MB')
+    parser.add_argument('--layers', type=int, default=3, help='数据层数量')
+    parser.add_argument('--compress', action='store_true', help='生成 .tar.gz 镜像')
+    parser.add_argument('--cache-mode', choices=['cold', 'warm'], default='cold')
+    parser.add_argument('--iterations', type=int, default=5)
+    parser.add_argument('--warmup', type=int, default=1)
+    parser.add_argument('--log-lines', type=int, default=1000, help='docker 后端参赛者容器输出的日志行数')
+    parser.add_argument('--run-seconds', type=float, default=0.1, help='fake 后端容器运行时间（秒）')
+    parser.add_argument('--work-dir', help='工作目录（默认临时目录，结束后删除）')
+    parser.add_argument('--output', help='JSON 报告输出路径')
+    parser.add_argument('--baseline', help='与之前的 JSON 报告对比')
+    parser.add_argument('--tolerance', type=float, default=0.15, help='对比时允许的相对退化比例')
+    parser.add_argument('--fail-on-regression', action='store_true', help='存在超出容差的退化时以退出码 1 结束')
+    args = parser.parse_args(argv)
+
+    try:
+        sizes = parse_sizes(args.sizes)
+    except ValueError as e:
+        parser.error(str(e))
+    if args.backend == 'docker' and not args.base_tar:
+        parser.error('docker 后端需要 --base-tar 提供可运行的基础镜像')
+    if args.iterations < 1:
+        parser.error('--iterations 至少为 1')
+
+    root = os.path.abspath(args.work_dir) if args.work_dir else tempfile.mkdtemp(prefix='worker-bench-')
+    os.makedirs(root, exist_ok=True)
+    executor = make_executor(args)
+    results = {}
+    sizes_info = {}
+    try:
+        contest_dir = prepare_contest(root, args)
+        for size_name, size in sizes.items():
+            size_results, sizes_info[size_name] = run_size(root, contest_dir, size_name, size, args)
+            results.update(size_results)
+        try:
+            executor.evict_contest(os.path.basename(contest_dir), contest_dir)
+        except Exception as e:
+            print(f'[worker_phases] 清理主办方镜像失败: {e}', file=sys.stderr)
+    finally:
+        if not args.work_dir:
+            shutil.rmtree(root, ignore_errors=True)
+
+    print_results(results)
+    report = {
+        'benchmark': 'worker_phases',
+        'version': REPORT_VERSION,
+        'config': {
+            'backend': args.backend,
+            'base_tar': os.path.basename(args.base_tar) if args.base_tar else None,
+            'layers': args.layers,
+            'compress': args.compress,
+            'cache_mode': args.cache_mode,
+            'iterations': args.iterations,
+            'warmup': args.warmup,
+            'sizes': sizes_info,
+        },
+        'results': results,
+    }
+    if args.output:
+        report = write_report(args.output, report)
+        print(f'[worker_phases] 报告已写入 {args.output}')
+
+    if args.baseline:
+        rows, regressions = compare_results(load_report(args.baseline), report, COMPARE_METRICS, args.tolerance)
+        print_comparison(rows, regressions)
+        if regressions and args.fail_on_regression:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
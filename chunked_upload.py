@@ -0,0 +1,268 @@
+"""
+可续传的分块上传
+
+大镜像（数 GB）不再通过单个 multipart 请求上传：
+1. init：声明文件名与大小，立即按扩展名校验大小上限与磁盘空间，返回 upload_id
+2. chunk：按偏移追加原始字节（PUT，请求体即数据），偏移必须等于服务端已接收的字节数
+3. status：查询已接收的字节数，连接中断后从该偏移继续上传
+4. finalize：校验大小（可选校验客户端提供的 sha256），标记完成
+完成的上传通过 upload_id 交给 /submit 或 /create，文件以 rename 的方式移动到最终位置，不再复制。
+
+数据边接收边计算 sha256，并在移动后写入与 image_cache.file_sha256 相同格式的 `.sha256` 缓存，
+主办方镜像缓存无需再次读取整个文件计算哈希。
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+
+from config import UPLOAD_FOLDER, TAR_MAX_SIZE, ZIP_MAX_SIZE, UPLOAD_CHUNK_SIZE, UPLOAD_SESSION_TTL
+from image_cache import write_sha256_sidecar
+from utils import allowed_tar_file, allowed_zip_file, is_disk_space_sufficient
+
+SESSIONS_DIR = os.path.join(UPLOAD_FOLDER, 'chunked')
+# 从请求体读取并写盘的块大小
+STREAM_BLOCK_SIZE = 1024 * 1024
+
+
+class UploadError(Exception):
+    """分块上传错误，status 为对应的 HTTP 状态码"""
+
+    def __init__(self, message, status=400, **details):
+        super().__init__(message)
+        self.status = status
+        self.details = details
+
+
+def _max_size_for(filename):
+    if allowed_tar_file(filename):
+        return TAR_MAX_SIZE
+    if allowed_zip_file(filename):
+        return ZIP_MAX_SIZE
+    return None
+
+
+class UploadSession:
+    """单个上传会话：元数据（meta.json）+ 数据文件（data.part）+ 增量 sha256。"""
+
+    def __init__(self, upload_id, meta):
+        self.upload_id = upload_id
+        self.meta = meta
+        self.dir = os.path.join(SESSIONS_DIR, upload_id)
+        self.data_path = os.path.join(self.dir, 'data.part')
+        self.lock = threading.Lock()
+        self._hasher = None
+        self._hashed = 0
+        # 已被 claim 移走数据文件（会话目录随后删除）
+        self.claimed = False
+
+    @property
+    def offset(self):
+        try:
+            return os.path.getsize(self.data_path)
+        except OSError:
+            return 0
+
+    def _save_meta(self):
+        tmp_path = os.path.join(self.dir, 'meta.json.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.meta, f, ensure_ascii=False)
+        os.replace(tmp_path, os.path.join(self.dir, 'meta.json'))
+
+    def _sync_hasher(self):
+        """哈希状态与磁盘数据对齐（进程重启后或上次写入中断时，从文件补算）。"""
+        size = self.offset
+        if self._hasher is None or self._hashed > size:
+            self._hasher = hashlib.sha256()
+            self._hashed = 0
+        if self._hashed < size:
+            with open(self.data_path, 'rb') as f:
+                f.seek(self._hashed)
+                while self._hashed < size:
+                    block = f.read(min(STREAM_BLOCK_SIZE, size - self._hashed))
+                    if not block:
+                        break
+                    self._hasher.update(block)
+                    self._hashed += len(block)
+
+    def _check_available(self):
+        """会话数据仍在（未被 claim、未被清理），需持有 lock。"""
+        if self.claimed or not os.path.exists(self.data_path):
+            raise UploadError('上传不存在或已过期', 404)
+
+    def status(self):
+        return {
+            'upload_id': self.upload_id,
+            'filename': self.meta['filename'],
+            'size': self.meta['size'],
+            'offset': self.offset,
+            'complete': self.meta.get('complete', False),
+            'sha256': self.meta.get('sha256'),
+            'chunk_size': UPLOAD_CHUNK_SIZE
+        }
+
+    def write_chunk(self, offset, stream, length=None):
+        """
+        从 stream 读取数据追加到 offset 处
+
+        offset 必须等于已接收字节数；连接中断时已写入的部分保留，客户端通过 status 获取新偏移继续上传。
+        """
+        if not self.lock.acquire(blocking=False):
+            raise UploadError('该上传正在写入其他分块', 409, offset=self.offset)
+        try:
+            self._check_available()
+            if self.meta.get('complete'):
+                raise UploadError('上传已完成', 409, offset=self.offset)
+            current = self.offset
+            if offset != current:
+                raise UploadError('分块偏移与已接收字节数不一致', 409, offset=current)
+            remaining = self.meta['size'] - current
+            if length is not None and length > remaining:
+                raise UploadError(f'分块超出声明的文件大小（剩余 {remaining} 字节）', 413, offset=current)
+
+            self._sync_hasher()
+            with open(self.data_path, 'ab') as f:
+                while True:
+                    block = stream.read(STREAM_BLOCK_SIZE)
+                    if not block:
+                        break
+                    if len(block) > remaining:
+                        raise UploadError('数据超出声明的文件大小', 413, offset=self.offset)
+                    f.write(block)
+                    self._hasher.update(block)
+                    self._hashed += len(block)
+                    remaining -= len(block)
+            self.meta['updated_at'] = time.time()
+            self._save_meta()
+            return self.status()
+        finally:
+            self.lock.release()
+
+    def finalize(self, expected_sha256=None):
+        with self.lock:
+            self._check_available()
+            if self.meta.get('complete'):
+                return self.status()
+            received = self.offset
+            if received != self.meta['size']:
+                raise UploadError(f"上传不完整（已接收 {received} / {self.meta['size']} 字节）", 409, offset=received)
+            self._sync_hasher()
+            digest = self._hasher.hexdigest()
+            if expected_sha256 and expected_sha256.lower() != digest:
+                raise UploadError('sha256 校验失败', 422, sha256=digest)
+            self.meta['complete'] = True
+            self.meta['sha256'] = digest
+            self._save_meta()
+            return self.status()
+
+
+class UploadManager:
+    """上传会话管理（会话元数据落盘，进程重启后可继续上传）。"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sessions = {}
+
+    def _sweep_expired(self):
+        """清理超过 UPLOAD_SESSION_TTL 未更新的会话。"""
+        if not os.path.isdir(SESSIONS_DIR):
+            return
+        now = time.time()
+        for upload_id in os.listdir(SESSIONS_DIR):
+            meta_path = os.path.join(SESSIONS_DIR, upload_id, 'meta.json')
+            try:
+                if now - os.path.getmtime(meta_path) < UPLOAD_SESSION_TTL:
+                    continue
+            except OSError:
+                pass
+            with self._lock:
+                self._sessions.pop(upload_id, None)
+            shutil.rmtree(os.path.join(SESSIONS_DIR, upload_id), ignore_errors=True)
+
+    def init(self, filename, size):
+        if not filename:
+            raise UploadError('文件名不能为空')
+        max_size = _max_size_for(filename)
+        if max_size is None:
+            raise UploadError('只支持 .tar / .tar.gz / .zip 文件')
+        if not isinstance(size, int) or size <= 0:
+            raise UploadError('文件大小必须是正整数')
+        if size > max_size:
+            raise UploadError(f'文件过大（最大 {max_size / 1024 / 1024:.1f}MB，当前 {size / 1024 / 1024:.1f}MB）', 413)
+
+        os.makedirs(SESSIONS_DIR, exist_ok=True)
+        self._sweep_expired()
+        # 预留 10GB 余量（与提交/创建接口的磁盘检查一致）
+        sufficient, free = is_disk_space_sufficient(SESSIONS_DIR, size + 10 * 1024 ** 3)
+        if not sufficient:
+            raise UploadError(f'服务器磁盘可用空间不足，当前可用 {free / 1024 / 1024 / 1024:.2f} GB', 507)
+
+        upload_id = uuid.uuid4().hex
+        session = UploadSession(upload_id, {
+            'filename': filename,
+            'size': size,
+            'created_at': time.time(),
+            'updated_at': time.time(),
+            'complete': False
+        })
+        os.makedirs(session.dir)
+        open(session.data_path, 'wb').close()
+        session._save_meta()
+        with self._lock:
+            self._sessions[upload_id] = session
+        return session
+
+    def get(self, upload_id):
+        if not upload_id or not all(c in '0123456789abcdef' for c in upload_id):
+            raise UploadError('非法的 upload_id')
+        with self._lock:
+            session = self._sessions.get(upload_id)
+            if session is not None:
+                return session
+            meta_path = os.path.join(SESSIONS_DIR, upload_id, 'meta.json')
+            try:
+                with open(meta_path, 'r', encoding='utf-8') as f:
+                    meta = json.load(f)
+            except (OSError, ValueError):
+                raise UploadError('上传不存在或已过期', 404)
+            session = self._sessions[upload_id] = UploadSession(upload_id, meta)
+            return session
+
+    def claim(self, upload_id, dest_path, allowed=None):
+        """
+        把已完成的上传移动到 dest_path（同一文件系统内为 rename，不复制数据），会话随之删除
+
+        Args:
+            allowed: 可选的文件名校验函数（如 allowed_tar_file）
+
+        Returns:
+            sha256 十六进制字符串
+        """
+        session = self.get(upload_id)
+        with session.lock:
+            # 重复 claim 或并发的另一个请求已移走数据文件
+            session._check_available()
+            if not session.meta.get('complete'):
+                raise UploadError('上传尚未完成', 409)
+            if allowed is not None and not allowed(session.meta['filename']):
+                raise UploadError(f"不支持的文件类型: {session.meta['filename']}")
+            os.makedirs(os.path.dirname(os.path.abspath(dest_path)), exist_ok=True)
+            shutil.move(session.data_path, dest_path)
+            session.claimed = True
+            digest = session.meta['sha256']
+            write_sha256_sidecar(dest_path, digest)
+        with self._lock:
+            self._sessions.pop(upload_id, None)
+        shutil.rmtree(session.dir, ignore_errors=True)
+        return digest
+
+    def filename(self, upload_id):
+        """上传时声明的原始文件名。"""
+        return self.get(upload_id).meta['filename']
+
+
+upload_manager = UploadManager()
@@ -1,8 +1,8 @@
 import os
 from dotenv import load_dotenv
 
-# 加载 .env 文件
-env_path = os.path.join(os.path.dirname(__file__), '.env')
+# 加载 .env 文件（ENV_FILE 环境变量可指定其他配置文件，例如基准测试生成的配置）
+env_path = os.getenv('ENV_FILE') or os.path.join(os.path.dirname(__file__), '.env')
 load_dotenv(env_path, override=True)
 
 # 基础配置
@@ -27,3 +27,84 @@ PARTICIPANT_MEM_LIMIT = os.getenv('PARTICIPANT_MEM_LIMIT', '2g')
 ORGANIZER_TIMEOUT = int(os.getenv('ORGANIZER_TIMEOUT', '300'))
 ORGANIZER_CPU_CORES = int(os.getenv('ORGANIZER_CPU_CORES', '1'))
 ORGANIZER_MEM_LIMIT = os.getenv('ORGANIZER_MEM_LIMIT', '1g')
+
+# 评测任务队列配置（SQLite 持久化队列）
+QUEUE_DB_PATH = os.getenv('QUEUE_DB_PATH', './task_queue.db')
+# 任务租约（可见性超时，秒）：超过该时间未确认的任务会重新回到队列，默认覆盖参赛方+主办方的最长运行时间
+QUEUE_VISIBILITY_TIMEOUT = int(os.getenv('QUEUE_VISIBILITY_TIMEOUT', str(PARTICIPANT_TIMEOUT + ORGANIZER_TIMEOUT + 600)))
+# 单个任务的最大投递次数，超过后标记为 dead 不再重试
+QUEUE_MAX_ATTEMPTS = int(os.getenv('QUEUE_MAX_ATTEMPTS', '3'))
+
+# 评测调度配置
+# 并发评测数，0 表示根据宿主机 CPU/内存预算与单任务资源限制自动计算
+EVAL_CONCURRENCY = int(os.getenv('EVAL_CONCURRENCY', '0'))
+# 为宿主机（Web 服务、Docker daemon 等）预留、不参与调度的 CPU 核心数与内存
+HOST_CPU_RESERVE = int(os.getenv('HOST_CPU_RESERVE', '1'))
+HOST_MEM_RESERVE = os.getenv('HOST_MEM_RESERVE', '2g')
+
+# 主办方镜像缓存总大小上限，超过后按最近使用时间淘汰空闲镜像（支持 b/k/m/g 单位）
+ORGANIZER_IMAGE_CACHE_MAX_BYTES = os.getenv('ORGANIZER_IMAGE_CACHE_MAX_BYTES', '20g')
+
+# 镜像流式加载时每次读取并发送给 Docker daemon 的块大小（字节），默认 4MB
+IMAGE_LOAD_CHUNK_SIZE = int(os.getenv('IMAGE_LOAD_CHUNK_SIZE', str(4 * 1024 * 1024)))
+# 分层感知加载：镜像已存在时直接复用，否则只向 daemon 传输缺失的层
+IMAGE_LAYER_AWARE_LOAD = os.getenv('IMAGE_LAYER_AWARE_LOAD', 'true').lower() == 'true'
+# 评测结束后保留每个参赛者最近一次提交的镜像（仅保留一个），使其基础层留在 daemon 中供重新提交复用
+PARTICIPANT_IMAGE_RETAIN = os.getenv('PARTICIPANT_IMAGE_RETAIN', 'true').lower() == 'true'
+# 保留的参赛者镜像总大小上限（按镜像 Size 计，含共享层），超过后按最近保留时间淘汰（支持 b/k/m/g 单位，0 表示不限制）
+PARTICIPANT_IMAGE_RETAIN_MAX_BYTES = os.getenv('PARTICIPANT_IMAGE_RETAIN_MAX_BYTES', '20g')
+
+# 提交输入数据模式：
+#   shared   - 直接只读挂载评测的 dataset/source，不产生任何复制（默认）
+#   snapshot - 为每次提交生成 input 目录快照（优先 reflink，不支持时复制）
+SUBMISSION_INPUT_MODE = os.getenv('SUBMISSION_INPUT_MODE', 'shared').lower()
+# snapshot 模式下 reflink 不可用时改用硬链接（零复制）；硬链接与源文件共享内容，
+# 只能防止源文件被整体替换，原地修改源文件会同时改变所有排队中的快照
+SUBMISSION_SNAPSHOT_HARDLINK = os.getenv('SUBMISSION_SNAPSHOT_HARDLINK', 'false').lower() == 'true'
+
+# 容器资源采集：cgroup v2 挂载点与采样间隔（秒）；cgroup 不可访问时自动回退到 Docker stats API
+CGROUP_ROOT = os.getenv('CGROUP_ROOT', '/sys/fs/cgroup')
+CGROUP_SAMPLE_INTERVAL = float(os.getenv('CGROUP_SAMPLE_INTERVAL', '0.05'))
+# 回退到 Docker stats API 时的采样间隔（秒）
+METRICS_STATS_API_INTERVAL = float(os.getenv('METRICS_STATS_API_INTERVAL', '0.5'))
+# 每个容器保留的样本数上限，写满后降采样（步长翻倍）
+METRICS_BUFFER_CAPACITY = int(os.getenv('METRICS_BUFFER_CAPACITY', '4096'))
+# 随评测结果保存的资源时间序列最大点数（runtime_series.json）
+RUNTIME_SERIES_MAX_POINTS = int(os.getenv('RUNTIME_SERIES_MAX_POINTS', '200'))
+
+# 单个容器日志文件的大小上限（支持 k/m/g 单位，0 表示不限制）；超过时保留开头与结尾各一半
+LOG_MAX_BYTES = os.getenv('LOG_MAX_BYTES', '10m')
+
+# 提交状态事件流（SSE）无事件时的保活间隔（秒），应小于反向代理的空闲超时
+EVENTS_HEARTBEAT_INTERVAL = float(os.getenv('EVENTS_HEARTBEAT_INTERVAL', '15'))
+
+# /metrics 中执行后端统计（悬空镜像数等，需要访问 Docker）的缓存时间（秒）
+METRICS_EXECUTOR_STATS_TTL = float(os.getenv('METRICS_EXECUTOR_STATS_TTL', '30'))
+
+# 提交记录追加日志（submissions.journal.jsonl）累计多少条操作后压缩进 submissions.json 快照
+SUBMISSION_JOURNAL_COMPACT_OPS = int(os.getenv('SUBMISSION_JOURNAL_COMPACT_OPS', '1000'))
+
+# 分块上传：建议客户端每个分块的大小（字节），以及未完成上传会话的保留时间（秒）
+UPLOAD_CHUNK_SIZE = int(os.getenv('UPLOAD_CHUNK_SIZE', str(16 * 1024 * 1024)))
+UPLOAD_SESSION_TTL = int(os.getenv('UPLOAD_SESSION_TTL', '86400'))
+
+# 评测创建的后台准备任务：同时执行的任务数，以及单个大 ZIP 的并行解压线程数
+PROVISION_CONCURRENCY = int(os.getenv('PROVISION_CONCURRENCY', '2'))
+ZIP_EXTRACT_WORKERS = int(os.getenv('ZIP_EXTRACT_WORKERS', '4'))
+
+# 数据集 ZIP 的解压炸弹防护：解压后总大小上限（字节，默认 20GB）与成员数上限
+ZIP_MAX_EXPANDED_SIZE = int(os.getenv('ZIP_MAX_EXPANDED_SIZE', str(20 * 1024 ** 3)))
+ZIP_MAX_FILES = int(os.getenv('ZIP_MAX_FILES', '200000'))
+
+# 共享 Docker 客户端的连接池大小：短请求（api）与事件流/日志/stats 等长连接（stream），0 表示按并发评测数计算
+DOCKER_API_POOL_SIZE = int(os.getenv('DOCKER_API_POOL_SIZE', '0'))
+DOCKER_STREAM_POOL_SIZE = int(os.getenv('DOCKER_STREAM_POOL_SIZE', '0'))
+
+# 评测执行后端：docker（默认）或 fake（进程内模拟，不需要 Docker，用于压测与基准测试）
+EXECUTOR_BACKEND = os.getenv('EXECUTOR_BACKEND', 'docker').lower()
+# fake 后端：镜像加载耗时与容器运行耗时（秒）、耗时随机抖动比例、容器失败概率、参赛者 results.json 大小（字节）
+FAKE_EXECUTOR_LOAD_SECONDS = float(os.getenv('FAKE_EXECUTOR_LOAD_SECONDS', '0.05'))
+FAKE_EXECUTOR_RUN_SECONDS = float(os.getenv('FAKE_EXECUTOR_RUN_SECONDS', '0.5'))
+FAKE_EXECUTOR_JITTER = float(os.getenv('FAKE_EXECUTOR_JITTER', '0.2'))
+FAKE_EXECUTOR_FAILURE_RATE = float(os.getenv('FAKE_EXECUTOR_FAILURE_RATE', '0'))
+FAKE_EXECUTOR_OUTPUT_BYTES = int(os.getenv('FAKE_EXECUTOR_OUTPUT_BYTES', '1024'))
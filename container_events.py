@@ -0,0 +1,261 @@
+"""
+容器生命周期事件中心
+
+进程内只保留一个 Docker events 订阅线程、一个对账线程和一个定时器线程：
+- 事件线程订阅 container 类型的 start / die / oom 事件，分发给正在等待对应容器的评测
+- 对账线程周期性地 inspect 仍在等待的容器，兜底处理丢失的事件
+- 定时器线程维护一个最小堆，统一处理所有评测的超时等定时回调
+线程数量与同时运行的容器数量无关。
+
+所有定时回调在同一个定时器线程中依次执行，回调必须是不阻塞的短操作；
+需要访问 Docker、数据库等可能阻塞的工作应在回调中交给其他线程执行，否则会推迟其他评测的超时。
+
+事件流断开（例如 daemon 重启）后会自动重连，并对所有仍在等待的容器做一次 inspect 对账，
+避免断线期间错过 die 事件导致评测一直等待。
+"""
+
+import heapq
+import itertools
+import logging
+import threading
+import time
+
+import docker
+
+from docker_client import docker_clients
+
+logger = logging.getLogger(__name__)
+
+# 周期性对账间隔（秒）：兜底处理极端情况下丢失的事件
+RECONCILE_INTERVAL = 30
+
+
+class ContainerWatch:
+    """单个容器的等待句柄。"""
+
+    def __init__(self, container_id):
+        self.container_id = container_id
+        self.started = False
+        self.started_at = None
+        self.finished_at = None
+        self.exit_code = None
+        self.oom_killed = False
+        self.timed_out = False
+        self._done = threading.Event()
+
+    @property
+    def done(self):
+        return self._done.is_set()
+
+    def _resolve(self, exit_code, oom_killed=False):
+        if self._done.is_set():
+            return
+        self.exit_code = exit_code
+        self.oom_killed = self.oom_killed or oom_killed
+        self.finished_at = time.time()
+        self._done.set()
+
+    def _expire(self):
+        if self._done.is_set():
+            return
+        self.timed_out = True
+        self._done.set()
+
+    def wait(self, timeout=None):
+        """
+        等待容器退出或超时
+
+        Returns:
+            bool: 容器在超时前退出返回 True，超时返回 False
+        """
+        timer = None
+        if timeout is not None:
+            timer = event_hub.schedule(timeout, self._expire)
+        try:
+            self._done.wait()
+        finally:
+            if timer is not None:
+                event_hub.cancel(timer)
+        return not self.timed_out
+
+
+class ContainerEventHub:
+    """Docker events 订阅与定时器堆（进程级单例）。"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._watches = {}
+        self._started = False
+
+        self._timer_cond = threading.Condition()
+        self._timers = []
+        self._timer_seq = itertools.count()
+        # 尚未触发且未取消的定时器句柄
+        self._active_timers = set()
+        self._timer_started = False
+
+        self._last_event_time = None
+
+    # -------------------- 启动 --------------------
+
+    def _ensure_started(self):
+        """启动 Docker 事件流与周期对账（只在 Docker 执行后端首次 watch 时启动）。"""
+        if self._started:
+            return
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+            threading.Thread(target=self._event_loop, name='docker-events', daemon=True).start()
+            threading.Thread(target=self._reconcile_loop, name='docker-reconcile', daemon=True).start()
+
+    def _ensure_timer_started(self):
+        """定时器线程与 Docker 无关，其他执行后端与日志采集也会使用。"""
+        if self._timer_started:
+            return
+        with self._timer_cond:
+            if self._timer_started:
+                return
+            self._timer_started = True
+            threading.Thread(target=self._timer_loop, name='eval-timers', daemon=True).start()
+
+    # -------------------- 容器等待 --------------------
+
+    def watch(self, container_id):
+        """注册对容器的等待，需在容器 start 之前调用，避免错过事件。"""
+        self._ensure_started()
+        watch = ContainerWatch(container_id)
+        with self._lock:
+            self._watches[container_id] = watch
+        return watch
+
+    def unwatch(self, container_id):
+        with self._lock:
+            self._watches.pop(container_id, None)
+
+    def watching_count(self):
+        with self._lock:
+            return len(self._watches)
+
+    def _dispatch(self, event):
+        status = event.get('status') or event.get('Action')
+        container_id = event.get('id') or event.get('Actor', {}).get('ID')
+        if not container_id:
+            return
+        with self._lock:
+            watch = self._watches.get(container_id)
+        if watch is None:
+            return
+
+        if status == 'start':
+            watch.started = True
+            watch.started_at = time.time()
+        elif status == 'oom':
+            watch.oom_killed = True
+        elif status == 'die':
+            attrs = event.get('Actor', {}).get('Attributes', {})
+            try:
+                exit_code = int(attrs.get('exitCode', -1))
+            except (TypeError, ValueError):
+                exit_code = -1
+            watch._resolve(exit_code)
+
+    def _event_loop(self):
+        backoff = 1
+        while True:
+            events = None
+            try:
+                since = self._last_event_time or int(time.time()) - 1
+                events = docker_clients.stream.events(
+                    decode=True,
+                    since=since,
+                    filters={'type': 'container', 'event': ['start', 'die', 'oom']}
+                )
+                # 连接建立后对账一次，处理连接建立前已经退出的容器
+                self._reconcile()
+                backoff = 1
+                for event in events:
+                    event_time = event.get('time')
+                    if event_time:
+                        self._last_event_time = event_time
+                    self._dispatch(event)
+            except Exception as e:
+                logger.warning(f'Docker events stream interrupted: {e}')
+            finally:
+                # 只关闭事件流本身，共享客户端的连接池由其他调用继续使用
+                if events is not None:
+                    try:
+                        events.close()
+                    except Exception:
+                        pass
+            # 事件流中断通常意味着 daemon 重启：检查连接，不可用时重置共享客户端
+            docker_clients.check()
+            time.sleep(backoff)
+            backoff = min(backoff * 2, 30)
+
+    def _reconcile(self):
+        """对所有仍在等待的容器做一次 inspect，补发可能错过的退出事件。"""
+        with self._lock:
+            pending = [w for w in self._watches.values() if not w.done]
+        if not pending:
+            return
+        try:
+            client = docker_clients.api
+            for watch in pending:
+                try:
+                    state = client.api.inspect_container(watch.container_id).get('State', {})
+                except docker.errors.NotFound:
+                    watch._resolve(-1)
+                    continue
+                if state.get('Running') or state.get('Status') == 'created':
+                    continue
+                watch._resolve(state.get('ExitCode', -1), state.get('OOMKilled', False))
+        except Exception as e:
+            logger.warning(f'Container state reconcile failed: {e}')
+
+    def _reconcile_loop(self):
+        # 逐个 inspect 在 daemon 响应慢时可能阻塞很久，单独一个线程执行，不占用定时器线程
+        while True:
+            time.sleep(RECONCILE_INTERVAL)
+            self._reconcile()
+
+    # -------------------- 定时器堆 --------------------
+
+    def schedule(self, delay, callback):
+        """在 delay 秒后于定时器线程中执行 callback（不得阻塞），返回可用于 cancel 的句柄。"""
+        self._ensure_timer_started()
+        with self._timer_cond:
+            handle = next(self._timer_seq)
+            self._active_timers.add(handle)
+            heapq.heappush(self._timers, (time.monotonic() + delay, handle, callback))
+            self._timer_cond.notify()
+        return handle
+
+    def cancel(self, handle):
+        with self._timer_cond:
+            self._active_timers.discard(handle)
+
+    def _timer_loop(self):
+        while True:
+            with self._timer_cond:
+                while True:
+                    if not self._timers:
+                        self._timer_cond.wait()
+                        continue
+                    deadline, handle, callback = self._timers[0]
+                    now = time.monotonic()
+                    if deadline > now:
+                        self._timer_cond.wait(deadline - now)
+                        continue
+                    heapq.heappop(self._timers)
+                    if handle not in self._active_timers:
+                        continue
+                    self._active_timers.discard(handle)
+                    break
+            try:
+                callback()
+            except Exception as e:
+                logger.warning(f'Timer callback failed: {e}')
+
+
+event_hub = ContainerEventHub()
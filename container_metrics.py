@@ -1,212 +1,457 @@
 """
 容器资源指标收集模块（轻量级版本）
 
-收集参赛者容器的 CPU、内存使用情况
+收集参赛者容器的 CPU、内存、块 I/O 与进程数：
+- 进程内只有一个采样线程（MetricsSampler），在同一个循环中轮询所有正在跟踪的容器，
+  线程与 Docker 连接数不随并发评测数增长
+- 每个容器的样本存放在定长数组缓冲区（SampleBuffer）中，而不是每个样本一个 dict
+- 数据源优先直接读取 cgroup v2 文件（采样间隔可达几十毫秒，内存峰值与 CPU 时间精确），
+  cgroup 不可访问时（如 Windows / cgroup v1 / 容器内部署）回退到 Docker stats API（one-shot 模式）
+
+评测代码通过 create_metrics_collector() 获得一个收集器句柄，接口保持
+start_collection() / stop_collection() / get_summary() 不变。
 """
 
 import docker
+import json
+import math
 import time
 import threading
-from typing import Dict, List, Optional
+from array import array
+from typing import Dict, Optional
 import os
 
+from config import (
+    CGROUP_ROOT, CGROUP_SAMPLE_INTERVAL, METRICS_STATS_API_INTERVAL, METRICS_BUFFER_CAPACITY,
+    RUNTIME_SERIES_MAX_POINTS
+)
+
 # 检查是否启用调试模式
 DEBUG_MODE = os.environ.get('METRICS_DEBUG', '').lower() == 'true'
 
 
-class ContainerMetricsCollector:
-    """容器资源指标收集器"""
-    
-    def __init__(self, container_id: str, collection_interval: float = 0.5):
+# ==================== cgroup v2 读取 ====================
+
+def find_container_cgroup(container_id: str, cgroup_root: str = None) -> Optional[str]:
+    """
+    查找容器对应的 cgroup v2 目录
+
+    依次尝试 systemd 驱动（system.slice/docker-<id>.scope）与 cgroupfs 驱动（docker/<id>）的路径；
+    宿主机不是 cgroup v2 或目录不可读时返回 None。
+    """
+    root = cgroup_root or CGROUP_ROOT
+    if not os.path.exists(os.path.join(root, 'cgroup.controllers')):
+        return None
+    candidates = [
+        os.path.join(root, 'system.slice', f'docker-{container_id}.scope'),
+        os.path.join(root, 'docker', container_id),
+        os.path.join(root, 'docker.slice', f'docker-{container_id}.scope'),
+    ]
+    for path in candidates:
+        if os.access(os.path.join(path, 'cpu.stat'), os.R_OK):
+            return path
+    return None
+
+
+def _read_int(path: str) -> Optional[int]:
+    try:
+        with open(path, 'r') as f:
+            value = f.read().strip()
+        return None if value == 'max' else int(value)
+    except (OSError, ValueError):
+        return None
+
+
+def _read_keyed(path: str) -> Dict[str, int]:
+    """解析 `key value` 逐行格式的 cgroup 文件（如 cpu.stat）。"""
+    result = {}
+    try:
+        with open(path, 'r') as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) == 2:
+                    result[parts[0]] = int(parts[1])
+    except (OSError, ValueError):
+        pass
+    return result
+
+
+def _read_io_bytes(path: str):
+    """汇总 io.stat 中所有设备的读写字节数。"""
+    read_bytes = 0
+    write_bytes = 0
+    try:
+        with open(path, 'r') as f:
+            for line in f:
+                for field in line.split()[1:]:
+                    key, _, value = field.partition('=')
+                    if key == 'rbytes':
+                        read_bytes += int(value)
+                    elif key == 'wbytes':
+                        write_bytes += int(value)
+    except (OSError, ValueError):
+        return None
+    return read_bytes, write_bytes
+
+
+# ==================== 数据源 ====================
+
+class CgroupSource:
+    """直接读取 cgroup v2 文件的数据源。"""
+
+    name = 'cgroup'
+
+    def __init__(self, cgroup_path: str):
+        self.cgroup_path = cgroup_path
+        self.interval = CGROUP_SAMPLE_INTERVAL
+
+    def read(self) -> Optional[Dict]:
         """
-        初始化收集器
-        
-        Args:
-            container_id: Docker 容器 ID
-            collection_interval: 数据收集间隔（秒），默认 0.5 秒
+        读取一次累计指标；cgroup 已被移除（容器退出并删除）时返回 None
+
+        Returns:
+            cpu_usec（累计 CPU 微秒）、memory（当前字节）、memory_peak、io（读, 写）、pids
         """
+        usage_usec = _read_keyed(os.path.join(self.cgroup_path, 'cpu.stat')).get('usage_usec')
+        if usage_usec is None:
+            return None
+        return {
+            'cpu_usec': usage_usec,
+            'memory': _read_int(os.path.join(self.cgroup_path, 'memory.current')) or 0,
+            # memory.peak（内核 5.19+）由内核维护精确峰值，不受采样间隔影响
+            'memory_peak': _read_int(os.path.join(self.cgroup_path, 'memory.peak')),
+            'io': _read_io_bytes(os.path.join(self.cgroup_path, 'io.stat')),
+            'pids': _read_int(os.path.join(self.cgroup_path, 'pids.current')) or 0,
+        }
+
+
+class StatsApiSource:
+    """基于 Docker stats API 的数据源（one-shot 模式，不等待 daemon 的 1 秒采样周期）。"""
+
+    name = 'stats_api'
+
+    def __init__(self, container_id: str, client):
         self.container_id = container_id
-        self.collection_interval = collection_interval
-        self.metrics: List[Dict] = []
-        self.running = False
+        self.client = client
+        self.interval = METRICS_STATS_API_INTERVAL
+
+    def read(self) -> Optional[Dict]:
+        try:
+            stats = self.client.api.stats(self.container_id, decode=True, stream=False, one_shot=True)
+        except docker.errors.NotFound:
+            return None
+        except docker.errors.InvalidVersion:
+            # daemon 过旧不支持 one_shot，退回普通单次采样
+            stats = self.client.api.stats(self.container_id, decode=True, stream=False)
+
+        cpu_ns = stats.get('cpu_stats', {}).get('cpu_usage', {}).get('total_usage')
+        if not cpu_ns:
+            # 容器尚未启动或已退出时 stats 为空
+            return {'cpu_usec': None, 'memory': 0, 'memory_peak': None, 'io': None, 'pids': 0}
+
+        memory_stats = stats.get('memory_stats', {})
+        read_bytes = 0
+        write_bytes = 0
+        for entry in (stats.get('blkio_stats', {}) or {}).get('io_service_bytes_recursive') or []:
+            op = (entry.get('op') or '').lower()
+            if op == 'read':
+                read_bytes += entry.get('value', 0)
+            elif op == 'write':
+                write_bytes += entry.get('value', 0)
+
+        return {
+            'cpu_usec': cpu_ns // 1000,
+            'memory': memory_stats.get('usage', 0),
+            'memory_peak': memory_stats.get('max_usage'),
+            'io': (read_bytes, write_bytes),
+            'pids': (stats.get('pids_stats') or {}).get('current', 0),
+        }
+
+
+# ==================== 样本存储 ====================
+
+class SampleBuffer:
+    """
+    定长数组缓冲区，按列存放 (时间, CPU%, 内存MB)
+
+    使用 array('d') 而不是每个样本一个 dict；写满后丢弃奇数位样本、采样步长翻倍，
+    因此内存上限固定，同时保留从开始到结束的完整（降采样后的）时间轴。
+    """
+
+    def __init__(self, capacity: int = None):
+        self.capacity = max(capacity or METRICS_BUFFER_CAPACITY, 2)
+        self.t = array('d')
+        self.cpu = array('d')
+        self.mem = array('d')
+        self._stride = 1
+        self._pending = 0
+
+    def append(self, t: float, cpu: float, mem: float):
+        self._pending += 1
+        if self._pending < self._stride:
+            return
+        self._pending = 0
+        if len(self.t) >= self.capacity:
+            self.t = self.t[::2]
+            self.cpu = self.cpu[::2]
+            self.mem = self.mem[::2]
+            self._stride *= 2
+        self.t.append(t)
+        self.cpu.append(cpu)
+        self.mem.append(mem)
+
+    def __len__(self):
+        return len(self.t)
+
+    def downsample(self, max_points: int) -> Dict:
+        """
+        把样本按时间顺序分桶压缩到不超过 max_points 个点
+
+        每个桶取平均时间，CPU 与内存取桶内最大值，保证峰值不会被平均掉。
+        """
+        n = len(self.t)
+        if n <= max_points:
+            return {'t': list(self.t), 'cpu': list(self.cpu), 'mem': list(self.mem)}
+        size = math.ceil(n / max_points)
+        result = {'t': [], 'cpu': [], 'mem': []}
+        for start in range(0, n, size):
+            end = min(start + size, n)
+            result['t'].append(sum(self.t[start:end]) / (end - start))
+            result['cpu'].append(max(self.cpu[start:end]))
+            result['mem'].append(max(self.mem[start:end]))
+        return result
+
+
+def _percentile(sorted_values, q: float) -> float:
+    """线性插值百分位数，sorted_values 需已升序排列。"""
+    if not sorted_values:
+        return 0.0
+    pos = (len(sorted_values) - 1) * q
+    lower = int(pos)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (pos - lower)
+
+
+class ContainerTracker:
+    """单个容器的跟踪状态：数据源、样本缓冲区与精确的累计聚合值。"""
+
+    def __init__(self, container_id: str, source, interval: float = None):
+        self.container_id = container_id
+        self.source = source
+        self.interval = interval or source.interval
+        self.buffer = SampleBuffer()
         self.lock = threading.Lock()
-        self.client = docker.from_env()
-        
-    def start_collection(self):
-        """启动后台指标收集线程"""
-        self.running = True
-        self.thread = threading.Thread(target=self._collect_metrics_loop, daemon=True)
-        self.thread.start()
-        # 给收集器一点时间启动
-        time.sleep(0.1)
-        return self.thread
-    
-    def stop_collection(self):
-        """停止指标收集"""
-        self.running = False
-        # 等待线程结束，给它时间完成最后的采样
-        if hasattr(self, 'thread'):
-            self.thread.join(timeout=2)
-    
-    def _collect_metrics_loop(self):
-        """后台循环收集指标"""
+        self.next_due = 0.0
+        self.active = True
+
+        self.started_at = time.monotonic()
+        self.samples = 0
+        self.cpu_usec = 0
+        self.cpu_peak = 0.0
+        self.memory_peak = 0
+        self.memory_sum = 0.0
+        self.io = (0, 0)
+        self.pids_peak = 0
+        self._last_cpu_usec = None
+        self._last_time = None
+
+    def sample(self) -> bool:
+        """采集一次，返回容器是否仍然存在。"""
         try:
-            container = self.client.containers.get(self.container_id)
-            first_stats = None
-            sample_count = 0
-            
-            if DEBUG_MODE:
-                print(f"[METRICS] 开始采集容器 {self.container_id[:12]}")
-            
-            while self.running:
-                try:
-                    # 获取容器统计信息
-                    stats = container.stats(stream=False)
-                    
-                    # 对于快速完成的容器，尽量采集第一个有效样本
-                    # 只在获取到足够的 CPU 增量时才跳过
-                    if first_stats is None:
-                        first_cpu = stats.get('cpu_stats', {}).get('cpu_usage', {}).get('total_usage', 0)
-                        
-                        # 如果第一次采样就有 CPU 使用，直接使用
-                        if first_cpu > 0:
-                            if DEBUG_MODE:
-                                print(f"[METRICS] 第一次采样有效，直接记录 (CPU usage: {first_cpu})")
-                            first_stats = stats
-                            # 继续处理这个样本
-                        else:
-                            # 如果第一次采样没有 CPU 使用，保存并等待下一次
-                            if DEBUG_MODE:
-                                print(f"[METRICS] 第一次采样 CPU 为 0，等待下一次采样")
-                            first_stats = stats
-                            time.sleep(self.collection_interval)
-                            continue
-                    
-                    # 解析 CPU 使用率
-                    cpu_percent = self._calculate_cpu_percent(stats)
-                    
-                    # 解析内存使用量（单位：MB）
-                    memory_usage = stats['memory_stats'].get('usage', 0)
-                    memory_usage_mb = memory_usage / 1024 / 1024
-                    
-                    # 记录指标
-                    metric_data = {
-                        'cpu_percent': cpu_percent,
-                        'memory_mb': memory_usage_mb,
-                    }
-                    
-                    if DEBUG_MODE:
-                        print(f"[METRICS] 采样 {sample_count+1}: CPU={cpu_percent:.2f}%, MEM={memory_usage_mb:.2f}MB")
-                    
-                    with self.lock:
-                        self.metrics.append(metric_data)
-                    
-                    sample_count += 1
-                    time.sleep(self.collection_interval)
-                    
-                except docker.errors.NotFound:
-                    if DEBUG_MODE:
-                        print(f"[METRICS] 容器已删除")
-                    break
-                except Exception as e:
-                    if DEBUG_MODE:
-                        print(f"[METRICS] 采集异常: {type(e).__name__}: {e}")
-                    time.sleep(self.collection_interval)
-                    
+            data = self.source.read()
         except Exception as e:
             if DEBUG_MODE:
-                print(f"[METRICS] 采集线程异常: {e}")
-            pass
-    
-    def _calculate_cpu_percent(self, stats: Dict) -> float:
+                print(f"[METRICS] 采集异常 {self.container_id[:12]}: {type(e).__name__}: {e}")
+            return True
+        if data is None:
+            return False
+
+        now = time.monotonic()
+        cpu_usec = data['cpu_usec']
+        with self.lock:
+            if cpu_usec is not None:
+                self.cpu_usec = cpu_usec
+            self.memory_peak = max(self.memory_peak, data['memory_peak'] or 0, data['memory'])
+            if data['io'] is not None:
+                self.io = data['io']
+            self.pids_peak = max(self.pids_peak, data['pids'])
+
+            if cpu_usec is not None and self._last_cpu_usec is not None and now > self._last_time:
+                cpu_percent = (cpu_usec - self._last_cpu_usec) / ((now - self._last_time) * 1_000_000) * 100.0
+                memory_mb = data['memory'] / 1024 / 1024
+                self.cpu_peak = max(self.cpu_peak, cpu_percent)
+                self.memory_sum += memory_mb
+                self.samples += 1
+                self.buffer.append(now - self.started_at, cpu_percent, memory_mb)
+            if cpu_usec is not None:
+                self._last_cpu_usec = cpu_usec
+                self._last_time = now
+        return True
+
+    def summary(self) -> Dict:
+        with self.lock:
+            # cgroup 的 cpu.stat 从容器启动起累计；stats API 同样是累计值
+            cpu_seconds = self.cpu_usec / 1_000_000
+            # 缓冲区按固定步长降采样，样本在时间上均匀分布，可直接用于百分位数
+            cpu_sorted = sorted(self.buffer.cpu)
+            return {
+                'cpu_peak': round(self.cpu_peak, 2),
+                'cpu_p50': round(_percentile(cpu_sorted, 0.5), 2),
+                'cpu_p95': round(_percentile(cpu_sorted, 0.95), 2),
+                'memory_peak': round(self.memory_peak / 1024 / 1024, 2),
+                'memory_avg': round(self.memory_sum / self.samples, 2) if self.samples else 0,
+                'cpu_seconds': round(cpu_seconds, 3),
+                'io_read_bytes': self.io[0],
+                'io_write_bytes': self.io[1],
+                'pids_peak': self.pids_peak,
+                'samples': self.samples,
+                'source': self.source.name,
+            }
+
+    def series(self, max_points: int = None) -> Dict:
+        """
+        返回列式存储的资源时间序列
+
+        t 为相对容器开始跟踪的秒数，cpu 为 CPU%，mem 为内存 MB。
+        """
+        with self.lock:
+            columns = self.buffer.downsample(max_points or RUNTIME_SERIES_MAX_POINTS)
+            return {
+                'version': 1,
+                'source': self.source.name,
+                'points': len(columns['t']),
+                't': [round(v, 3) for v in columns['t']],
+                'cpu': [round(v, 2) for v in columns['cpu']],
+                'mem': [round(v, 2) for v in columns['mem']],
+            }
+
+
+# ==================== 共享采样器 ====================
+
+class MetricsSampler:
+    """
+    进程级共享采样器
+
+    单线程按各容器的 next_due 轮询采样：cgroup 数据源只是几次小文件读取，
+    数百个容器同时跟踪时 CPU 开销依旧很低；stats API 数据源采样间隔更长。
+    """
+
+    def __init__(self):
+        self._trackers: Dict[str, ContainerTracker] = {}
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def _make_source(self, container_id: str):
+        # 数据源由执行后端提供（Docker 后端优先 cgroup，回退到 stats API）；延迟导入避免循环依赖
+        from executors import get_executor
+        return get_executor().metrics_source(container_id)
+
+    def track(self, container_id: str, interval: float = None) -> ContainerTracker:
+        tracker = ContainerTracker(container_id, self._make_source(container_id), interval)
+        # 注册时立即采一次，作为 CPU 增量的基准
+        tracker.sample()
+        tracker.next_due = time.monotonic() + tracker.interval
+        with self._cond:
+            self._trackers[container_id] = tracker
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name='metrics-sampler', daemon=True)
+                self._thread.start()
+            self._cond.notify()
+        return tracker
+
+    def untrack(self, tracker: ContainerTracker):
+        with self._cond:
+            self._trackers.pop(tracker.container_id, None)
+        if tracker.active:
+            tracker.active = False
+            # 停止前补采最后一次样本（cgroup 仍存在时）
+            tracker.sample()
+
+    def tracked_count(self) -> int:
+        with self._cond:
+            return len(self._trackers)
+
+    def _loop(self):
+        while True:
+            with self._cond:
+                while not self._trackers:
+                    self._cond.wait()
+                now = time.monotonic()
+                due = [t for t in self._trackers.values() if t.next_due <= now]
+                if not due:
+                    wait = min(t.next_due for t in self._trackers.values()) - now
+                    self._cond.wait(timeout=max(wait, 0.001))
+                    continue
+
+            for tracker in due:
+                if not tracker.active:
+                    continue
+                alive = tracker.sample()
+                tracker.next_due = time.monotonic() + tracker.interval
+                if not alive:
+                    # 容器已删除，不再轮询；汇总数据保留在 tracker 中
+                    tracker.active = False
+                    with self._cond:
+                        self._trackers.pop(tracker.container_id, None)
+
+
+metrics_sampler = MetricsSampler()
+
+
+class ContainerMetricsCollector:
+    """容器资源指标收集器（共享采样器上的句柄）"""
+
+    def __init__(self, container_id: str, collection_interval: float = None):
         """
-        计算 CPU 使用百分比
-        
+        初始化收集器
+
         Args:
-            stats: 容器统计数据
-            
-        Returns:
-            CPU 使用百分比
+            container_id: Docker 容器 ID
+            collection_interval: 数据收集间隔（秒），默认按数据源选择
+                （cgroup 为 CGROUP_SAMPLE_INTERVAL，stats API 为 METRICS_STATS_API_INTERVAL）
         """
-        try:
-            cpu_stats = stats.get('cpu_stats', {})
-            precpu_stats = stats.get('precpu_stats', {})
-            
-            # 获取 CPU 相关数据
-            cpu_usage = cpu_stats.get('cpu_usage', {}).get('total_usage', 0)
-            precpu_usage = precpu_stats.get('cpu_usage', {}).get('total_usage', 0)
-            system_cpu = cpu_stats.get('system_cpu_usage', 0)
-            presystem_cpu = precpu_stats.get('system_cpu_usage', 0)
-            
-            cpu_delta = cpu_usage - precpu_usage
-            system_delta = system_cpu - presystem_cpu
-            
-            if system_delta == 0 or cpu_delta == 0:
-                return 0.0
-            
-            # 获取 CPU 核心数
-            cpu_count = len(cpu_stats.get('cpus', []))
-            if cpu_count == 0:
-                # 尝试从其他字段获取
-                cpu_count = cpu_stats.get('online_cpus', 1)
-                if cpu_count == 0:
-                    cpu_count = 1
-            
-            # 计算百分比
-            cpu_percent = (cpu_delta / system_delta) * cpu_count * 100.0
-            return max(0, min(cpu_percent, 100 * cpu_count))  # 限制范围
-            
-        except Exception as e:
-            return 0.0
-    
+        self.container_id = container_id
+        self.collection_interval = collection_interval
+        self.tracker: Optional[ContainerTracker] = None
+
+    def start_collection(self):
+        """把容器注册到共享采样器"""
+        self.tracker = metrics_sampler.track(self.container_id, self.collection_interval)
+        return self.tracker
+
+    def stop_collection(self):
+        """从共享采样器注销（会补采最后一次样本）"""
+        if self.tracker is not None:
+            metrics_sampler.untrack(self.tracker)
+
     def get_summary(self) -> Dict:
         """
         获取收集到的指标统计摘要
-        
+
         Returns:
-            包含峰值的统计数据字典
+            cpu_peak / cpu_p50 / cpu_p95（%）、memory_peak（MB）、memory_avg（MB）、cpu_seconds、io_read_bytes、
+            io_write_bytes、pids_peak、samples、source
         """
-        with self.lock:
-            if DEBUG_MODE:
-                print(f"[METRICS] 总共采集到 {len(self.metrics)} 个样本")
-                if self.metrics:
-                    print(f"[METRICS] 样本数据: {self.metrics[:5]}")  # 打印前5个样本
-            
-            if not self.metrics:
-                if DEBUG_MODE:
-                    print(f"[METRICS] 没有采集到任何数据，返回默认值")
-                return {
-                    'cpu_peak': 0,
-                    'memory_peak': 0,
-                }
-            
-            # 提取 CPU 和内存数据
-            cpu_data = [m['cpu_percent'] for m in self.metrics]
-            mem_data = [m['memory_mb'] for m in self.metrics]
-            
-            # 对于容器运行时间很短的情况，不过滤数据
-            # 因为即使是 0 也是有效的结果
-            if len(self.metrics) < 2:
-                # 样本少于 2 个，直接返回采集到的数据
-                cpu_peak = max(cpu_data) if cpu_data else 0
-                mem_peak = max(mem_data) if mem_data else 0
-            else:
-                # 样本充足，可以过滤掉初始化阶段的 0 值
-                cpu_data_filtered = [c for c in cpu_data if c > 0]
-                mem_data_filtered = [m for m in mem_data if m > 0]
-                
-                # 返回峰值，如果过滤后有数据则用过滤后的，否则用原始数据
-                cpu_peak = max(cpu_data_filtered) if cpu_data_filtered else max(cpu_data)
-                mem_peak = max(mem_data_filtered) if mem_data_filtered else max(mem_data)
-            
-            if DEBUG_MODE:
-                print(f"[METRICS] 样本数: {len(self.metrics)}")
-                print(f"[METRICS] CPU数据: {cpu_data}")
-                print(f"[METRICS] CPU峰值: {cpu_peak}")
-                print(f"[METRICS] 内存数据: {mem_data}")
-                print(f"[METRICS] 内存峰值: {mem_peak}")
-            
-            return {
-                'cpu_peak': round(cpu_peak, 2),
-                'memory_peak': round(mem_peak, 2),
-            }
+        if self.tracker is None:
+            return {'cpu_peak': 0, 'memory_peak': 0}
+        summary = self.tracker.summary()
+        if DEBUG_MODE:
+            print(f"[METRICS] {self.container_id[:12]} 摘要: {summary}")
+        return summary
+
+    def get_series(self, max_points: int = None) -> Optional[Dict]:
+        """获取降采样后的资源时间序列（最多 max_points 个点，默认 RUNTIME_SERIES_MAX_POINTS）"""
+        if self.tracker is None:
+            return None
+        return self.tracker.series(max_points)
+
+
+def save_runtime_series(path: str, series: Dict):
+    """以紧凑的列式 JSON 写入资源时间序列"""
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(series, f, separators=(',', ':'))
+
+
+def create_metrics_collector(container_id: str, collection_interval: float = None) -> ContainerMetricsCollector:
+    """为容器创建指标收集器（数据源由共享采样器自动选择：cgroup v2 优先，回退 stats API）"""
+    return ContainerMetricsCollector(container_id, collection_interval)
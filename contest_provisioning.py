@@ -0,0 +1,300 @@
+"""
+评测创建的后台准备任务
+
+/create 只负责校验并保存上传的文件、写入 info.json（status 为 provisioning），随后立即返回；
+耗时的准备工作在后台任务中完成：
+- source：解压评测数据源 ZIP（随表单上传的 ZIP 已在接收时解压，此阶段直接完成）
+- result：解压结果集 ZIP（同上）
+- image：预加载主办方镜像到缓存
+三个阶段并行执行（大 ZIP 内部再按成员多线程解压），全部成功后 info.json 的 status 才置为 ready，
+此前提交接口会拒绝该评测。任一阶段失败（包括主办方镜像无法加载）时 status 置为 failed，
+可通过 POST /api/contests/<id>/provision 重试：已完成的阶段跳过，失败的阶段重新执行
+（解压失败时保留待解压的 ZIP，成功后才删除）。
+
+各阶段进度与待解压的 ZIP 路径写入 info/provision.json。服务启动时 resume_unfinished() 继续上次
+未完成的任务；任务不在本进程中、又未被恢复的 provisioning 状态在查询时写为 failed（provision.json
+与 info.json 同时更新），不会让评测一直停留在准备中。
+"""
+
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from config import PROVISION_CONCURRENCY, ZIP_EXTRACT_WORKERS
+from executors import get_executor
+from logger import logger
+from utils import extract_zip_to_folder
+
+STATUS_PROVISIONING = 'provisioning'
+STATUS_READY = 'ready'
+STATUS_FAILED = 'failed'
+
+STAGES = ('source', 'result', 'image')
+
+
+def provision_state_path(contest_dir):
+    return os.path.join(contest_dir, 'info', 'provision.json')
+
+
+def _write_json(path, data):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def set_contest_status(contest_dir, status):
+    """更新 info.json 中的 status 字段（原子替换）。"""
+    info_file = os.path.join(contest_dir, 'info', 'info.json')
+    with open(info_file, 'r', encoding='utf-8') as f:
+        info = json.load(f)
+    info['status'] = status
+    _write_json(info_file, info)
+
+
+class ProvisioningJob:
+    """单个评测的准备任务。"""
+
+    def __init__(self, contest_id, contest_dir, source_zip, result_zip, previous=None):
+        self.contest_id = contest_id
+        self.contest_dir = contest_dir
+        self.source_zip = source_zip
+        self.result_zip = result_zip
+        self.lock = threading.Lock()
+        self.state = {
+            'contest_id': contest_id,
+            'status': STATUS_PROVISIONING,
+            'created_at': time.time(),
+            'finished_at': None,
+            'error': None,
+            'stages': {name: {'status': 'pending', 'started_at': None, 'finished_at': None, 'error': None}
+                       for name in STAGES},
+            'zips': {'source': source_zip, 'result': result_zip}
+        }
+        if previous:
+            # 恢复或重试：沿用创建时间，已完成的阶段不再执行
+            self.state['created_at'] = previous.get('created_at') or self.state['created_at']
+            for name, stage in (previous.get('stages') or {}).items():
+                if name in self.state['stages'] and stage.get('status') == 'done':
+                    self.state['stages'][name] = stage
+
+    def snapshot(self):
+        with self.lock:
+            return _public_state(self.state)
+
+    def _save(self):
+        """持久化当前状态，需持有 lock。"""
+        try:
+            _write_json(provision_state_path(self.contest_dir), self.state)
+        except Exception as e:
+            logger.warning(f'Failed to save provision state for contest {self.contest_id}: {e}')
+
+    def _update_stage(self, name, **fields):
+        with self.lock:
+            self.state['stages'][name].update(fields)
+            self._save()
+
+    def _run_stage(self, name, func):
+        if self.state['stages'][name]['status'] == 'done':
+            return True
+        self._update_stage(name, status='running', started_at=time.time(), finished_at=None, error=None)
+        try:
+            func()
+        except Exception as e:
+            self._update_stage(name, status=STATUS_FAILED, finished_at=time.time(), error=str(e))
+            return False
+        self._update_stage(name, status='done', finished_at=time.time())
+        return True
+
+    def _extract(self, zip_path, target_dir, label):
+        if zip_path is None:
+            # 已在上传时边接收边解压
+            return
+        if not os.path.exists(zip_path):
+            raise Exception(f'{label}压缩包已不存在，请重新创建评测')
+        success, error = extract_zip_to_folder(zip_path, target_dir, workers=ZIP_EXTRACT_WORKERS)
+        if not success:
+            # 保留压缩包供重试
+            raise Exception(f'{label}解压失败: {error}')
+        try:
+            os.remove(zip_path)
+        except OSError:
+            pass
+
+    def _preload_image(self):
+        get_executor().preload_organizer_image(self.contest_id, self.contest_dir)
+
+    def run(self):
+        dataset_dir = os.path.join(self.contest_dir, 'info', 'dataset')
+        stages = {
+            'source': lambda: self._extract(self.source_zip, os.path.join(dataset_dir, 'source'), '评测数据源'),
+            'result': lambda: self._extract(self.result_zip, os.path.join(dataset_dir, 'result'), '结果集'),
+            'image': self._preload_image
+        }
+        started = time.monotonic()
+        with ThreadPoolExecutor(max_workers=len(stages), thread_name_prefix=f'provision-{self.contest_id}') as pool:
+            futures = {name: pool.submit(self._run_stage, name, func) for name, func in stages.items()}
+            results = {name: future.result() for name, future in futures.items()}
+
+        failed = [name for name in STAGES if not results[name]]
+        status = STATUS_FAILED if failed else STATUS_READY
+        with self.lock:
+            self.state['status'] = status
+            self.state['finished_at'] = time.time()
+            if failed:
+                self.state['error'] = '; '.join(self.state['stages'][name]['error'] for name in failed)
+            self._save()
+        try:
+            set_contest_status(self.contest_dir, status)
+        except Exception as e:
+            logger.warning(f'Failed to update status of contest {self.contest_id}: {e}')
+        logger.info(f'Contest {self.contest_id} provisioning {status} in {time.monotonic() - started:.1f}s')
+        return status
+
+
+def _public_state(state):
+    """接口返回的状态（不包含服务器上的 ZIP 路径）。"""
+    state = json.loads(json.dumps(state))
+    state.pop('zips', None)
+    return state
+
+
+def _load_state(contest_dir):
+    with open(provision_state_path(contest_dir), 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+class ContestProvisioner:
+    """后台准备任务调度（最多 PROVISION_CONCURRENCY 个任务同时执行）。"""
+
+    def __init__(self, concurrency=None):
+        self.concurrency = max(1, concurrency or PROVISION_CONCURRENCY)
+        self._executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='provision')
+        self._lock = threading.Lock()
+        self._jobs = {}
+
+    def submit(self, contest_id, contest_dir, source_zip, result_zip, previous=None):
+        """提交准备任务；该评测已有任务在进行时返回 None。"""
+        job = ProvisioningJob(contest_id, contest_dir, source_zip, result_zip, previous)
+        with self._lock:
+            if contest_id in self._jobs:
+                return None
+            self._jobs[contest_id] = job
+        with job.lock:
+            job._save()
+        if previous is not None:
+            try:
+                set_contest_status(contest_dir, STATUS_PROVISIONING)
+            except Exception as e:
+                logger.warning(f'Failed to update status of contest {contest_id}: {e}')
+        self._executor.submit(self._run, job)
+        return job
+
+    def _resubmit(self, contest_id, contest_dir, state):
+        zips = state.get('zips') or {}
+        return self.submit(contest_id, contest_dir, zips.get('source'), zips.get('result'), previous=state)
+
+    def retry(self, contest_id, contest_dir):
+        """
+        重试失败的准备任务（已完成的阶段跳过）
+
+        Returns:
+            新任务；任务进行中、已就绪或没有准备记录时返回 None
+        """
+        try:
+            state = _load_state(contest_dir)
+        except (OSError, ValueError):
+            return None
+        if self.is_running(contest_id) or state.get('status') == STATUS_READY:
+            return None
+        return self._resubmit(contest_id, contest_dir, state)
+
+    def resume_unfinished(self, base_dir):
+        """服务启动时调用：继续上次运行中未完成（provision.json 仍为 provisioning）的准备任务。"""
+        resumed = 0
+        try:
+            names = os.listdir(base_dir)
+        except OSError:
+            return 0
+        for contest_id in names:
+            contest_dir = os.path.join(base_dir, contest_id)
+            try:
+                state = _load_state(contest_dir)
+            except (OSError, ValueError):
+                continue
+            if state.get('status') != STATUS_PROVISIONING:
+                continue
+            if self._resubmit(contest_id, contest_dir, state) is not None:
+                resumed += 1
+                logger.info(f'Resumed provisioning job for contest {contest_id}')
+        return resumed
+
+    def discard(self, contest_id, contest_dir):
+        """删除评测时清理仍保留在上传目录中的待解压 ZIP。"""
+        try:
+            state = _load_state(contest_dir)
+        except (OSError, ValueError):
+            return
+        for zip_path in (state.get('zips') or {}).values():
+            if zip_path:
+                try:
+                    os.remove(zip_path)
+                except OSError:
+                    pass
+
+    def _run(self, job):
+        try:
+            job.run()
+        except Exception:
+            logger.exception(f'Provisioning job for contest {job.contest_id} crashed')
+        with self._lock:
+            if self._jobs.get(job.contest_id) is job:
+                self._jobs.pop(job.contest_id, None)
+
+    def is_running(self, contest_id):
+        with self._lock:
+            return contest_id in self._jobs
+
+    def status(self, contest_id, contest_dir):
+        """
+        返回准备任务状态：进行中的任务取内存状态，否则读取 provision.json
+
+        provision.json 仍为 provisioning 但任务不在本进程中（服务中途重启且未恢复）时，
+        把 provision.json 与 info.json 都写为 failed，之后可通过 retry() 重试；
+        旧版评测没有 provision.json，视为 ready。
+        """
+        with self._lock:
+            job = self._jobs.get(contest_id)
+        if job is not None:
+            return job.snapshot()
+        try:
+            state = _load_state(contest_dir)
+        except FileNotFoundError:
+            if not os.path.isdir(contest_dir):
+                return None
+            return {'contest_id': contest_id, 'status': STATUS_READY, 'stages': {}}
+        except Exception as e:
+            return {'contest_id': contest_id, 'status': STATUS_FAILED, 'error': str(e), 'stages': {}}
+        if state.get('status') == STATUS_PROVISIONING and not self.is_running(contest_id):
+            state = self._mark_interrupted(contest_id, contest_dir, state)
+        return _public_state(state)
+
+    def _mark_interrupted(self, contest_id, contest_dir, state):
+        state['status'] = STATUS_FAILED
+        state['error'] = state.get('error') or '服务重启，准备任务未完成'
+        state['finished_at'] = time.time()
+        for stage in state.get('stages', {}).values():
+            if stage.get('status') in ('pending', 'running'):
+                stage['status'] = STATUS_FAILED
+                stage['error'] = stage.get('error') or '服务重启，未执行完成'
+        try:
+            _write_json(provision_state_path(contest_dir), state)
+            set_contest_status(contest_dir, STATUS_FAILED)
+        except Exception as e:
+            logger.warning(f'Failed to mark interrupted provisioning of contest {contest_id}: {e}')
+        return state
+
+
+provisioner = ContestProvisioner()
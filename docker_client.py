@@ -0,0 +1,121 @@
+"""
+进程内共享的 Docker 客户端
+
+进程内所有 Docker 调用共用两个客户端，各自维护连接池：
+- api：短请求（创建/启动/删除容器、inspect、镜像加载与删除、统计）
+- stream：长时间占用连接的请求（事件流、stats API 采样；SSH 等无法直接连接时的跟随日志）
+跟随日志通常由 executors.docker_logs 直接连接 daemon，不占用连接池。
+长连接单独成池，不会占满短请求的连接池，也不会因池满被丢弃后反复建连。
+
+连接池大小按调度器的并发评测数计算（run_queue_worker 启动时 configure），也可用
+DOCKER_API_POOL_SIZE / DOCKER_STREAM_POOL_SIZE 固定。check() 通过 ping 检查 daemon，
+失败时丢弃现有客户端，下次使用时重新连接（daemon 重启后不会一直复用失效的连接）；
+旧客户端不主动关闭，正在进行的日志流等请求自然结束后随之释放。
+"""
+
+import logging
+import threading
+import time
+
+import docker
+
+from config import DOCKER_API_POOL_SIZE, DOCKER_STREAM_POOL_SIZE
+
+logger = logging.getLogger(__name__)
+
+# 调度器启动前（例如只运行 Web 服务时）按该并发数估算连接池大小
+DEFAULT_CONCURRENCY = 4
+
+
+def pool_sizes(concurrency):
+    """
+    按并发评测数计算 (api, stream) 连接池大小
+
+    每个评测同一时刻最多有一个 stats 采样连接与一个（回退方式下的）跟随日志连接，另加事件流与对账的余量；
+    短请求在评测线程、清理线程与 Web 请求间共享，至少保留 docker-py 默认的 10 个。
+    """
+    concurrency = max(int(concurrency or DEFAULT_CONCURRENCY), 1)
+    api = DOCKER_API_POOL_SIZE or max(10, concurrency * 2 + 4)
+    stream = DOCKER_STREAM_POOL_SIZE or concurrency * 2 + 2
+    return api, stream
+
+
+class DockerClientManager:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._api = None
+        self._stream = None
+        self.api_pool_size, self.stream_pool_size = pool_sizes(None)
+        self.reconnects = 0
+        self.healthy = None
+        self.last_check = None
+        self.last_error = None
+
+    def configure(self, concurrency):
+        """按调度器的并发数调整连接池大小，已创建的客户端在大小变化时替换。"""
+        api_size, stream_size = pool_sizes(concurrency)
+        with self._lock:
+            if (api_size, stream_size) == (self.api_pool_size, self.stream_pool_size):
+                return
+            self.api_pool_size, self.stream_pool_size = api_size, stream_size
+            self._api = None
+            self._stream = None
+        logger.info(f'Docker client pools: api={api_size}, stream={stream_size}')
+
+    @property
+    def api(self):
+        client = self._api
+        if client is None:
+            with self._lock:
+                if self._api is None:
+                    self._api = docker.DockerClient.from_env(max_pool_size=self.api_pool_size)
+                client = self._api
+        return client
+
+    @property
+    def stream(self):
+        client = self._stream
+        if client is None:
+            with self._lock:
+                if self._stream is None:
+                    self._stream = docker.DockerClient.from_env(max_pool_size=self.stream_pool_size)
+                client = self._stream
+        return client
+
+    def reset(self):
+        """丢弃现有客户端，下次使用时重新连接。"""
+        with self._lock:
+            had_clients = self._api is not None or self._stream is not None
+            self._api = None
+            self._stream = None
+            if had_clients:
+                self.reconnects += 1
+
+    def check(self):
+        """ping daemon，失败时重置客户端；返回是否可用。"""
+        try:
+            self.api.ping()
+        except Exception as e:
+            self.healthy = False
+            self.last_error = str(e)
+            self.last_check = time.time()
+            logger.warning(f'Docker daemon health check failed, clients will reconnect: {e}')
+            self.reset()
+            return False
+        self.healthy = True
+        self.last_error = None
+        self.last_check = time.time()
+        return True
+
+    def status(self):
+        return {
+            'healthy': self.healthy,
+            'last_check': self.last_check,
+            'last_error': self.last_error,
+            'reconnects': self.reconnects,
+            'api_pool_size': self.api_pool_size,
+            'stream_pool_size': self.stream_pool_size,
+        }
+
+
+docker_clients = DockerClientManager()
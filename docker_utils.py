@@ -1,12 +1,12 @@
 """
 Docker 资源清理工具
 
-定期清理孤立的 Docker 镜像和容器，防止资源泄漏
+定期清理孤立的 Docker 镜像和容器，防止资源泄漏（具体操作由当前执行后端完成，fake 后端下为空操作）
 """
 
-import docker
 import logging
-from datetime import datetime, timedelta
+
+from executors import get_executor
 
 logger = logging.getLogger(__name__)
 
@@ -19,35 +19,9 @@ def cleanup_old_images(max_age_hours=24):
         max_age_hours: 镜像年龄阈值（小时）
     """
     try:
-        client = docker.from_env()
-        now = datetime.utcnow()
-        cutoff = now - timedelta(hours=max_age_hours)
-        
-        removed_count = 0
-        for image in client.images.list():
-            try:
-                # 检查镜像创建时间
-                created_str = image.attrs.get('Created', '')
-                if created_str:
-                    # 处理时间格式
-                    created = datetime.fromisoformat(
-                        created_str.replace('Z', '+00:00')
-                    )
-                    
-                    # 只删除超期且无标签的镜像
-                    if created < cutoff and (not image.tags or '<none>' in str(image.tags)):
-                        logger.info(f'Removing old image: {image.short_id}')
-                        try:
-                            client.images.remove(image.id, force=True)
-                            removed_count += 1
-                        except Exception as e:
-                            logger.warning(f'Failed to remove image {image.short_id}: {e}')
-            except Exception as e:
-                logger.debug(f'Error processing image: {e}')
-        
+        removed_count = get_executor().cleanup_images(max_age_hours)
         if removed_count > 0:
             logger.info(f'Successfully removed {removed_count} old images')
-        
     except Exception as e:
         logger.error(f'Cleanup images failed: {e}')
 
@@ -55,21 +29,9 @@ def cleanup_old_images(max_age_hours=24):
 def cleanup_dangling_containers():
     """清理已停止的容器"""
     try:
-        client = docker.from_env()
-        
-        removed_count = 0
-        # 移除已停止的容器
-        for container in client.containers.list(all=True, filters={'status': 'exited'}):
-            try:
-                logger.info(f'Removing exited container: {container.short_id}')
-                container.remove(force=True)
-                removed_count += 1
-            except Exception as e:
-                logger.warning(f'Failed to remove container: {e}')
-        
+        removed_count = get_executor().cleanup_containers()
         if removed_count > 0:
             logger.info(f'Successfully removed {removed_count} exited containers')
-                
     except Exception as e:
         logger.error(f'Cleanup containers failed: {e}')
 
@@ -82,18 +44,7 @@ def get_docker_stats():
         dict: 包含镜像数、容器数等信息
     """
     try:
-        client = docker.from_env()
-        
-        images = client.images.list()
-        containers = client.containers.list(all=True)
-        
-        return {
-            'status': 'ok',
-            'images_count': len(images),
-            'containers_count': len(containers),
-            'running_containers': len(client.containers.list()),
-            'dangling_images': len([img for img in images if not img.tags or '<none>' in str(img.tags)])
-        }
+        return {'status': 'ok', **get_executor().stats()}
     except Exception as e:
         logger.error(f'Failed to get Docker stats: {e}')
         return {
@@ -0,0 +1,40 @@
+"""
+评测执行后端
+
+由 EXECUTOR_BACKEND 选择：docker（默认）或 fake（进程内模拟，用于压测与基准测试）。
+"""
+
+import threading
+
+from config import EXECUTOR_BACKEND
+
+_executor = None
+_lock = threading.Lock()
+
+
+def create_executor(backend):
+    if backend == 'docker':
+        from executors.docker import DockerExecutor
+        return DockerExecutor()
+    if backend == 'fake':
+        from executors.fake import FakeExecutor
+        return FakeExecutor()
+    raise ValueError(f'未知的执行后端: {backend}')
+
+
+def get_executor():
+    """进程内共享的执行后端（首次调用时按配置创建）。"""
+    global _executor
+    if _executor is None:
+        with _lock:
+            if _executor is None:
+                _executor = create_executor(EXECUTOR_BACKEND)
+    return _executor
+
+
+def set_executor(executor):
+    """替换进程内的执行后端（基准测试脚本使用），返回原后端。"""
+    global _executor
+    with _lock:
+        previous, _executor = _executor, executor
+    return previous
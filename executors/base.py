@@ -0,0 +1,127 @@
+"""
+评测执行后端接口
+
+worker、资源采集（container_metrics）与资源清理（docker_utils）只通过该接口操作镜像和容器，
+镜像、容器均以字符串 ID 表示，不暴露具体后端的对象。
+接口方法均为抽象方法，缺少实现的后端在创建实例时即报错；带默认实现的方法可按需覆盖。
+"""
+
+from abc import ABC, abstractmethod
+
+
+class Executor(ABC):
+    """执行后端基类：镜像加载、容器运行/等待/日志/资源采样/删除，以及维护操作。"""
+
+    name = 'base'
+
+    # -------------------- 镜像 --------------------
+
+    @abstractmethod
+    def load_image(self, tar_path):
+        """
+        加载参赛者镜像
+
+        Returns:
+            (image_id, load_stats)：load_stats 格式同 image_loader.load_image_from_tar
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def dispose_image(self, image_id, contest_id=None, participant_id=None):
+        """评测结束后处理参赛者镜像（保留该参赛者最近一次的镜像或直接删除）。"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def acquire_organizer_image(self, contest_id, tar_path):
+        """从缓存获取主办方镜像并增加引用，返回 (image_id, digest)。"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def release_organizer_image(self, digest):
+        raise NotImplementedError
+
+    @abstractmethod
+    def preload_organizer_image(self, contest_id, contest_dir):
+        """评测创建时预加载主办方镜像。"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def evict_contest(self, contest_id, contest_dir=None):
+        """评测删除时淘汰其主办方镜像与保留的参赛者镜像。"""
+        raise NotImplementedError
+
+    # -------------------- 容器 --------------------
+
+    @abstractmethod
+    def create(self, image_id, volumes, mem_limit, nano_cpus):
+        """创建（不启动）容器，禁用网络，返回 container_id。"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def watch(self, container_id):
+        """
+        注册对容器退出的等待（需在 start 之前调用）
+
+        Returns:
+            等待句柄：wait(timeout) -> bool，以及 exit_code、oom_killed 属性（见 container_events.ContainerWatch）
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def unwatch(self, container_id):
+        raise NotImplementedError
+
+    @abstractmethod
+    def start(self, container_id):
+        raise NotImplementedError
+
+    @abstractmethod
+    def stop(self, container_id, timeout=10):
+        raise NotImplementedError
+
+    @abstractmethod
+    def logs(self, container_id):
+        """
+        跟随容器输出，返回供 log_capture 共享读取线程使用的日志源
+
+        日志源提供 fileno()（可被 select）、read()（非阻塞，返回已到达的输出，可能为空）、
+        done（日志流已结束）与 close()；容器退出后日志流结束。
+        """
+        raise NotImplementedError
+
+    def container_times(self, container_id):
+        """
+        容器自身记录的启动与退出时间（需在 remove 之前调用）
+
+        Returns:
+            (started_at, finished_at)：Unix 时间戳（秒），未知时为 None
+        """
+        return None, None
+
+    @abstractmethod
+    def metrics_source(self, container_id):
+        """资源采样数据源：name、interval 属性与 read() 方法（见 container_metrics.CgroupSource）。"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def remove(self, container_id):
+        raise NotImplementedError
+
+    # -------------------- 维护 --------------------
+
+    def cleanup_images(self, max_age_hours=24):
+        """清理超期的无标签镜像，返回删除数量。"""
+        return 0
+
+    def cleanup_containers(self):
+        """清理已退出的容器，返回删除数量。"""
+        return 0
+
+    def health(self):
+        """检查后端连接（/health 调用），返回状态 dict；无需检查的后端返回 None。"""
+        return None
+
+    @abstractmethod
+    def stats(self):
+        """images_count、containers_count、running_containers、dangling_images。"""
+        raise NotImplementedError
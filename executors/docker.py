@@ -0,0 +1,181 @@
+"""
+Docker 执行后端
+
+镜像通过 image_loader 流式加载，主办方镜像由 image_cache 按内容哈希缓存，容器退出由 container_events
+的事件中心分发，资源采样优先读取 cgroup v2，不可用时回退到 Docker stats API。
+"""
+
+import logging
+from datetime import datetime, timedelta, timezone
+
+from config import PARTICIPANT_IMAGE_RETAIN
+from container_events import event_hub
+from container_metrics import CgroupSource, StatsApiSource, find_container_cgroup, DEBUG_MODE
+from docker_client import docker_clients
+from executors.base import Executor
+from executors.docker_logs import open_log_stream
+from image_cache import organizer_image_cache, participant_image_retention
+from image_loader import load_image_from_tar
+from service_metrics import images_removed_total
+
+logger = logging.getLogger(__name__)
+
+
+def _parse_docker_time(value):
+    """解析 Docker 的 RFC 3339 时间（纳秒精度、UTC），未设置（0001-01-01）时返回 None。"""
+    if not value or value.startswith('0001-'):
+        return None
+    try:
+        base, _, rest = value.rstrip('Z').partition('.')
+        fraction = ''
+        offset = ''
+        for i, ch in enumerate(rest):
+            if not ch.isdigit():
+                fraction, offset = rest[:i], rest[i:]
+                break
+        else:
+            fraction = rest
+        if not offset and '+' in base[10:]:
+            base, offset = base[:base.rindex('+')], base[base.rindex('+'):]
+        parsed = datetime.strptime(base, '%Y-%m-%dT%H:%M:%S').replace(tzinfo=timezone.utc)
+        seconds = parsed.timestamp() + (float('0.' + fraction) if fraction else 0.0)
+        if offset:
+            sign = 1 if offset[0] == '+' else -1
+            hours, _, minutes = offset[1:].partition(':')
+            seconds -= sign * (int(hours) * 3600 + int(minutes or 0) * 60)
+        return seconds
+    except (ValueError, IndexError):
+        return None
+
+
+class DockerExecutor(Executor):
+    name = 'docker'
+
+    @property
+    def client(self):
+        """短请求使用的共享客户端（长连接见 docker_clients.stream）。"""
+        return docker_clients.api
+
+    # -------------------- 镜像 --------------------
+
+    def load_image(self, tar_path):
+        image, stats = load_image_from_tar(self.client, tar_path)
+        return image.id, stats
+
+    def dispose_image(self, image_id, contest_id=None, participant_id=None):
+        if organizer_image_cache.is_cached_image(image_id):
+            return
+        if PARTICIPANT_IMAGE_RETAIN and contest_id:
+            # 保留该参赛者最近一次的镜像，让基础层留在 daemon 中供重新提交复用
+            participant_image_retention.retain(self.client, self.client.images.get(image_id), contest_id, participant_id)
+        else:
+            self.client.images.remove(image_id, force=True)
+            images_removed_total.inc(kind='participant')
+
+    def acquire_organizer_image(self, contest_id, tar_path):
+        image, digest = organizer_image_cache.acquire(self.client, contest_id, tar_path)
+        return image.id, digest
+
+    def release_organizer_image(self, digest):
+        organizer_image_cache.release(self.client, digest)
+
+    def preload_organizer_image(self, contest_id, contest_dir):
+        return organizer_image_cache.preload(self.client, contest_id, contest_dir)
+
+    def evict_contest(self, contest_id, contest_dir=None):
+        organizer_image_cache.evict_contest(self.client, contest_id, contest_dir)
+        participant_image_retention.remove_contest(self.client, contest_id)
+
+    # -------------------- 容器 --------------------
+
+    def create(self, image_id, volumes, mem_limit, nano_cpus):
+        container = self.client.containers.create(
+            image=image_id,
+            volumes=volumes,
+            network_disabled=True,
+            mem_limit=mem_limit,
+            nano_cpus=nano_cpus,
+            user='root'
+        )
+        return container.id
+
+    def watch(self, container_id):
+        return event_hub.watch(container_id)
+
+    def unwatch(self, container_id):
+        event_hub.unwatch(container_id)
+
+    def start(self, container_id):
+        self.client.api.start(container_id)
+
+    def stop(self, container_id, timeout=10):
+        self.client.api.stop(container_id, timeout=timeout)
+
+    def logs(self, container_id):
+        return open_log_stream(docker_clients.stream.api, container_id)
+
+    def container_times(self, container_id):
+        state = self.client.api.inspect_container(container_id).get('State') or {}
+        return _parse_docker_time(state.get('StartedAt')), _parse_docker_time(state.get('FinishedAt'))
+
+    def metrics_source(self, container_id):
+        cgroup_path = find_container_cgroup(container_id)
+        if cgroup_path:
+            if DEBUG_MODE:
+                print(f"[METRICS] 使用 cgroup 采集: {cgroup_path}")
+            return CgroupSource(cgroup_path)
+        return StatsApiSource(container_id, docker_clients.stream)
+
+    def remove(self, container_id):
+        self.client.api.remove_container(container_id, force=True)
+
+    # -------------------- 维护 --------------------
+
+    def cleanup_images(self, max_age_hours=24):
+        cutoff = datetime.utcnow() - timedelta(hours=max_age_hours)
+        removed_count = 0
+        for image in self.client.images.list():
+            try:
+                # 检查镜像创建时间
+                created_str = image.attrs.get('Created', '')
+                if created_str:
+                    # 处理时间格式
+                    created = datetime.fromisoformat(created_str.replace('Z', '+00:00'))
+                    # 只删除超期且无标签的镜像
+                    if created < cutoff and (not image.tags or '<none>' in str(image.tags)):
+                        logger.info(f'Removing old image: {image.short_id}')
+                        try:
+                            self.client.images.remove(image.id, force=True)
+                            images_removed_total.inc(kind='dangling')
+                            removed_count += 1
+                        except Exception as e:
+                            logger.warning(f'Failed to remove image {image.short_id}: {e}')
+            except Exception as e:
+                logger.debug(f'Error processing image: {e}')
+        return removed_count
+
+    def cleanup_containers(self):
+        removed_count = 0
+        # 移除已停止的容器
+        for container in self.client.containers.list(all=True, filters={'status': 'exited'}):
+            try:
+                logger.info(f'Removing exited container: {container.short_id}')
+                container.remove(force=True)
+                removed_count += 1
+            except Exception as e:
+                logger.warning(f'Failed to remove container: {e}')
+        return removed_count
+
+    def health(self):
+        docker_clients.check()
+        return docker_clients.status()
+
+    def stats(self):
+        images = self.client.images.list()
+        containers = self.client.containers.list(all=True)
+        return {
+            'images_count': len(images),
+            'containers_count': len(containers),
+            'running_containers': len(self.client.containers.list()),
+            'dangling_images': len([img for img in images if not img.tags or '<none>' in str(img.tags)])
+        }
@@ -0,0 +1,203 @@
+"""
+Docker 日志流的非阻塞读取
+
+跟随日志的 HTTP 响应直接在套接字上解析（响应头、chunked 编码、stdout/stderr 多路复用帧），
+套接字设为非阻塞后交给 log_capture 的共享读取线程等待，不再为每个容器占用一个线程。
+Docker API 没有同时跟随多个容器的接口，每个运行中的容器仍各有一个连接，但不占用 docker-py 的连接池。
+
+直接连接支持 unix 套接字与 tcp（含 TLS，证书配置沿用 docker-py 客户端）；SSH 等其他连接方式
+回退为 docker-py 的阻塞迭代器，由转写线程写入 PipeLogSource。
+"""
+
+import logging
+import socket
+import ssl
+import struct
+import threading
+from urllib.parse import urlencode, urlparse
+
+from log_capture import PipeLogSource, READ_CHUNK_SIZE
+
+logger = logging.getLogger(__name__)
+
+CONNECT_TIMEOUT = 10
+
+# 多路复用帧头：1 字节流类型 + 3 字节填充 + 4 字节大端长度
+STREAM_HEADER_SIZE = 8
+
+
+class DockerLogStream:
+    """单个容器的跟随日志连接（非阻塞套接字 + 增量解析）。"""
+
+    def __init__(self, sock):
+        self._sock = sock
+        self._raw = bytearray()
+        self._body = bytearray()
+        self._headers_done = False
+        self._chunked = False
+        self._chunk_left = 0
+        self.done = False
+
+    def fileno(self):
+        return self._sock.fileno()
+
+    def read(self):
+        try:
+            data = self._sock.recv(READ_CHUNK_SIZE)
+            if isinstance(self._sock, ssl.SSLSocket):
+                # TLS 记录中已解密但未取出的数据不会再触发可读事件
+                while self._sock.pending():
+                    data += self._sock.recv(self._sock.pending())
+        except (BlockingIOError, ssl.SSLWantReadError):
+            return b''
+        if not data:
+            self.done = True
+            return self._frames()
+        self._raw += data
+        if not self._headers_done and not self._parse_headers():
+            return b''
+        self._decode_body()
+        return self._frames()
+
+    def _parse_headers(self):
+        end = self._raw.find(b'\r\n\r\n')
+        if end < 0:
+            return False
+        lines = bytes(self._raw[:end]).decode('latin-1').split('\r\n')
+        del self._raw[:end + 4]
+        parts = lines[0].split(' ', 2)
+        if len(parts) < 2 or parts[1] != '200':
+            raise RuntimeError(f'Docker logs request failed: {lines[0]}')
+        for line in lines[1:]:
+            name, _, value = line.partition(':')
+            if name.strip().lower() == 'transfer-encoding' and 'chunked' in value.lower():
+                self._chunked = True
+        self._headers_done = True
+        return True
+
+    def _decode_body(self):
+        if not self._chunked:
+            self._body += self._raw
+            self._raw.clear()
+            return
+        while self._raw:
+            if self._chunk_left:
+                take = min(self._chunk_left, len(self._raw))
+                self._body += self._raw[:take]
+                del self._raw[:take]
+                self._chunk_left -= take
+                continue
+            end = self._raw.find(b'\r\n')
+            if end < 0:
+                return
+            line = bytes(self._raw[:end])
+            del self._raw[:end + 2]
+            if not line:
+                # 上一个 chunk 数据后的 CRLF
+                continue
+            size = int(line.split(b';')[0], 16)
+            if size == 0:
+                self.done = True
+                return
+            self._chunk_left = size
+
+    def _frames(self):
+        # 评测容器不分配 TTY，输出总是多路复用帧；不区分 stdout/stderr，按到达顺序拼接
+        output = bytearray()
+        body = self._body
+        while len(body) >= STREAM_HEADER_SIZE:
+            _, length = struct.unpack('>BxxxL', body[:STREAM_HEADER_SIZE])
+            if len(body) < STREAM_HEADER_SIZE + length:
+                break
+            output += body[STREAM_HEADER_SIZE:STREAM_HEADER_SIZE + length]
+            del body[:STREAM_HEADER_SIZE + length]
+        return bytes(output)
+
+    def close(self):
+        try:
+            self._sock.close()
+        except OSError:
+            pass
+
+
+def _tls_context(api):
+    """按 docker-py 客户端的 TLS 配置（verify/cert）创建 SSLContext。"""
+    verify = api.verify
+    context = ssl.create_default_context(cafile=verify if isinstance(verify, str) else None)
+    if verify is False:
+        context.check_hostname = False
+        context.verify_mode = ssl.CERT_NONE
+    if api.cert:
+        if isinstance(api.cert, (tuple, list)):
+            context.load_cert_chain(*api.cert)
+        else:
+            context.load_cert_chain(api.cert)
+    return context
+
+
+def _connect(api):
+    base_url = api.base_url
+    if base_url == 'http+docker://localhost':
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(CONNECT_TIMEOUT)
+        try:
+            sock.connect(api.get_adapter(base_url).socket_path)
+        except OSError:
+            sock.close()
+            raise
+        return sock
+    if base_url.startswith(('http://', 'https://')):
+        parsed = urlparse(base_url)
+        https = parsed.scheme == 'https'
+        sock = socket.create_connection((parsed.hostname, parsed.port or (2376 if https else 2375)), timeout=CONNECT_TIMEOUT)
+        if https:
+            try:
+                sock = _tls_context(api).wrap_socket(sock, server_hostname=parsed.hostname)
+            except (OSError, ssl.SSLError):
+                sock.close()
+                raise
+        return sock
+    return None
+
+
+def _pipe_stream(api, container_id):
+    """不支持直接连接的方式：docker-py 阻塞迭代器由转写线程写入管道。"""
+    chunks = api.logs(container_id, stream=True, follow=True, stdout=True, stderr=True)
+    source = PipeLogSource()
+
+    def pump():
+        try:
+            for chunk in chunks:
+                source.feed(chunk)
+        except Exception as e:
+            logger.warning(f'Log stream for {container_id[:12]} interrupted: {e}')
+        finally:
+            source.finish()
+
+    threading.Thread(target=pump, name=f'logs-{container_id[:12]}', daemon=True).start()
+    return source
+
+
+def open_log_stream(api, container_id):
+    """
+    跟随容器输出（stdout + stderr，从头开始），返回供共享读取线程使用的日志源
+
+    Args:
+        api: docker-py 的 APIClient
+    """
+    sock = _connect(api)
+    if sock is None:
+        return _pipe_stream(api, container_id)
+    query = urlencode({'follow': 1, 'stdout': 1, 'stderr': 1, 'timestamps': 0, 'tail': 'all'})
+    request = (
+        f'GET /v{api.api_version}/containers/{container_id}/logs?{query} HTTP/1.1\r\n'
+        f'Host: docker\r\n'
+        f'Connection: close\r\n\r\n'
+    )
+    try:
+        sock.sendall(request.encode('ascii'))
+        sock.setblocking(False)
+    except OSError:
+        sock.close()
+        raise
+    return DockerLogStream(sock)
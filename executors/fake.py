@@ -0,0 +1,286 @@
+"""
+进程内模拟执行后端（EXECUTOR_BACKEND=fake）
+
+不需要 Docker，用于压测与基准测试平台自身的开销（队列、调度、提交记录、日志、资源采样、推送）：
+- load_image 按块读取整个镜像 tar（与真实加载相同的磁盘读取量），再补足 FAKE_EXECUTOR_LOAD_SECONDS
+- 容器 start 后由事件中心的定时器在 FAKE_EXECUTOR_RUN_SECONDS（带随机抖动）后"退出"：
+  向挂载为 /output 的目录写入 results.json，参赛者写入 FAKE_EXECUTOR_OUTPUT_BYTES 字节的预测结果，
+  主办方镜像启动的容器写入带 score 指标的评测结果
+- 按 FAKE_EXECUTOR_FAILURE_RATE 的概率以退出码 1 失败；stop 以退出码 137 结束
+- 日志流与资源样本都是合成数据，格式与 Docker 后端一致
+"""
+
+import json
+import os
+import random
+import threading
+import time
+import uuid
+
+from config import (
+    FAKE_EXECUTOR_LOAD_SECONDS, FAKE_EXECUTOR_RUN_SECONDS, FAKE_EXECUTOR_JITTER,
+    FAKE_EXECUTOR_FAILURE_RATE, FAKE_EXECUTOR_OUTPUT_BYTES, CGROUP_SAMPLE_INTERVAL
+)
+from container_events import ContainerWatch, event_hub
+from executors.base import Executor
+from log_capture import PipeLogSource
+from image_cache import organizer_tar_path
+from image_loader import iter_image_tar, is_gzip_file
+from service_metrics import images_loaded_total, images_removed_total, image_load_seconds
+
+
+class _FakeContainer:
+    def __init__(self, container_id, image_id, volumes, mem_limit):
+        self.id = container_id
+        self.image_id = image_id
+        self.mem_limit = mem_limit
+        # 容器内路径 -> 宿主机路径
+        self.mounts = {spec['bind']: host for host, spec in volumes.items()}
+        self.watch = None
+        self.timer = None
+        self.started_at = None
+        self.finished_at = None
+        self.exit_code = None
+        self.removed = False
+        # 可重入：_finish 持锁时写入退出日志
+        self.lock = threading.RLock()
+        self.log_chunks = []
+        # 正在跟随该容器日志的管道（后来的跟随者先补写已有输出）
+        self.log_sources = []
+
+    @property
+    def finished(self):
+        return self.exit_code is not None
+
+    def emit(self, text, final=False):
+        chunk = text.encode('utf-8')
+        with self.lock:
+            self.log_chunks.append(chunk)
+            for source in self.log_sources:
+                source.feed(chunk)
+                if final:
+                    source.finish()
+            if final:
+                self.log_sources = []
+
+    def end_logs(self):
+        with self.lock:
+            for source in self.log_sources:
+                source.finish()
+            self.log_sources = []
+
+
+class _FakeMetricsSource:
+    """合成资源样本，字段与 container_metrics.CgroupSource.read() 一致。"""
+
+    name = 'fake'
+
+    def __init__(self, container):
+        self.container = container
+        self.interval = CGROUP_SAMPLE_INTERVAL
+        self.memory_peak = 0
+
+    def read(self):
+        container = self.container
+        if container.removed:
+            return None
+        elapsed = time.time() - container.started_at if container.started_at else 0.0
+        running = container.started_at is not None and not container.finished
+        memory = int(64 * 1024 * 1024 * (1 + random.random())) if running else 0
+        self.memory_peak = max(self.memory_peak, memory)
+        return {
+            # 运行期间约占用一个核
+            'cpu_usec': int(elapsed * 1_000_000),
+            'memory': memory,
+            'memory_peak': self.memory_peak,
+            'io': (int(elapsed * 1024 * 1024), int(elapsed * 256 * 1024)),
+            'pids': 1 if running else 0,
+        }
+
+
+class FakeExecutor(Executor):
+    name = 'fake'
+
+    def __init__(self, load_seconds=None, run_seconds=None, jitter=None, failure_rate=None, output_bytes=None):
+        self.load_seconds = FAKE_EXECUTOR_LOAD_SECONDS if load_seconds is None else load_seconds
+        self.run_seconds = FAKE_EXECUTOR_RUN_SECONDS if run_seconds is None else run_seconds
+        self.jitter = FAKE_EXECUTOR_JITTER if jitter is None else jitter
+        self.failure_rate = FAKE_EXECUTOR_FAILURE_RATE if failure_rate is None else failure_rate
+        self.output_bytes = FAKE_EXECUTOR_OUTPUT_BYTES if output_bytes is None else output_bytes
+        self._lock = threading.Lock()
+        self._containers = {}
+        self._images = set()
+        # contest_id -> 主办方镜像 ID
+        self._organizer_images = {}
+        self._loads = 0
+
+    def _duration(self, base):
+        if base <= 0:
+            return 0.0
+        return max(0.0, base * (1 + random.uniform(-self.jitter, self.jitter)))
+
+    def _get(self, container_id):
+        with self._lock:
+            container = self._containers.get(container_id)
+        if container is None:
+            raise KeyError(f'容器不存在: {container_id}')
+        return container
+
+    # -------------------- 镜像 --------------------
+
+    def load_image(self, tar_path):
+        start = time.monotonic()
+        stats = {'bytes': 0, 'compressed': is_gzip_file(tar_path)}
+        for _ in iter_image_tar(tar_path, stats=stats):
+            pass
+        remaining = self._duration(self.load_seconds) - (time.monotonic() - start)
+        if remaining > 0:
+            time.sleep(remaining)
+        seconds = time.monotonic() - start
+        stats.update({
+            'file_bytes': os.path.getsize(tar_path),
+            'seconds': round(seconds, 3),
+            'mb_per_s': round(stats['bytes'] / 1024 / 1024 / seconds, 2) if seconds > 0 else None,
+            'reused': False
+        })
+        image_id = f'fake-{uuid.uuid4().hex}'
+        with self._lock:
+            self._images.add(image_id)
+            self._loads += 1
+        return image_id, stats
+
+    def dispose_image(self, image_id, contest_id=None, participant_id=None):
+        with self._lock:
+            if image_id in self._organizer_images.values() or image_id not in self._images:
+                return
+            self._images.discard(image_id)
+        images_removed_total.inc(kind='participant')
+
+    def acquire_organizer_image(self, contest_id, tar_path):
+        with self._lock:
+            image_id = self._organizer_images.get(contest_id)
+        if image_id is None:
+            image_id, load_stats = self.load_image(tar_path)
+            images_loaded_total.inc(kind='organizer')
+            image_load_seconds.observe(load_stats['seconds'], kind='organizer')
+            with self._lock:
+                image_id = self._organizer_images.setdefault(contest_id, image_id)
+        return image_id, contest_id
+
+    def release_organizer_image(self, digest):
+        pass
+
+    def preload_organizer_image(self, contest_id, contest_dir):
+        tar_path = organizer_tar_path(contest_dir)
+        if not tar_path:
+            return None
+        return self.acquire_organizer_image(contest_id, tar_path)[1]
+
+    def evict_contest(self, contest_id, contest_dir=None):
+        with self._lock:
+            image_id = self._organizer_images.pop(contest_id, None)
+            self._images.discard(image_id)
+        if image_id is not None:
+            images_removed_total.inc(kind='organizer')
+
+    # -------------------- 容器 --------------------
+
+    def create(self, image_id, volumes, mem_limit, nano_cpus):
+        container = _FakeContainer(f'fake-{uuid.uuid4().hex}', image_id, volumes, mem_limit)
+        with self._lock:
+            self._containers[container.id] = container
+        return container.id
+
+    def watch(self, container_id):
+        container = self._get(container_id)
+        container.watch = ContainerWatch(container_id)
+        return container.watch
+
+    def unwatch(self, container_id):
+        pass
+
+    def start(self, container_id):
+        container = self._get(container_id)
+        container.started_at = time.time()
+        if container.watch is not None:
+            container.watch.started = True
+            container.watch.started_at = container.started_at
+        container.emit(f'[fake] container {container_id[:17]} started\n')
+        container.timer = event_hub.schedule(self._duration(self.run_seconds), lambda: self._finish(container))
+
+    def _finish(self, container, exit_code=None):
+        with container.lock:
+            if container.finished:
+                return
+            if exit_code is None:
+                exit_code = 1 if random.random() < self.failure_rate else 0
+                if exit_code == 0:
+                    self._write_output(container)
+            container.exit_code = exit_code
+            container.finished_at = time.time()
+            container.emit(f'[fake] exited with code {exit_code}\n', final=True)
+        if container.watch is not None:
+            container.watch._resolve(exit_code)
+
+    def _write_output(self, container):
+        output_dir = container.mounts.get('/output')
+        if not output_dir:
+            return
+        with self._lock:
+            is_organizer = container.image_id in self._organizer_images.values()
+        if is_organizer:
+            # 主办方容器：输出评测指标
+            results = {'indicator': [{'key': 'score', 'name': 'score', 'value': round(random.random(), 6)}]}
+        else:
+            results = {'predictions': 'x' * max(0, self.output_bytes - 20)}
+        with open(os.path.join(output_dir, 'results.json'), 'w', encoding='utf-8') as f:
+            json.dump(results, f)
+
+    def stop(self, container_id, timeout=10):
+        container = self._get(container_id)
+        if container.timer is not None:
+            event_hub.cancel(container.timer)
+        self._finish(container, exit_code=137)
+
+    def logs(self, container_id):
+        container = self._get(container_id)
+        source = PipeLogSource()
+        with container.lock:
+            for chunk in container.log_chunks:
+                source.feed(chunk)
+            if container.finished or container.removed:
+                source.finish()
+            else:
+                container.log_sources.append(source)
+        return source
+
+    def container_times(self, container_id):
+        container = self._get(container_id)
+        return container.started_at, container.finished_at
+
+    def metrics_source(self, container_id):
+        return _FakeMetricsSource(self._get(container_id))
+
+    def remove(self, container_id):
+        with self._lock:
+            container = self._containers.pop(container_id, None)
+        if container is None:
+            return
+        if container.timer is not None:
+            event_hub.cancel(container.timer)
+        with container.lock:
+            container.removed = True
+        container.end_logs()
+
+    # -------------------- 维护 --------------------
+
+    def stats(self):
+        with self._lock:
+            containers = list(self._containers.values())
+            return {
+                'images_count': len(self._images),
+                'containers_count': len(containers),
+                'running_containers': len([c for c in containers if c.started_at and not c.finished]),
+                'dangling_images': 0,
+                'images_loaded': self._loads
+            }
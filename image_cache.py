@@ -0,0 +1,448 @@
+"""
+主办方镜像缓存
+
+同一评测的所有提交共用一个主办方评分镜像。原先每次提交都会整包读取 tar、load 到 daemon，
+评测结束再强制删除；这里改为按 tar 内容哈希缓存：
+- 首次使用（或创建评测时预加载）时 load 一次，并打上 contest-eval/organizer:<hash> 标签常驻 daemon
+- 并发评测之间对同一镜像做引用计数，使用中的镜像不会被淘汰
+- 评测删除时淘汰对应镜像；缓存总大小超过 ORGANIZER_IMAGE_CACHE_MAX_BYTES 时按 LRU 淘汰空闲镜像
+
+另外提供参赛者镜像保留：每个参赛者在每个评测下保留最近一次提交的镜像，
+使共享的基础层留在 daemon 中，重新提交时分层感知加载只需传输变化的层。
+保留的镜像总大小超过 PARTICIPANT_IMAGE_RETAIN_MAX_BYTES 时按最近保留时间淘汰最旧的镜像。
+"""
+
+import calendar
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+import docker
+
+from config import ORGANIZER_IMAGE_CACHE_MAX_BYTES, PARTICIPANT_IMAGE_RETAIN_MAX_BYTES
+from image_loader import load_image_from_tar
+from service_metrics import images_loaded_total, images_removed_total, image_load_seconds
+from utils import parse_mem_limit
+
+logger = logging.getLogger(__name__)
+
+CACHE_REPOSITORY = 'contest-eval/organizer'
+PARTICIPANT_REPOSITORY = 'contest-eval/participant'
+
+
+def file_sha256(path, chunk_size=4 * 1024 * 1024):
+    """
+    计算文件的 sha256
+
+    结果缓存在同目录的 `<文件名>.sha256` 中，文件大小和修改时间未变化时直接复用，
+    避免每次评测都重新读取数 GB 的镜像文件。
+    """
+    stat = os.stat(path)
+    sidecar = path + '.sha256'
+    try:
+        with open(sidecar, 'r', encoding='utf-8') as f:
+            cached = json.load(f)
+        if cached.get('size') == stat.st_size and cached.get('mtime') == stat.st_mtime:
+            return cached['sha256']
+    except Exception:
+        pass
+
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            h.update(chunk)
+    digest = h.hexdigest()
+    write_sha256_sidecar(path, digest, stat)
+    return digest
+
+
+def write_sha256_sidecar(path, digest, stat=None):
+    """写入 file_sha256 使用的 `.sha256` 缓存（已在上传时边接收边计算哈希的文件可直接登记）。"""
+    try:
+        stat = stat or os.stat(path)
+        with open(path + '.sha256', 'w', encoding='utf-8') as f:
+            json.dump({'size': stat.st_size, 'mtime': stat.st_mtime, 'sha256': digest}, f)
+    except Exception:
+        pass
+
+
+def organizer_tar_path(contest_dir):
+    """从 info.json 中解析主办方镜像 tar 的路径，不存在时返回 None。"""
+    info_json_path = os.path.join(contest_dir, 'info', 'info.json')
+    if not os.path.exists(info_json_path):
+        return None
+    try:
+        with open(info_json_path, 'r', encoding='utf-8') as f:
+            info = json.load(f)
+    except Exception:
+        return None
+    image_filename = info.get('image')
+    if not image_filename:
+        return None
+    tar_path = os.path.join(contest_dir, 'info', image_filename)
+    return tar_path if os.path.exists(tar_path) else None
+
+
+class OrganizerImageCache:
+    """按 tar 内容哈希缓存主办方镜像，带引用计数与 LRU 淘汰。"""
+
+    def __init__(self, max_bytes=None):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        # digest -> {'image_id', 'tag', 'size', 'refcount', 'last_used', 'contests', 'evict_pending'}
+        self._entries = {}
+        # digest -> Lock，保证同一镜像只被加载一次
+        self._load_locks = {}
+        self._synced = False
+
+    def _tag_for(self, digest):
+        return f'{CACHE_REPOSITORY}:{digest[:16]}'
+
+    def _sync_from_daemon(self, client):
+        """进程重启后从 daemon 中恢复已缓存的镜像（引用计数为 0）。"""
+        if self._synced:
+            return
+        try:
+            for image in client.images.list(name=CACHE_REPOSITORY):
+                for tag in image.tags:
+                    if not tag.startswith(CACHE_REPOSITORY + ':'):
+                        continue
+                    short = tag.split(':', 1)[1]
+                    with self._lock:
+                        if any(d.startswith(short) for d in self._entries):
+                            continue
+                        self._entries[short] = {
+                            'image_id': image.id,
+                            'tag': tag,
+                            'size': image.attrs.get('Size', 0),
+                            'refcount': 0,
+                            'last_used': 0,
+                            'contests': set(),
+                            'evict_pending': False
+                        }
+        except Exception as e:
+            logger.warning(f'Failed to sync organizer image cache: {e}')
+        self._synced = True
+
+    def _find_entry(self, digest):
+        """按完整哈希或（重启后恢复的）16 位短哈希查找条目，需持有 _lock。"""
+        entry = self._entries.get(digest)
+        if entry is None and digest[:16] in self._entries:
+            # 把短哈希条目升级为完整哈希
+            entry = self._entries.pop(digest[:16])
+            self._entries[digest] = entry
+        return entry
+
+    def _pin(self, entry, contest_id):
+        """增加引用并关联评测，需持有 _lock。"""
+        entry['refcount'] += 1
+        entry['last_used'] = time.time()
+        entry['contests'].add(contest_id)
+        entry['evict_pending'] = False
+
+    def acquire(self, client, contest_id, tar_path):
+        """
+        获取（必要时加载）主办方镜像并增加引用计数
+
+        Returns:
+            (image, digest)：调用方用完后需以 digest 调用 release()
+        """
+        self._sync_from_daemon(client)
+        digest = file_sha256(tar_path)
+        with self._lock:
+            load_lock = self._load_locks.setdefault(digest, threading.Lock())
+
+        with load_lock:
+            with self._lock:
+                entry = self._find_entry(digest)
+                if entry:
+                    # 查找与加引用在同一临界区内完成，evict_contest / _enforce_budget 不会删除已被引用的镜像
+                    self._pin(entry, contest_id)
+            image = None
+            if entry:
+                try:
+                    image = client.images.get(entry['tag'])
+                except docker.errors.ImageNotFound:
+                    # 镜像被外部删除，重新加载
+                    with self._lock:
+                        if self._entries.get(digest) is entry:
+                            self._entries.pop(digest)
+                    entry = None
+                except Exception:
+                    with self._lock:
+                        entry['refcount'] = max(entry['refcount'] - 1, 0)
+                    raise
+
+            if entry is None:
+                tag = self._tag_for(digest)
+                try:
+                    image = client.images.get(tag)
+                except docker.errors.ImageNotFound:
+                    logger.info(f'Loading organizer image for contest {contest_id} from {tar_path}')
+                    image, load_stats = load_image_from_tar(client, tar_path)
+                    logger.info(f"Organizer image loaded in {load_stats['seconds']}s ({load_stats['mb_per_s']} MB/s)")
+                    images_loaded_total.inc(kind='organizer')
+                    image_load_seconds.observe(load_stats['seconds'], kind='organizer')
+                    repository, image_tag = tag.split(':', 1)
+                    image.tag(repository, image_tag)
+                    image.reload()
+                entry = {
+                    'image_id': image.id,
+                    'tag': tag,
+                    'size': image.attrs.get('Size', 0),
+                    'refcount': 0,
+                    'last_used': 0,
+                    'contests': set(),
+                    'evict_pending': False
+                }
+                with self._lock:
+                    self._entries[digest] = entry
+                    self._pin(entry, contest_id)
+
+        self._enforce_budget(client)
+        return image, digest
+
+    def release(self, client, digest):
+        """减少引用计数；若镜像已被标记淘汰且不再被使用则立即删除。"""
+        remove = None
+        with self._lock:
+            entry = self._entries.get(digest)
+            if not entry:
+                return
+            entry['refcount'] = max(entry['refcount'] - 1, 0)
+            entry['last_used'] = time.time()
+            if entry['refcount'] == 0 and entry['evict_pending']:
+                remove = self._entries.pop(digest)
+        if remove:
+            self._remove_image(client, remove)
+        else:
+            self._enforce_budget(client)
+
+    def preload(self, client, contest_id, contest_dir):
+        """评测创建时预加载主办方镜像（加载后立即释放引用，镜像保留在缓存中）。"""
+        tar_path = organizer_tar_path(contest_dir)
+        if not tar_path:
+            return None
+        _, digest = self.acquire(client, contest_id, tar_path)
+        self.release(client, digest)
+        return digest
+
+    def evict_contest(self, client, contest_id, contest_dir=None):
+        """
+        评测删除时调用：解除评测与镜像的关联，没有其他评测引用时删除镜像
+
+        正在被评测使用的镜像会先标记，待最后一个引用释放后再删除。
+        """
+        digest = None
+        if contest_dir:
+            tar_path = organizer_tar_path(contest_dir)
+            if tar_path:
+                try:
+                    digest = file_sha256(tar_path)
+                except Exception:
+                    digest = None
+
+        targets = []
+        with self._lock:
+            if digest:
+                self._find_entry(digest)
+            for key, entry in list(self._entries.items()):
+                matched = contest_id in entry['contests'] or (digest and key in (digest, digest[:16]))
+                if not matched:
+                    continue
+                entry['contests'].discard(contest_id)
+                if entry['contests']:
+                    continue
+                if entry['refcount'] > 0:
+                    entry['evict_pending'] = True
+                else:
+                    targets.append(self._entries.pop(key))
+        for entry in targets:
+            self._remove_image(client, entry)
+
+    def _enforce_budget(self, client):
+        """缓存总大小超过预算时按最近使用时间淘汰空闲镜像。"""
+        if not self.max_bytes:
+            return
+        targets = []
+        with self._lock:
+            total = sum(e['size'] or 0 for e in self._entries.values())
+            if total <= self.max_bytes:
+                return
+            idle = sorted(
+                ((k, e) for k, e in self._entries.items() if e['refcount'] == 0),
+                key=lambda item: item[1]['last_used']
+            )
+            for key, entry in idle:
+                if total <= self.max_bytes:
+                    break
+                total -= entry['size'] or 0
+                targets.append(self._entries.pop(key))
+        for entry in targets:
+            logger.info(f"Evicting organizer image {entry['tag']} (cache over budget)")
+            self._remove_image(client, entry)
+
+    def _remove_image(self, client, entry):
+        try:
+            client.images.remove(entry['image_id'], force=True)
+            images_removed_total.inc(kind='organizer')
+        except docker.errors.ImageNotFound:
+            pass
+        except Exception as e:
+            logger.warning(f"Failed to remove organizer image {entry['tag']}: {e}")
+
+    def is_cached_image(self, image_id):
+        """判断镜像 ID 是否属于缓存（参赛者镜像与主办方镜像内容相同时避免误删）。"""
+        with self._lock:
+            return any(e['image_id'] == image_id for e in self._entries.values())
+
+    def stats(self):
+        with self._lock:
+            return {
+                'images': len(self._entries),
+                'total_bytes': sum(e['size'] or 0 for e in self._entries.values()),
+                'max_bytes': self.max_bytes,
+                'in_use': sum(1 for e in self._entries.values() if e['refcount'] > 0)
+            }
+
+
+def _participant_tag(contest_id, participant_id):
+    # Docker 标签只允许 [A-Za-z0-9_.-]，仓库名必须小写，这里统一转小写
+    return f"{contest_id}-{participant_id or 'default'}".lower()[:128]
+
+
+def _tag_time(image):
+    """镜像最近一次打标签的时间（Unix 时间戳），未知时返回 0。"""
+    value = (image.attrs.get('Metadata') or {}).get('LastTagTime') or ''
+    try:
+        return calendar.timegm(time.strptime(value[:19], '%Y-%m-%dT%H:%M:%S'))
+    except ValueError:
+        return 0
+
+
+class ParticipantImageRetention:
+    """
+    保留的参赛者镜像：每个参赛者在每个评测下一个，总大小超过预算时按 LRU 淘汰
+
+    镜像大小按 daemon 报告的 Size 计算，包含与其他镜像共享的层，是实际占用磁盘的上限，
+    因此预算偏保守：共享基础层越多，实际保留的镜像越多。
+    """
+
+    def __init__(self, max_bytes=None):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        # 标签 -> {'image_id', 'size', 'last_used'}
+        self._entries = {}
+        self._synced = False
+
+    def _sync_from_daemon(self, client):
+        """进程重启后从 daemon 中恢复已保留的镜像，最近使用时间取最后一次打标签的时间。"""
+        if self._synced:
+            return
+        try:
+            for image in client.images.list(name=PARTICIPANT_REPOSITORY):
+                last_used = _tag_time(client.images.get(image.id))
+                for tag in image.tags:
+                    if tag.startswith(PARTICIPANT_REPOSITORY + ':'):
+                        with self._lock:
+                            self._entries.setdefault(tag, {
+                                'image_id': image.id,
+                                'size': image.attrs.get('Size', 0),
+                                'last_used': last_used
+                            })
+        except Exception as e:
+            logger.warning(f'Failed to sync retained participant images: {e}')
+        self._synced = True
+
+    def retain(self, client, image, contest_id, participant_id):
+        """
+        保留参赛者本次提交的镜像，替换该参赛者之前保留的镜像
+
+        旧镜像以非强制方式删除：与新镜像共享的层会保留，只释放不再被引用的层。
+        """
+        self._sync_from_daemon(client)
+        tag = f'{PARTICIPANT_REPOSITORY}:{_participant_tag(contest_id, participant_id)}'
+        previous_id = None
+        try:
+            previous_id = client.images.get(tag).id
+        except docker.errors.ImageNotFound:
+            pass
+
+        image.tag(PARTICIPANT_REPOSITORY, tag.split(':', 1)[1])
+        with self._lock:
+            self._entries[tag] = {
+                'image_id': image.id,
+                'size': image.attrs.get('Size', 0),
+                'last_used': time.time()
+            }
+        if previous_id and previous_id != image.id and not organizer_image_cache.is_cached_image(previous_id):
+            try:
+                client.images.remove(previous_id)
+                images_removed_total.inc(kind='participant')
+            except Exception as e:
+                logger.debug(f'Previous participant image {previous_id[:19]} kept: {e}')
+        self._enforce_budget(client, keep=tag)
+
+    def _enforce_budget(self, client, keep=None):
+        """保留镜像总大小超过预算时按最近使用时间淘汰（本次刚保留的镜像除外）。"""
+        if not self.max_bytes:
+            return
+        targets = []
+        with self._lock:
+            total = sum(e['size'] or 0 for e in self._entries.values())
+            if total <= self.max_bytes:
+                return
+            oldest = sorted(
+                ((t, e) for t, e in self._entries.items() if t != keep),
+                key=lambda item: item[1]['last_used']
+            )
+            for tag, entry in oldest:
+                if total <= self.max_bytes:
+                    break
+                total -= entry['size'] or 0
+                targets.append(tag)
+                self._entries.pop(tag)
+        for tag in targets:
+            logger.info(f'Evicting retained participant image {tag} (over budget)')
+            self._remove_tag(client, tag)
+
+    def _remove_tag(self, client, tag):
+        try:
+            client.images.remove(tag)
+            images_removed_total.inc(kind='participant')
+        except docker.errors.ImageNotFound:
+            pass
+        except Exception as e:
+            logger.warning(f'Failed to remove participant image {tag}: {e}')
+
+    def remove_contest(self, client, contest_id):
+        """删除某个评测下保留的全部参赛者镜像（评测删除时调用）。"""
+        prefix = f'{PARTICIPANT_REPOSITORY}:{contest_id.lower()}-'
+        try:
+            images = client.images.list(name=PARTICIPANT_REPOSITORY)
+        except Exception as e:
+            logger.warning(f'Failed to list participant images: {e}')
+            return
+        for image in images:
+            for tag in [t for t in image.tags if t.startswith(prefix)]:
+                with self._lock:
+                    self._entries.pop(tag, None)
+                self._remove_tag(client, tag)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'images': len(self._entries),
+                'total_bytes': sum(e['size'] or 0 for e in self._entries.values()),
+                'max_bytes': self.max_bytes
+            }
+
+
+organizer_image_cache = OrganizerImageCache(parse_mem_limit(ORGANIZER_IMAGE_CACHE_MAX_BYTES))
+participant_image_retention = ParticipantImageRetention(parse_mem_limit(PARTICIPANT_IMAGE_RETAIN_MAX_BYTES))
@@ -0,0 +1,427 @@
+"""
+容器日志流式采集
+
+容器运行期间通过 Docker logs 流（follow）把输出直接写入提交目录下的日志文件，
+不再在容器结束后把整段日志读入内存、解码、再整体写盘：
+- 总量不超过 LOG_MAX_BYTES 时日志文件与容器原始输出完全一致
+- 超过上限时保留开头一半（边采集边写盘）与结尾一半（内存中的滑动窗口，结束时写盘），
+  中间插入截断标记说明省略的字节数
+正在采集的日志登记在进程内注册表中，供 tail 接口按字节偏移增量读取。
+
+所有容器的日志流由一个共享读取线程（LogReader）用 selectors 等待，可读时非阻塞读取后写入
+对应的 LogCapture，不再为每个容器启动一个线程。执行后端的 logs() 返回“日志源”：
+fileno() 可被 select，read() 非阻塞返回已到达的输出（可能为空），读完后 done 为 True，close() 释放。
+
+tail 的偏移始终是容器原始输出中的字节偏移：采集结束后按文件中的截断标记把原始偏移换算为文件位置，
+客户端在采集结束前后、服务重启前后都使用同一套偏移。
+"""
+
+import logging
+import os
+import re
+import selectors
+import threading
+
+from config import LOG_MAX_BYTES
+from container_events import event_hub
+from utils import parse_mem_limit
+
+logger = logging.getLogger(__name__)
+
+# 采集结束后在注册表中保留的时间（秒），让正在 tail 的客户端读完最后一段输出
+TAIL_GRACE_SECONDS = 60
+
+# 日志文件绝对路径 -> LogCapture
+_active_captures = {}
+_registry_lock = threading.Lock()
+
+# 每次从日志源读取的最大字节数
+READ_CHUNK_SIZE = 64 * 1024
+
+_MARKER_PATTERN = re.compile(r'\n\n\.\.\.\[日志超过 (\d+) 字节上限，中间省略 (\d+) 字节\]\.\.\.\n\n'.encode('utf-8'))
+
+
+def _truncation_marker(max_bytes, dropped):
+    return f'\n\n...[日志超过 {max_bytes} 字节上限，中间省略 {dropped} 字节]...\n\n'.encode('utf-8')
+
+
+def _utf8_safe_end(data):
+    """返回不会截断 UTF-8 多字节字符的结束位置。"""
+    for back in range(1, min(4, len(data)) + 1):
+        byte = data[-back]
+        if byte & 0xC0 == 0x80:
+            continue
+        if byte >= 0xC0:
+            length = 2 if byte < 0xE0 else 3 if byte < 0xF0 else 4
+            if length > back:
+                return len(data) - back
+        break
+    return len(data)
+
+
+def _utf8_trim(data, limit, live_end=False):
+    """
+    去掉读取结果结尾不完整的 UTF-8 字符，留到下一次读取
+
+    只在读取被 limit 截断、或读到仍在写入的末尾（live_end）时裁剪；读到头部结尾或文件结尾时原样返回。
+    limit 小于一个字符导致裁剪后为空时也原样返回，保证偏移总能前进。
+    """
+    if len(data) < limit and not live_end:
+        return data
+    end = _utf8_safe_end(data)
+    if end == 0 and len(data) >= limit:
+        return data
+    return data[:end]
+
+
+class PipeLogSource:
+    """
+    管道日志源：生产方调用 feed() 写入、finish() 结束，共享读取线程从管道读端非阻塞读取
+
+    用于模拟执行后端，以及只能通过阻塞迭代器读取日志的 Docker 连接方式（由转写线程调用 feed）。
+    """
+
+    def __init__(self):
+        self._read_fd, self._write_fd = os.pipe()
+        os.set_blocking(self._read_fd, False)
+        self._write_lock = threading.Lock()
+        self.done = False
+
+    def fileno(self):
+        return self._read_fd
+
+    def feed(self, data):
+        with self._write_lock:
+            if self._write_fd is None:
+                return
+            try:
+                view = memoryview(data)
+                while view:
+                    view = view[os.write(self._write_fd, view):]
+            except OSError:
+                # 读端已关闭（采集已结束），丢弃剩余输出
+                os.close(self._write_fd)
+                self._write_fd = None
+
+    def finish(self):
+        with self._write_lock:
+            if self._write_fd is not None:
+                os.close(self._write_fd)
+                self._write_fd = None
+
+    def read(self):
+        try:
+            data = os.read(self._read_fd, READ_CHUNK_SIZE)
+        except BlockingIOError:
+            return b''
+        if not data:
+            self.done = True
+        return data
+
+    def close(self):
+        # 先关闭读端，阻塞在 feed() 中的写入方会立即收到 EPIPE 并释放写锁
+        if self._read_fd is not None:
+            os.close(self._read_fd)
+            self._read_fd = None
+        self.finish()
+
+
+class LogReader:
+    """
+    进程内共享的日志读取线程
+
+    add() / discard() 通过命令列表与唤醒管道交给读取线程执行，selector 只在读取线程内修改。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._commands = []
+        self._selector = None
+        self._wake_read = None
+        self._wake_write = None
+        self._thread = None
+
+    def add(self, source, capture, name):
+        self._submit(('add', source, capture, name))
+
+    def discard(self, capture):
+        """停止跟随该采集的日志流（容器未按时关闭日志流时由 LogCapture.close 调用）。"""
+        self._submit(('discard', capture))
+
+    def _submit(self, command):
+        with self._lock:
+            self._commands.append(command)
+            if self._thread is None:
+                self._selector = selectors.DefaultSelector()
+                self._wake_read, self._wake_write = os.pipe()
+                os.set_blocking(self._wake_read, False)
+                os.set_blocking(self._wake_write, False)
+                self._selector.register(self._wake_read, selectors.EVENT_READ)
+                self._thread = threading.Thread(target=self._run, name='log-reader', daemon=True)
+                self._thread.start()
+        try:
+            os.write(self._wake_write, b'\0')
+        except BlockingIOError:
+            # 管道已满说明读取线程已有待处理的唤醒
+            pass
+
+    def _run(self):
+        while True:
+            for key, _ in self._selector.select():
+                if key.data is None:
+                    self._apply_commands()
+                else:
+                    self._read(key.fileobj, *key.data)
+
+    def _apply_commands(self):
+        try:
+            while os.read(self._wake_read, 4096):
+                pass
+        except BlockingIOError:
+            pass
+        with self._lock:
+            commands, self._commands = self._commands, []
+        for command in commands:
+            if command[0] == 'add':
+                _, source, capture, name = command
+                try:
+                    self._selector.register(source, selectors.EVENT_READ, (capture, name))
+                except (OSError, ValueError) as e:
+                    logger.warning(f'Log stream for {name} could not be followed: {e}')
+                    self._finish(source, capture)
+            else:
+                capture = command[1]
+                for key in list(self._selector.get_map().values()):
+                    if key.data is not None and key.data[0] is capture:
+                        self._finish(key.fileobj, capture)
+
+    def _read(self, source, capture, name):
+        try:
+            data = source.read()
+        except Exception as e:
+            logger.warning(f'Log stream for {name} interrupted: {e}')
+            self._finish(source, capture)
+            return
+        if data:
+            capture.write(data)
+        if source.done or not capture.running:
+            self._finish(source, capture)
+
+    def _finish(self, source, capture):
+        try:
+            self._selector.unregister(source)
+        except (KeyError, ValueError):
+            pass
+        try:
+            source.close()
+        except Exception:
+            pass
+        capture._stream_done.set()
+
+
+log_reader = LogReader()
+
+
+class LogCapture:
+    """单个容器日志文件的采集状态（头部写盘 + 尾部滑动窗口）。"""
+
+    def __init__(self, path, max_bytes=None):
+        self.path = os.path.abspath(path)
+        if max_bytes is None:
+            max_bytes = parse_mem_limit(LOG_MAX_BYTES) or 0
+        self.max_bytes = max_bytes
+        # 上限为 0 表示不限制，全部直接写盘
+        self.head_limit = max_bytes // 2 if max_bytes else None
+        self.tail_limit = max_bytes - self.head_limit if max_bytes else None
+
+        self.total = 0
+        self.dropped = 0
+        self.running = True
+        self._head_written = 0
+        self._head_full = False
+        self._tail = bytearray()
+        self._lock = threading.Lock()
+        # 没有跟随日志流时 wait() 立即返回
+        self._stream_done = threading.Event()
+        self._stream_done.set()
+
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._file = open(self.path, 'wb')
+        with _registry_lock:
+            _active_captures[self.path] = self
+
+    @property
+    def truncated(self):
+        return self.dropped > 0
+
+    # -------------------- 写入 --------------------
+
+    def write(self, data):
+        if not data:
+            return
+        with self._lock:
+            if not self.running:
+                return
+            self.total += len(data)
+            if self.head_limit is None:
+                self._file.write(data)
+                self._head_written += len(data)
+                return
+            if not self._head_full:
+                room = self.head_limit - self._head_written
+                head = data[:room]
+                if len(data) >= room:
+                    # 头部写满：在字符边界处结束，被切开的多字节字符整体归入尾部，尾部窗口相应加长
+                    head = head[:_utf8_safe_end(head)]
+                    self._head_full = True
+                    self.tail_limit = self.max_bytes - self._head_written - len(head)
+                self._file.write(head)
+                self._head_written += len(head)
+                data = data[len(head):]
+            if data:
+                self._tail += data
+                excess = len(self._tail) - self.tail_limit
+                if excess > 0:
+                    del self._tail[:excess]
+                    self.dropped += excess
+
+    def note(self, text):
+        """追加一行平台自身的说明（OOM、未生成 results.json、异常回溯等）。"""
+        self.write(('\n' + text if self.total else text).encode('utf-8'))
+
+    def follow(self, source, name='container'):
+        """把执行后端 logs() 返回的日志源交给共享读取线程，直到日志流结束。"""
+        self._stream_done.clear()
+        log_reader.add(source, self, name)
+
+    def wait(self, timeout=None):
+        """等待日志流结束（容器退出后 Docker 会关闭日志流）。"""
+        self._stream_done.wait(timeout)
+
+    def close(self):
+        """结束采集：写入截断标记与尾部窗口，关闭文件，宽限期后从注册表移除。"""
+        with self._lock:
+            if not self.running:
+                return
+            if self.dropped:
+                self._file.write(_truncation_marker(self.max_bytes, self.dropped))
+            self._file.write(self._tail)
+            self._tail = bytearray()
+            self._file.close()
+            self.running = False
+        if not self._stream_done.is_set():
+            log_reader.discard(self)
+        event_hub.schedule(TAIL_GRACE_SECONDS, self._unregister)
+
+    def _unregister(self):
+        with _registry_lock:
+            if _active_captures.get(self.path) is self:
+                _active_captures.pop(self.path, None)
+
+    # -------------------- 读取 --------------------
+
+    def read(self, offset, limit):
+        """
+        按原始输出流中的字节偏移读取
+
+        Returns:
+            dict：offset（实际起始偏移）、next_offset、data（bytes）、skipped（因截断跳过的字节数）
+        """
+        with self._lock:
+            if not self.running:
+                return None
+            offset = max(0, min(offset, self.total))
+            skipped = 0
+            if offset < self._head_written:
+                self._file.flush()
+                with open(self.path, 'rb') as f:
+                    f.seek(offset)
+                    data = f.read(min(limit, self._head_written - offset))
+                live_end = not self._head_full and offset + len(data) == self._head_written
+            else:
+                tail_start = self.total - len(self._tail)
+                if offset < tail_start:
+                    skipped = tail_start - offset
+                    offset = tail_start
+                start = offset - tail_start
+                data = bytes(self._tail[start:start + limit])
+                live_end = start + len(data) == len(self._tail)
+        data = _utf8_trim(data, limit, live_end)
+        return {'offset': offset, 'next_offset': offset + len(data), 'data': data, 'skipped': skipped}
+
+
+def tail_log(path, offset=0, limit=64 * 1024):
+    """
+    增量读取日志，offset 为容器原始输出中的字节偏移（采集中与采集结束后一致）
+
+    Returns:
+        dict：offset、next_offset、data（str）、skipped、running、truncated；文件不存在时返回 None
+    """
+    path = os.path.abspath(path)
+    with _registry_lock:
+        capture = _active_captures.get(path)
+    if capture is not None:
+        result = capture.read(offset, limit)
+        if result is not None:
+            result['running'] = True
+            result['truncated'] = capture.truncated
+            result['data'] = result['data'].decode('utf-8', errors='replace')
+            return result
+    # 采集已结束（或服务重启后）：按文件读取，同时告知客户端采集已结束
+    return _read_file(path, offset, limit)
+
+
+def _truncation_layout(f, size):
+    """
+    已结束的截断日志中标记的位置：(头部长度, 标记长度, 省略字节数)，未截断时返回 None
+
+    截断时文件为 头部 + 标记 + 尾部（头部与尾部共 max 字节），头部在 max/2 处或其前
+    不超过 3 字节的字符边界处结束；在文件中部附近查找标记并校验位置与文件大小。
+    """
+    window_start = max(0, size // 2 - 256)
+    f.seek(window_start)
+    window = f.read(512)
+    for match in _MARKER_PATTERN.finditer(window):
+        max_bytes, dropped = int(match.group(1)), int(match.group(2))
+        head = window_start + match.start()
+        marker_len = match.end() - match.start()
+        if max_bytes // 2 - 3 <= head <= max_bytes // 2 and size == max_bytes + marker_len:
+            return head, marker_len, dropped
+    return None
+
+
+def _read_file(path, offset, limit):
+    if not os.path.exists(path):
+        return None
+    size = os.path.getsize(path)
+    skipped = 0
+    with open(path, 'rb') as f:
+        layout = _truncation_layout(f, size)
+        if layout is None:
+            offset = max(0, min(offset, size))
+            f.seek(offset)
+            data = f.read(limit)
+        else:
+            # 原始偏移 -> 文件位置：头部原样对应，省略部分跳到尾部开头，尾部整体前移
+            head, marker_len, dropped = layout
+            offset = max(0, min(offset, size - marker_len + dropped))
+            if offset < head:
+                f.seek(offset)
+                data = f.read(min(limit, head - offset))
+            else:
+                tail_start = head + dropped
+                if offset < tail_start:
+                    skipped = tail_start - offset
+                    offset = tail_start
+                f.seek(offset - dropped + marker_len)
+                data = f.read(limit)
+    # 读到头部结尾时返回剩余字节，下一次读取从尾部开头继续
+    data = _utf8_trim(data, limit)
+    return {
+        'offset': offset,
+        'next_offset': offset + len(data),
+        'data': data.decode('utf-8', errors='replace'),
+        'skipped': skipped,
+        'running': False,
+        'truncated': layout is not None
+    }
@@ -1,29 +1,281 @@
 import os
 import json
 import time
+import threading
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
 from worker import run_worker
-from task_queue import dequeue_task
-from services.submissions import update_submission_status
+from task_queue import dequeue_task, complete_task, extend_lease, recover_leased_tasks, queue_head, queue_size
+from services.submissions import update_submission_status, extract_score, contest_journal
+from services.leaderboard import leaderboards, ranking_fields
+from container_metrics import save_runtime_series
+from container_events import event_hub
+from docker_client import docker_clients
+from service_metrics import (
+    submissions_total, queue_wait_seconds as queue_wait_histogram, participant_runtime_seconds,
+    organizer_runtime_seconds
+)
+from submission_events import publish_queue_cursor, publish_result
+from config import (
+    PARTICIPANT_CPU_CORES,
+    PARTICIPANT_MEM_LIMIT,
+    ORGANIZER_CPU_CORES,
+    ORGANIZER_MEM_LIMIT,
+    EVAL_CONCURRENCY,
+    HOST_CPU_RESERVE,
+    HOST_MEM_RESERVE,
+    QUEUE_VISIBILITY_TIMEOUT,
+)
+from utils import parse_mem_limit, get_host_memory, get_host_load
 
 
-def run_queue_worker():
-    print('[Queue Runner] started')
-    while True:
+# 租约续期的 SQLite 写入可能等待写锁（busy_timeout），在单独的线程中执行，不阻塞事件中心的定时器线程
+_lease_renewals = ThreadPoolExecutor(max_workers=1, thread_name_prefix='lease-renew')
+
+
+class LeaseKeeper:
+    """
+    评测运行期间的租约续期
+
+    通过事件中心的定时器每 QUEUE_VISIBILITY_TIMEOUT/3 秒延长一次租约，运行时间超过可见性超时的评测
+    不会被其他线程出队时回收、重复评测；进程崩溃后不再续期，租约照常到期后重新入队。
+    定时器只负责把续期交给续期线程，数据库写入不在定时器线程中执行。
+    """
+
+    def __init__(self, task, interval=None):
+        self.task = task
+        self.interval = interval or max(QUEUE_VISIBILITY_TIMEOUT / 3, 1)
+        self._lock = threading.Lock()
+        self._handle = None
+        self._stopped = False
+
+    def start(self):
+        self._schedule()
+        return self
+
+    def _schedule(self):
+        with self._lock:
+            if not self._stopped:
+                self._handle = event_hub.schedule(self.interval, self._submit_renewal)
+
+    def _submit_renewal(self):
+        _lease_renewals.submit(self._renew)
+
+    def _renew(self):
+        with self._lock:
+            if self._stopped:
+                return
+        try:
+            if not extend_lease(self.task):
+                print(f'[Queue Runner] lease of task {self.task.get("submission_id")} was lost')
+                return
+        except Exception as e:
+            print(f'[Queue Runner] failed to extend lease of task {self.task.get("submission_id")}: {e}')
+        self._schedule()
+
+    def stop(self):
+        with self._lock:
+            self._stopped = True
+            if self._handle is not None:
+                event_hub.cancel(self._handle)
+
+
+def fail_dead_tasks(tasks):
+    """超过最大投递次数被放弃（标记为 dead）的任务：提交状态置为执行出错，不再停留在评测中。"""
+    for task in tasks:
+        submission_id = task.get('submission_id')
+        print(f'[Queue Runner] task {submission_id} abandoned after {task.get("_attempts")} attempt(s)')
         try:
-            task = dequeue_task()
-            if task:
-                process_task(task)
-            else:
-                time.sleep(1)
+            update_submission_status(
+                task.get('contest_id'), submission_id, 3,
+                f'评测多次中断（已尝试 {task.get("_attempts")} 次），已放弃'
+            )
+            submissions_total.inc(status_code=3)
         except Exception as e:
-            print(f'[Queue Runner] error: {e}')
-            time.sleep(2)
+            print(f'[Queue Runner] failed to update status of abandoned task {submission_id}: {e}')
+
+
+class EvaluationScheduler:
+    """
+    资源感知的并发评测调度器
+
+    参赛方与主办方容器在同一任务内串行执行，因此单个任务占用的预算取两者 CPU/内存限制的较大值。
+    只有当「已预留资源 + 本任务」不超过宿主机预算、且实时读数（可用内存、系统负载）允许时才从队列取任务；
+    没有任务在运行时总是放行一个，避免预算配置过小导致队列永久阻塞。
+    """
+
+    def __init__(self, concurrency=None):
+        self.task_cpu = max(PARTICIPANT_CPU_CORES, ORGANIZER_CPU_CORES)
+        self.task_mem = max(parse_mem_limit(PARTICIPANT_MEM_LIMIT) or 0, parse_mem_limit(ORGANIZER_MEM_LIMIT) or 0)
+
+        host_cpu = os.cpu_count() or 1
+        host_mem_total, _ = get_host_memory()
+        self.mem_reserve = parse_mem_limit(HOST_MEM_RESERVE) or 0
+        self.cpu_budget = max(host_cpu - HOST_CPU_RESERVE, 1)
+        self.mem_budget = max(host_mem_total - self.mem_reserve, 0) if host_mem_total else None
+
+        if concurrency is None:
+            concurrency = EVAL_CONCURRENCY
+        if concurrency <= 0:
+            concurrency = max(self.cpu_budget // max(self.task_cpu, 1), 1)
+            if self.mem_budget is not None and self.task_mem:
+                concurrency = min(concurrency, max(self.mem_budget // self.task_mem, 1))
+        self.concurrency = int(concurrency)
+
+        self._cond = threading.Condition()
+        self._running = {}
+        self._cpu_reserved = 0
+        self._mem_reserved = 0
+        self._executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='eval')
+
+    def _can_admit(self):
+        """判断当前是否还能再接纳一个任务（调用方需持有 _cond）。"""
+        if not self._running:
+            return True
+        if len(self._running) >= self.concurrency:
+            return False
+        if self._cpu_reserved + self.task_cpu > self.cpu_budget:
+            return False
+        if self.mem_budget is not None and self._mem_reserved + self.task_mem > self.mem_budget:
+            return False
+
+        # 实时读数：可用内存需能容纳本任务的内存上限；
+        # 系统负载中包含本调度器已运行容器的占用，扣除已预留核心后再判断是否过载
+        _, mem_available = get_host_memory()
+        if mem_available is not None and mem_available - self.mem_reserve < self.task_mem:
+            return False
+        load = get_host_load()
+        if load is not None and load + self.task_cpu > self.cpu_budget + self._cpu_reserved:
+            return False
+        return True
+
+    def run(self):
+        while True:
+            try:
+                with self._cond:
+                    while not self._can_admit():
+                        self._cond.wait(timeout=1)
+
+                task = dequeue_task(on_dead=fail_dead_tasks)
+                if not task:
+                    time.sleep(1)
+                    continue
+
+                key = task.get('_queue_id') or task.get('submission_id')
+                with self._cond:
+                    self._running[key] = {
+                        'submission_id': task.get('submission_id'),
+                        'contest_id': task.get('contest_id'),
+                        'started_at': time.time()
+                    }
+                    self._cpu_reserved += self.task_cpu
+                    self._mem_reserved += self.task_mem
+                self._executor.submit(self._run_task, key, task)
+                # 出队后其余排队任务的位置前移，只推送队头游标
+                publish_queue_cursor(queue_size(), queue_head())
+            except Exception as e:
+                print(f'[Queue Runner] error: {e}')
+                time.sleep(2)
+
+    def _run_task(self, key, task):
+        lease = LeaseKeeper(task).start()
+        try:
+            process_task(task)
+            # 处理完成后确认任务；若进程中途崩溃，租约到期后任务会自动重新入队
+            complete_task(task)
+        except Exception as e:
+            print(f'[Queue Runner] task {task.get("submission_id")} failed: {e}')
+        finally:
+            lease.stop()
+            with self._cond:
+                self._running.pop(key, None)
+                self._cpu_reserved -= self.task_cpu
+                self._mem_reserved -= self.task_mem
+                self._cond.notify_all()
+
+    def status(self):
+        with self._cond:
+            running = len(self._running)
+            return {
+                'concurrency': self.concurrency,
+                'running': running,
+                'slots_free': max(self.concurrency - running, 0),
+                'task_cpu': self.task_cpu,
+                'task_mem_bytes': self.task_mem,
+                'cpu_budget': self.cpu_budget,
+                'cpu_reserved': self._cpu_reserved,
+                'mem_budget_bytes': self.mem_budget,
+                'mem_reserved_bytes': self._mem_reserved,
+                'running_tasks': [dict(v) for v in self._running.values()]
+            }
+
+
+_scheduler = None
+
+
+def get_scheduler_status():
+    """返回调度器的并发度与槽位占用情况；调度器尚未启动时返回 None。"""
+    if _scheduler is None:
+        return None
+    return _scheduler.status()
+
+
+def run_queue_worker(concurrency=None):
+    global _scheduler
+    _scheduler = EvaluationScheduler(concurrency)
+    status = _scheduler.status()
+    # Docker 连接池按并发评测数调整（每个评测占用日志与 stats 长连接）
+    docker_clients.configure(status['concurrency'])
+    print(f"[Queue Runner] started (concurrency={status['concurrency']}, "
+          f"cpu_budget={status['cpu_budget']}, task_cpu={status['task_cpu']})")
+    try:
+        recovered = recover_leased_tasks(on_dead=fail_dead_tasks)
+        if recovered:
+            print(f'[Queue Runner] requeued {recovered} unfinished task(s) from previous run')
+    except Exception as e:
+        print(f'[Queue Runner] failed to recover leased tasks: {e}')
+
+    _scheduler.run()
+
+
+def queue_wait_seconds(task):
+    """任务从入队（enqueued_at，UTC）到开始处理的等待时间，重试的任务包含之前各次尝试的耗时。"""
+    try:
+        enqueued_at = datetime.fromisoformat(task['enqueued_at'])
+    except (KeyError, TypeError, ValueError):
+        return None
+    return round(max(0.0, (datetime.utcnow() - enqueued_at).total_seconds()), 4)
+
+
+def collect_timings(task, result, queue_wait, started):
+    """
+    汇总提交的分阶段耗时（秒）：queue_wait、worker 各阶段（见 worker.PhaseTimer）与 process_total
+
+    worker 的 total 记为 worker_total；process_total 为 process_task 从开始到结果保存完成的耗时。
+    """
+    timings = {'queue_wait': queue_wait}
+    phases = dict(result.get('phases') or {})
+    if 'total' in phases:
+        phases['worker_total'] = phases.pop('total')
+    timings.update(phases)
+    timings['process_total'] = round(time.monotonic() - started, 4)
+    return timings
+
+
+def record_metrics(status_code, timings):
+    """更新 /metrics 的提交计数与耗时直方图（容器运行时间优先使用容器自身的 StartedAt/FinishedAt）。"""
+    submissions_total.inc(status_code=status_code)
+    queue_wait_histogram.observe(timings.get('queue_wait'))
+    participant_runtime_seconds.observe(timings.get('container_runtime', timings.get('participant_run')))
+    organizer_runtime_seconds.observe(timings.get('organizer_container_runtime', timings.get('organizer_run')))
 
 
 def process_task(task):
     submission_id = task.get('submission_id')
     contest_id = task.get('contest_id')
     print(f'[Queue Runner] processing task {submission_id}')
+    queue_wait = queue_wait_seconds(task)
+    started = time.monotonic()
 
     update_submission_status(contest_id, submission_id, 'RUNNING', '评测中...')
 
@@ -35,16 +287,35 @@ def process_task(task):
             input_dir=task['input_dir'],
             contest_dir=task['contest_dir'],
             timeout=300,
-            participant_id=task.get('participant_id')
+            participant_id=task.get('participant_id'),
+            log_dir=task['submission_dir']
         )
     except Exception as e:
-        result = {'code': 3, 'desc': f'执行异常: {str(e)}'}
+        result = {'code': 3, 'desc': f'执行异常: {str(e)}', 'participant_logs': f'执行异常: {str(e)}'}
 
     save_logs_and_results(task, result)
+    timings = collect_timings(task, result, queue_wait, started)
 
     status_code = result.get('code', 3)
     status_desc = result.get('desc', '执行出错')
-    update_submission_status(contest_id, submission_id, status_code, status_desc)
+    extra = {'timings': timings}
+    if result.get('image_load'):
+        extra['image_load'] = result['image_load']
+    # 摘要字段写入提交索引，列表接口无需再读取各提交的结果文件
+    organizer_results = result.get('organizer_results')
+    extra['score'] = extract_score(organizer_results)
+    if isinstance(organizer_results, dict):
+        extra['runtime'] = (organizer_results.get('runtimeInfo') or {}).get('runtime')
+        extra.update(ranking_fields(organizer_results))
+    record_metrics(status_code, timings)
+    publish_result(contest_id, submission_id, result.get('organizer_results'))
+    update_submission_status(contest_id, submission_id, status_code, status_desc, extra)
+    try:
+        record = contest_journal(contest_id).get(submission_id)
+        if record is not None:
+            leaderboards.record_result(contest_id, record)
+    except Exception as e:
+        print(f'[Queue Runner] failed to update leaderboard for {submission_id}: {e}')
 
     print(f'[Queue Runner] finished task {submission_id} -> {status_code}')
 
@@ -52,9 +323,11 @@ def process_task(task):
 def save_logs_and_results(task, result):
     submission_dir = task['submission_dir']
     try:
-        participant_logs_path = os.path.join(submission_dir, 'participant_logs.txt')
-        with open(participant_logs_path, 'w', encoding='utf-8') as f:
-            f.write(result.get('participant_logs', ''))
+        # 容器日志已在运行期间由 worker 直接写入提交目录，这里只处理 worker 未能运行时的说明
+        if result.get('participant_logs'):
+            participant_logs_path = os.path.join(submission_dir, 'participant_logs.txt')
+            with open(participant_logs_path, 'w', encoding='utf-8') as f:
+                f.write(result.get('participant_logs', ''))
 
         if result.get('organizer_logs'):
             organizer_logs_path = os.path.join(submission_dir, 'organizer_logs.txt')
@@ -65,6 +338,9 @@ def save_logs_and_results(task, result):
             organizer_results_path = os.path.join(submission_dir, 'organizer_results.json')
             with open(organizer_results_path, 'w', encoding='utf-8') as f:
                 json.dump(result.get('organizer_results'), f, ensure_ascii=False, indent=2)
+
+        if result.get('runtime_series'):
+            save_runtime_series(os.path.join(submission_dir, 'runtime_series.json'), result['runtime_series'])
     except Exception as e:
         print(f'[Queue Runner] failed to save artifacts: {e}')
 
@@ -0,0 +1,109 @@
+"""
+回收历史提交中的 input 目录
+
+旧版本在每次提交时把 dataset/source 完整复制到 submission_<ts>/input，但评测容器实际挂载的是
+共享数据源，这些副本只占用磁盘。本工具遍历 BASE_DIR 下所有评测的提交目录并删除 input 副本：
+- 已经是硬链接的文件不会释放空间，统计时按实际独占的字节数计算
+- 仍处于排队/运行中的提交会被跳过
+
+用法：
+    python reclaim_inputs.py            # 仅统计（dry-run）
+    python reclaim_inputs.py --apply    # 实际删除
+"""
+
+import argparse
+import os
+import shutil
+
+from config import BASE_DIR
+from services.journal import SubmissionJournal, has_submission_records
+
+ACTIVE_STATUSES = {'QUEUED', 'RUNNING'}
+
+
+def _active_submission_ids(evaluation_dir):
+    """读取提交记录（submissions.json 快照 + 追加日志），返回仍在排队或运行中的提交 ID。"""
+    active = set()
+    submissions_json = os.path.join(evaluation_dir, 'submissions.json')
+    if not has_submission_records(submissions_json):
+        return active
+    for sub in SubmissionJournal(submissions_json).records():
+        if sub.get('status_code') in ACTIVE_STATUSES:
+            active.add(str(sub.get('submission_id')))
+    return active
+
+
+def _iter_input_dirs(base_dir):
+    """遍历所有提交目录下的 input（包含旧版按参赛者分目录的布局）。"""
+    if not os.path.exists(base_dir):
+        return
+    for contest_id in sorted(os.listdir(base_dir)):
+        evaluation_dir = os.path.join(base_dir, contest_id, 'evaluation')
+        if not os.path.isdir(evaluation_dir):
+            continue
+        active = _active_submission_ids(evaluation_dir)
+        for parent in os.listdir(evaluation_dir):
+            parent_dir = os.path.join(evaluation_dir, parent)
+            if not os.path.isdir(parent_dir):
+                continue
+            for name in os.listdir(parent_dir):
+                if not name.startswith('submission_'):
+                    continue
+                input_dir = os.path.join(parent_dir, name, 'input')
+                if os.path.isdir(input_dir):
+                    submission_id = name[len('submission_'):]
+                    yield contest_id, submission_id, input_dir, submission_id in active
+
+
+def _reclaimable_bytes(path):
+    """统计目录中只被本目录引用（链接数为 1）的文件字节数。"""
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                st = os.lstat(os.path.join(root, name))
+            except OSError:
+                continue
+            if st.st_nlink <= 1:
+                total += st.st_size
+    return total
+
+
+def reclaim(base_dir=BASE_DIR, apply=False):
+    """
+    回收 input 目录
+
+    Returns:
+        dict: dirs（发现的目录数）、removed、skipped_active、bytes（可回收/已回收字节数）
+    """
+    summary = {'dirs': 0, 'removed': 0, 'skipped_active': 0, 'bytes': 0}
+    for contest_id, submission_id, input_dir, is_active in _iter_input_dirs(base_dir):
+        summary['dirs'] += 1
+        if is_active:
+            summary['skipped_active'] += 1
+            continue
+        size = _reclaimable_bytes(input_dir)
+        summary['bytes'] += size
+        action = 'remove' if apply else 'would remove'
+        print(f'[{contest_id}] submission_{submission_id}: {action} input ({size / 1024 / 1024:.1f} MB)')
+        if apply:
+            shutil.rmtree(input_dir, ignore_errors=True)
+            summary['removed'] += 1
+    return summary
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='回收历史提交中复制的 input 目录')
+    parser.add_argument('--base-dir', default=BASE_DIR, help='评测数据根目录（默认取 BASE_DIR）')
+    parser.add_argument('--apply', action='store_true', help='实际删除（默认只统计）')
+    args = parser.parse_args()
+
+    result = reclaim(args.base_dir, apply=args.apply)
+    candidates = result['dirs'] - result['skipped_active']
+    print('=' * 50)
+    if args.apply:
+        print(f"已删除 input 目录: {result['removed']}，跳过排队/运行中: {result['skipped_active']}")
+        print(f"已回收空间: {result['bytes'] / 1024 / 1024 / 1024:.2f} GB")
+    else:
+        print(f"可删除 input 目录: {candidates}，跳过排队/运行中: {result['skipped_active']}")
+        print(f"可回收空间: {result['bytes'] / 1024 / 1024 / 1024:.2f} GB（使用 --apply 实际删除）")
@@ -65,7 +65,7 @@ def add_runtime_info(result_obj, participant_metrics, participant_runtime, debug
     
     Args:
         result_obj (dict): 主办方结果对象
-        participant_metrics (dict): 容器运行指标 {'cpu_peak': ..., 'memory_peak': ...}
+        participant_metrics (dict): 容器运行指标（ContainerMetricsCollector.get_summary() 的返回值）
         participant_runtime (float): 运行时间（秒）
         debug (bool): 是否启用调试输出
         
@@ -88,10 +88,19 @@ def add_runtime_info(result_obj, participant_metrics, participant_runtime, debug
     if debug:
         print(f"[RUNTIME_INFO] 提取的值 - CPU: {cpu_peak}, Memory: {memory_peak}")
     
+    # cpu / memory / runtime 为前端与报告使用的原有字段，其余为完整的资源画像
     runtime_info = {
         'cpu': cpu_peak,
         'memory': memory_peak,
-        'runtime': float(participant_runtime)
+        'runtime': float(participant_runtime),
+        'cpuSeconds': float(participant_metrics.get('cpu_seconds', 0)),
+        'cpuP50': float(participant_metrics.get('cpu_p50', 0)),
+        'cpuP95': float(participant_metrics.get('cpu_p95', 0)),
+        'cpuMax': cpu_peak,
+        'memoryPeak': memory_peak,
+        'memoryAvg': float(participant_metrics.get('memory_avg', 0)),
+        'ioReadBytes': int(participant_metrics.get('io_read_bytes', 0)),
+        'ioWriteBytes': int(participant_metrics.get('io_write_bytes', 0))
     }
     result_obj['runtimeInfo'] = runtime_info
     
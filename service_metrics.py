@@ -0,0 +1,271 @@
+"""
+服务指标（Prometheus 文本格式，`/metrics`）
+
+指标在进程内维护，评测与请求路径上只做一次加锁的加法或分桶计数：
+- 计数器：提交数（按状态码）、创建的评测数、加载/删除的镜像数（按参赛者/主办方/悬空镜像）
+- 仪表：队列长度、正在运行的评测数、BASE_DIR 所在分区剩余空间、悬空镜像数，在抓取时读取
+- 直方图：排队等待、镜像加载、参赛者/主办方容器运行时间、上传文件大小
+
+执行后端的统计（悬空镜像数）需要访问 Docker，按 METRICS_EXECUTOR_STATS_TTL 缓存，
+抓取频率不会放大为 Docker API 调用。
+"""
+
+import bisect
+import math
+import threading
+import time
+
+from config import BASE_DIR, METRICS_EXECUTOR_STATS_TTL
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    if value == -math.inf:
+        return '-Inf'
+    if isinstance(value, int) or float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+class _Metric:
+    type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+        if not self.labelnames:
+            # 无标签的指标从 0 开始输出，抓取方可以区分“没有发生”与“指标不存在”
+            self._values[()] = self._initial()
+
+    def _initial(self):
+        return 0
+
+    def _key(self, labels):
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f'{self.name} 需要标签 {self.labelnames}，实际为 {tuple(labels)}')
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self):
+        """[(后缀, 标签值, 额外标签, 值)]"""
+        with self._lock:
+            return [('', key, None, value) for key, value in sorted(self._values.items())]
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.type}']
+        for suffix, key, extra, value in self.samples():
+            lines.append(f'{self.name}{suffix}{_format_labels(self.labelnames, key, extra)} {_format_value(value)}')
+        return lines
+
+
+class Counter(_Metric):
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    """
+    仪表：set/inc/dec，或在抓取时调用 function 读取当前值
+
+    function 返回数值（无标签）或 {标签值元组: 数值}，返回 None 或抛出异常时不输出样本。
+    """
+
+    type = 'gauge'
+
+    def __init__(self, name, documentation, labelnames=(), function=None):
+        super().__init__(name, documentation, labelnames)
+        self.function = function
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def samples(self):
+        if self.function is None:
+            return super().samples()
+        try:
+            value = self.function()
+        except Exception:
+            return []
+        if value is None:
+            return []
+        if isinstance(value, dict):
+            return [('', tuple(str(v) for v in key), None, v) for key, v in sorted(value.items()) if v is not None]
+        return [('', (), None, value)]
+
+
+class Histogram(_Metric):
+    type = 'histogram'
+
+    def __init__(self, name, documentation, buckets, labelnames=()):
+        self.buckets = tuple(sorted(float(b) for b in buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _initial(self):
+        # 各桶（不累计，最后一个为 +Inf）、总和、样本数
+        return [[0] * (len(self.buckets) + 1), 0.0, 0]
+
+    def observe(self, value, **labels):
+        if value is None:
+            return
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = self._initial()
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def samples(self):
+        with self._lock:
+            states = [(key, list(state[0]), state[1], state[2]) for key, state in sorted(self._values.items())]
+        result = []
+        for key, counts, total, count in states:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (math.inf,), counts):
+                cumulative += bucket_count
+                result.append(('_bucket', key, ('le', _format_value(bound)), cumulative))
+            result.append(('_sum', key, None, total))
+            result.append(('_count', key, None, count))
+        return result
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = {}
+
+    def register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f'指标已注册: {metric.name}')
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=(), function=None):
+        return self.register(Gauge(name, documentation, labelnames, function))
+
+    def histogram(self, name, documentation, buckets, labelnames=()):
+        return self.register(Histogram(name, documentation, buckets, labelnames))
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+
+# ==================== 抓取时读取的仪表 ====================
+
+_executor_stats = {'at': None, 'value': None}
+_executor_stats_lock = threading.Lock()
+
+
+def _cached_executor_stats():
+    """执行后端统计（images/containers/dangling_images），按 METRICS_EXECUTOR_STATS_TTL 缓存。"""
+    with _executor_stats_lock:
+        now = time.monotonic()
+        if _executor_stats['at'] is None or now - _executor_stats['at'] >= METRICS_EXECUTOR_STATS_TTL:
+            from executors import get_executor
+            try:
+                _executor_stats['value'] = get_executor().stats()
+            except Exception:
+                _executor_stats['value'] = None
+            _executor_stats['at'] = now
+        return _executor_stats['value']
+
+
+def _queue_depth():
+    from task_queue import queue_size
+    return queue_size()
+
+
+def _running_evaluations():
+    from queue_runner import get_scheduler_status
+    status = get_scheduler_status()
+    return status['running'] if status else 0
+
+
+def _disk_free_bytes():
+    from utils import get_disk_free_bytes
+    return get_disk_free_bytes(BASE_DIR)
+
+
+def _dangling_images():
+    stats = _cached_executor_stats()
+    return stats.get('dangling_images') if stats else None
+
+
+# ==================== 指标定义 ====================
+
+SECONDS_BUCKETS_SHORT = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+SECONDS_BUCKETS_LONG = (1, 5, 15, 30, 60, 120, 300, 600, 1200, 1800, 3600)
+SIZE_BUCKETS = tuple(mb * 1024 * 1024 for mb in (1, 10, 50, 100, 250, 500, 1024, 2048, 5120, 10240))
+
+submissions_total = registry.counter(
+    'evaluation_submissions_total', '已完成评测的提交数（按结果码）', ['status_code'])
+submissions_received_total = registry.counter(
+    'evaluation_submissions_received_total', '进入评测队列的提交数')
+contests_created_total = registry.counter(
+    'evaluation_contests_created_total', '创建的评测数')
+images_loaded_total = registry.counter(
+    'evaluation_images_loaded_total', '加载的镜像数（participant/organizer）', ['kind'])
+images_removed_total = registry.counter(
+    'evaluation_images_removed_total', '删除的镜像数（participant/organizer/dangling）', ['kind'])
+
+registry.gauge('evaluation_queue_depth', '队列中等待评测的任务数', function=_queue_depth)
+registry.gauge('evaluation_running', '正在运行的评测数', function=_running_evaluations)
+registry.gauge('evaluation_disk_free_bytes', 'BASE_DIR 所在分区的剩余空间（字节）', function=_disk_free_bytes)
+registry.gauge('evaluation_dangling_images', '悬空（无标签）镜像数', function=_dangling_images)
+
+queue_wait_seconds = registry.histogram(
+    'evaluation_queue_wait_seconds', '提交从入队到开始评测的等待时间', SECONDS_BUCKETS_LONG)
+image_load_seconds = registry.histogram(
+    'evaluation_image_load_seconds', '镜像加载耗时（participant/organizer）', SECONDS_BUCKETS_SHORT, ['kind'])
+participant_runtime_seconds = registry.histogram(
+    'evaluation_participant_runtime_seconds', '参赛者容器运行时间', SECONDS_BUCKETS_LONG)
+organizer_runtime_seconds = registry.histogram(
+    'evaluation_organizer_runtime_seconds', '主办方容器运行时间', SECONDS_BUCKETS_LONG)
+upload_size_bytes = registry.histogram(
+    'evaluation_upload_size_bytes', '上传文件大小（submission/contest_image）', SIZE_BUCKETS, ['kind'])
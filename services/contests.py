@@ -1,9 +1,10 @@
 import json
 import os
-import base64
+import threading
 from datetime import datetime
 
 from config import BASE_DIR
+from services.journal import get_journal, has_submission_records
 from utils import load_users, normalize_rel_path, read_results_file
 
 
@@ -42,44 +43,135 @@ def generate_contest_id():
     raise RuntimeError('无法生成唯一的评测 ID，请稍后再试')
 
 
-def get_all_contests():
-    contests = []
-    if not os.path.exists(BASE_DIR):
-        return contests
-
-    users = load_users()
-    user_map = {u.get('id'): u.get('name', u.get('id')) for u in users}
-
-    for item in os.listdir(BASE_DIR):
-        item_path = os.path.join(BASE_DIR, item)
-        if not os.path.isdir(item_path):
-            continue
-        info_dir = os.path.join(item_path, 'info')
+class ContestCatalog:
+    """
+    评测目录的内存缓存
+
+    每次请求只对 BASE_DIR 和各评测的 info.json、封面图做 stat：
+    - BASE_DIR 的 mtime 变化时重新 listdir（新增/删除评测）
+    - info.json 或封面图的 mtime/大小变化时只重新解析该评测
+    - users.json 变化时重新计算创建者名称
+    创建、删除评测时也会通过 invalidate() 显式失效。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._dir_key = None
+        self._contest_ids = []
+        # contest_id -> (stat_key, info)
+        self._entries = {}
+        self._users_key = False
+        self._user_map = {}
+
+    @staticmethod
+    def _stat_key(path):
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+    def _refresh_users(self):
+        users_key = self._stat_key(os.path.join(os.path.dirname(os.path.dirname(__file__)), 'users.json'))
+        if users_key != self._users_key:
+            self._user_map = {u.get('id'): u.get('name', u.get('id')) for u in load_users()}
+            self._users_key = users_key
+            # 创建者名称依赖用户列表，需要重新生成条目
+            self._entries.clear()
+
+    def _refresh_ids(self):
+        dir_key = self._stat_key(BASE_DIR)
+        if dir_key != self._dir_key:
+            self._contest_ids = [
+                item for item in os.listdir(BASE_DIR)
+                if os.path.isdir(os.path.join(BASE_DIR, item))
+            ] if dir_key else []
+            self._dir_key = dir_key
+            for stale in set(self._entries) - set(self._contest_ids):
+                self._entries.pop(stale, None)
+
+    def _load_info(self, contest_id, info_file):
+        info_dir = os.path.dirname(info_file)
+        with open(info_file, 'r', encoding='utf-8') as f:
+            info = json.load(f)
+        info['id'] = contest_id
+        owner_id = info.get('owner_id') or 'system'
+        info['owner_id'] = owner_id
+        info['owner_name'] = info.get('owner_name') or self._user_map.get(owner_id, owner_id)
+        cover_file = info.get('cover_image')
+        cover_key = self._stat_key(os.path.join(info_dir, cover_file)) if cover_file else None
+        # 封面不再内联为 Base64，只记录文件名与版本（mtime），由调用方生成 URL
+        info['cover_image'] = cover_file if cover_key else None
+        info['cover_version'] = cover_key[0] // 1_000_000 if cover_key else None
+        return info
+
+    def _entry(self, contest_id):
+        """返回单个评测的最新信息（必要时重新解析），info.json 不存在或损坏时返回 None。需持有 _lock。"""
+        info_dir = os.path.join(BASE_DIR, contest_id, 'info')
         info_file = os.path.join(info_dir, 'info.json')
-        if not os.path.exists(info_file):
-            continue
+        info_key = self._stat_key(info_file)
+        if info_key is None:
+            self._entries.pop(contest_id, None)
+            return None
+        cached = self._entries.get(contest_id)
+        cover_name = cached[1].get('cover_image') if cached else None
+        cover_key = self._stat_key(os.path.join(info_dir, cover_name)) if cover_name else None
+        if cached is not None and cached[0] == (info_key, cover_key):
+            return cached[1]
         try:
-            with open(info_file, 'r', encoding='utf-8') as f:
-                info = json.load(f)
-                info['id'] = item
-                owner_id = info.get('owner_id') or 'system'
-                info['owner_id'] = owner_id
-                info['owner_name'] = info.get('owner_name') or user_map.get(owner_id, owner_id)
-
-                # 读取封面图并转换为 Base64
-                cover_image_path = os.path.join(info_dir, info.get('cover_image', ''))
-                if os.path.exists(cover_image_path):
-                    with open(cover_image_path, 'rb') as img_file:
-                        info['cover_image'] = f"data:image/jpeg;base64,{base64.b64encode(img_file.read()).decode('utf-8')}"
-                else:
-                    info['cover_image'] = None
-
-                contests.append(info)
+            info = self._load_info(contest_id, info_file)
         except Exception:
-            continue
+            return None
+        cover_name = info.get('cover_image')
+        cover_key = self._stat_key(os.path.join(info_dir, cover_name)) if cover_name else None
+        self._entries[contest_id] = ((info_key, cover_key), info)
+        return info
+
+    def list(self):
+        """返回按 ID 倒序排列的评测信息（浅拷贝，可安全修改顶层字段）。"""
+        with self._lock:
+            self._refresh_users()
+            self._refresh_ids()
+            contests = []
+            for contest_id in self._contest_ids:
+                info = self._entry(contest_id)
+                if info is not None:
+                    contests.append(dict(info))
+        contests.sort(key=lambda x: x['id'], reverse=True)
+        return contests
+
+    def get(self, contest_id):
+        """返回单个评测的信息（浅拷贝），不存在时返回 None。"""
+        with self._lock:
+            self._refresh_users()
+            info = self._entry(contest_id)
+            return dict(info) if info is not None else None
+
+    def invalidate(self, contest_id=None):
+        """显式失效：创建/删除评测后调用，contest_id 为空时清空全部缓存。"""
+        with self._lock:
+            self._dir_key = None
+            if contest_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(contest_id, None)
 
-    contests.sort(key=lambda x: x['id'], reverse=True)
-    return contests
+
+contest_catalog = ContestCatalog()
+
+
+def get_all_contests():
+    if not os.path.exists(BASE_DIR):
+        return []
+    return contest_catalog.list()
+
+
+def get_contest_cover_path(contest_id):
+    """返回评测封面图的绝对路径，不存在时返回 None。"""
+    info = contest_catalog.get(contest_id)
+    if not info or not info.get('cover_image'):
+        return None
+    return os.path.join(BASE_DIR, contest_id, 'info', info['cover_image'])
 
 
 def get_contest_submissions(contest_id):
@@ -91,13 +183,10 @@ def get_contest_submissions(contest_id):
     user_map = {u.get('id'): u.get('name', u.get('id')) for u in users}
     submissions = []
 
+    # 提交记录来自快照 + 追加日志的内存视图，不再每次解析 submissions.json
     submissions_data = None
-    if os.path.exists(submissions_json):
-        try:
-            with open(submissions_json, 'r', encoding='utf-8') as f:
-                submissions_data = json.load(f)
-        except Exception:
-            submissions_data = None
+    if has_submission_records(submissions_json):
+        submissions_data = {'submissions': get_journal(submissions_json).records()}
 
     if submissions_data:
         for entry in submissions_data.get('submissions', []):
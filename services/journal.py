@@ -0,0 +1,216 @@
+"""
+提交记录日志（append-only journal）
+
+每个评测的提交记录由两部分组成：
+- submissions.json：快照，格式与旧版完全一致（{"submissions": [...]}）
+- submissions.journal.jsonl：快照之后的变更，每行一条操作
+    {"op": "add", "record": {...}}
+    {"op": "update", "submission_id": "...", "fields": {...}}
+
+新增提交与状态更新只需在日志末尾追加一行（O(1)），不再整体读-改-写 submissions.json。
+日志超过 SUBMISSION_JOURNAL_COMPACT_OPS 行时把内存视图写成新快照（临时文件 + os.replace）
+并清空日志。回放是幂等的（add 同一 submission_id 会覆盖），因此压缩过程中崩溃也不会产生重复记录；
+进程崩溃留下的半行会在回放时被忽略。
+"""
+
+import json
+import os
+import threading
+
+from config import SUBMISSION_JOURNAL_COMPACT_OPS
+
+JOURNAL_SUFFIX = '.journal.jsonl'
+
+
+def journal_path_for(snapshot_path):
+    return os.path.splitext(snapshot_path)[0] + JOURNAL_SUFFIX
+
+
+def _stat_key(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+
+class SubmissionJournal:
+    """单个评测的提交记录：快照 + 追加日志 + 内存物化视图。"""
+
+    def __init__(self, snapshot_path, compact_ops=None):
+        self.snapshot_path = snapshot_path
+        self.journal_path = journal_path_for(snapshot_path)
+        self.compact_ops = compact_ops or SUBMISSION_JOURNAL_COMPACT_OPS
+        self.lock = threading.RLock()
+        self._records = []
+        self._index = {}
+        self._snapshot_key = False
+        self._journal_offset = 0
+        self._journal_size = 0
+        self._journal_ops = 0
+
+    # -------------------- 物化视图 --------------------
+
+    def _apply(self, op):
+        kind = op.get('op')
+        if kind == 'add':
+            record = op.get('record') or {}
+            existing = self._index.get(record.get('submission_id'))
+            if existing is not None:
+                existing.update(record)
+            else:
+                record = dict(record)
+                self._records.append(record)
+                self._index[record.get('submission_id')] = record
+        elif kind == 'update':
+            record = self._index.get(op.get('submission_id'))
+            if record is not None:
+                record.update(op.get('fields') or {})
+
+    def _load_snapshot(self):
+        self._records = []
+        self._index = {}
+        self._journal_offset = 0
+        self._journal_size = 0
+        self._journal_ops = 0
+        try:
+            with open(self.snapshot_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except Exception:
+            data = {}
+        for record in data.get('submissions', []):
+            self._apply({'op': 'add', 'record': record})
+
+    def _replay_journal(self, size):
+        """从上次读到的位置继续回放日志（只处理新增的完整行）。"""
+        if size <= self._journal_offset:
+            return
+        with open(self.journal_path, 'rb') as f:
+            f.seek(self._journal_offset)
+            data = f.read()
+        end = data.rfind(b'\n') + 1
+        for line in data[:end].splitlines():
+            try:
+                self._apply(json.loads(line))
+            except Exception:
+                continue
+            self._journal_ops += 1
+        self._journal_offset += end
+
+    def refresh(self):
+        """确保内存视图与磁盘一致，需持有 lock。"""
+        snapshot_key = _stat_key(self.snapshot_path)
+        try:
+            journal_size = os.path.getsize(self.journal_path)
+        except OSError:
+            journal_size = 0
+        # 快照被替换或日志变短（已被压缩）时从快照重新加载
+        if snapshot_key != self._snapshot_key or journal_size < self._journal_offset:
+            self._load_snapshot()
+            self._snapshot_key = snapshot_key
+        self._replay_journal(journal_size)
+        self._journal_size = journal_size
+
+    def records(self):
+        """返回全部提交记录的浅拷贝（按提交顺序）。"""
+        with self.lock:
+            self.refresh()
+            return [dict(r) for r in self._records]
+
+    def get(self, submission_id):
+        with self.lock:
+            self.refresh()
+            record = self._index.get(submission_id)
+            return dict(record) if record is not None else None
+
+    # -------------------- 写入 --------------------
+
+    def _append(self, ops):
+        line = ''.join(json.dumps(op, ensure_ascii=False) + '\n' for op in ops).encode('utf-8')
+        if self._journal_size > self._journal_offset:
+            # 末尾残留崩溃时写了一半的行：先补换行，使其成为一条会被跳过的独立坏行
+            line = b'\n' + line
+        os.makedirs(os.path.dirname(self.journal_path), exist_ok=True)
+        # O_APPEND 保证单次 write 整体追加到文件末尾，不会与其他写入交错
+        fd = os.open(self.journal_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, line)
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        return self._journal_size + len(line)
+
+    def _commit(self, ops):
+        with self.lock:
+            self.refresh()
+            self._journal_offset = self._journal_size = self._append(ops)
+            for op in ops:
+                self._apply(op)
+            self._journal_ops += len(ops)
+            if self._journal_ops >= self.compact_ops:
+                self.compact()
+
+    def add(self, record):
+        self._commit([{'op': 'add', 'record': record}])
+
+    def update(self, submission_id, fields):
+        """更新提交字段，提交不存在时返回 False。"""
+        with self.lock:
+            self.refresh()
+            if submission_id not in self._index:
+                return False
+            self._commit([{'op': 'update', 'submission_id': submission_id, 'fields': fields}])
+            return True
+
+    def update_many(self, updates):
+        """批量更新（一次追加、一次 fsync），updates 为 submission_id -> fields，忽略不存在的提交。"""
+        with self.lock:
+            self.refresh()
+            ops = [
+                {'op': 'update', 'submission_id': sid, 'fields': fields}
+                for sid, fields in updates.items() if sid in self._index
+            ]
+            if ops:
+                self._commit(ops)
+
+    def compact(self):
+        """把内存视图写成新快照并清空日志。"""
+        with self.lock:
+            self.refresh()
+            tmp_path = self.snapshot_path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'submissions': self._records}, f, ensure_ascii=False, indent=2)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.snapshot_path)
+            # 快照已包含日志中的全部操作；若在此之前崩溃，幂等回放保证结果一致
+            with open(self.journal_path, 'wb'):
+                pass
+            self._snapshot_key = _stat_key(self.snapshot_path)
+            self._journal_offset = 0
+            self._journal_size = 0
+            self._journal_ops = 0
+
+
+_journals = {}
+_journals_lock = threading.Lock()
+
+
+def get_journal(snapshot_path):
+    """返回（进程内共享的）评测提交记录对象。"""
+    snapshot_path = os.path.abspath(snapshot_path)
+    with _journals_lock:
+        journal = _journals.get(snapshot_path)
+        if journal is None:
+            journal = _journals[snapshot_path] = SubmissionJournal(snapshot_path)
+        return journal
+
+
+def has_submission_records(snapshot_path):
+    return os.path.exists(snapshot_path) or os.path.exists(journal_path_for(snapshot_path))
+
+
+def forget_journal(snapshot_path):
+    """评测删除时丢弃内存视图。"""
+    with _journals_lock:
+        _journals.pop(os.path.abspath(snapshot_path), None)
@@ -0,0 +1,420 @@
+"""
+排行榜
+
+每个评测在内存中维护一个按排名键有序的分块列表（见 BlockedSortedList），只保留每个参赛者的最佳提交：
+- 提交评测成功后由队列调用 record_result()，只有优于该参赛者当前最佳成绩时才更新；
+  插入/删除只移动一个块（至多 2*LOAD 个元素）内的元素，不再整体移动 O(n) 的列表
+- top(k) 按块顺序取前 k 个，rank_of(participant_id) 由块长度前缀和加块内二分得到名次，都不需要扫描提交记录
+- 首次访问时从提交记录（submissions.json + 追加日志）构建；升级前完成的提交缺少 indicators
+  字段时读取一次 organizer_results.json 并写回提交记录
+
+排序规则在 info.json 的 leaderboard 字段中配置（缺省为第一个数值型指标降序、运行时间升序）：
+
+    "leaderboard": {
+        "sort": [{"key": "accuracy", "order": "desc"}],
+        "tie_breaks": [{"key": "runtime", "order": "asc"}, {"key": "memoryPeak", "order": "asc"}]
+    }
+
+sort 的 key 对应 indicator 中的指标，tie_breaks 的 key 对应 runtimeInfo 中的字段；
+仍然相同时先提交者排名靠前。缺少 sort 指标的提交不上榜。
+"""
+
+import bisect
+import itertools
+import math
+import os
+import threading
+
+from services.contests import contest_catalog, resolve_submission_dir
+from services.submissions import contest_journal, extract_indicators, load_index_entries
+from utils import load_users, read_results_file
+
+# 评测成功的状态码，只有这些提交参与排名
+SUCCESS_STATUS = 0
+MAX_TOP_K = 200
+
+DEFAULT_SPEC = {
+    'sort': [{'key': None, 'order': 'desc'}],
+    'tie_breaks': [{'key': 'runtime', 'order': 'asc'}]
+}
+
+
+def parse_spec(config):
+    """
+    解析 info.json 中的 leaderboard 配置，非法配置回退到默认规则
+
+    Returns:
+        (sort, tie_breaks)：均为 ((key, descending), ...)，sort 的 key 为 None 表示第一个数值型指标
+    """
+    def parse_keys(items, allow_none):
+        keys = []
+        for item in items:
+            if not isinstance(item, dict) or item.get('order', 'desc') not in ('asc', 'desc'):
+                return None
+            key = item.get('key')
+            if key is None and not allow_none:
+                return None
+            keys.append((None if key is None else str(key), item.get('order', 'desc') == 'desc'))
+        return tuple(keys)
+
+    config = config if isinstance(config, dict) else {}
+    sort = parse_keys(config.get('sort') or DEFAULT_SPEC['sort'], allow_none=True)
+    tie_breaks = parse_keys(config.get('tie_breaks', DEFAULT_SPEC['tie_breaks']) or [], allow_none=False)
+    if not sort or tie_breaks is None:
+        return parse_spec(DEFAULT_SPEC)
+    return sort, tie_breaks
+
+
+def _number(value):
+    if isinstance(value, bool):
+        return None
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return None
+    return None if math.isnan(value) else value
+
+
+class BlockedSortedList:
+    """
+    分块有序列表（顺序统计）
+
+    元素按序分布在若干有序块中，块长保持在 [LOAD/2, 2*LOAD] 之间：
+    - add / remove：二分块的最大值定位块，只在块内插入/删除，O(log n + LOAD)
+    - index：块长度的树状数组求前缀和 + 块内二分，O(log n)；块分裂/合并时树状数组惰性重建
+    - head(k)：按块顺序取前 k 个
+    """
+
+    LOAD = 256
+
+    def __init__(self):
+        self._blocks = []
+        # 各块的最大元素，用于二分定位块
+        self._maxes = []
+        # 块长度的树状数组（下标从 1 开始），块结构变化后置为 None
+        self._tree = None
+        self._len = 0
+
+    def __len__(self):
+        return self._len
+
+    def _locate(self, value):
+        index = bisect.bisect_left(self._maxes, value)
+        return min(index, len(self._maxes) - 1)
+
+    def _build_tree(self):
+        tree = [0] + [len(block) for block in self._blocks]
+        for i in range(1, len(tree)):
+            parent = i + (i & -i)
+            if parent < len(tree):
+                tree[parent] += tree[i]
+        self._tree = tree
+
+    def _tree_add(self, i, delta):
+        tree = self._tree
+        if tree is None:
+            return
+        i += 1
+        while i < len(tree):
+            tree[i] += delta
+            i += i & -i
+
+    def _prefix(self, i):
+        """前 i 个块的元素总数。"""
+        if self._tree is None:
+            self._build_tree()
+        tree = self._tree
+        total = 0
+        while i > 0:
+            total += tree[i]
+            i -= i & -i
+        return total
+
+    def add(self, value):
+        self._len += 1
+        if not self._blocks:
+            self._blocks.append([value])
+            self._maxes.append(value)
+            self._tree = None
+            return
+        i = self._locate(value)
+        block = self._blocks[i]
+        bisect.insort(block, value)
+        self._maxes[i] = block[-1]
+        if len(block) > 2 * self.LOAD:
+            self._blocks[i:i + 1] = [block[:self.LOAD], block[self.LOAD:]]
+            self._maxes[i:i + 1] = [block[self.LOAD - 1], block[-1]]
+            self._tree = None
+        else:
+            self._tree_add(i, 1)
+
+    def remove(self, value):
+        i = self._locate(value) if self._blocks else 0
+        block = self._blocks[i] if self._blocks else []
+        j = bisect.bisect_left(block, value)
+        if j >= len(block) or block[j] != value:
+            raise ValueError(f'{value!r} 不在列表中')
+        del block[j]
+        self._len -= 1
+        if not block:
+            del self._blocks[i]
+            del self._maxes[i]
+            self._tree = None
+            return
+        self._maxes[i] = block[-1]
+        if len(block) < self.LOAD // 2 and len(self._blocks) > 1:
+            # 过小的块与相邻块合并，块数保持在 O(n/LOAD)
+            left = i if i + 1 < len(self._blocks) else i - 1
+            merged = self._blocks[left] + self._blocks[left + 1]
+            if len(merged) > 2 * self.LOAD:
+                half = len(merged) // 2
+                self._blocks[left:left + 2] = [merged[:half], merged[half:]]
+                self._maxes[left:left + 2] = [merged[half - 1], merged[-1]]
+            else:
+                self._blocks[left:left + 2] = [merged]
+                self._maxes[left:left + 2] = [merged[-1]]
+            self._tree = None
+        else:
+            self._tree_add(i, -1)
+
+    def index(self, value):
+        """value 在列表中的下标（不存在时为插入位置）。"""
+        i = bisect.bisect_left(self._maxes, value)
+        if i == len(self._blocks):
+            return self._len
+        return self._prefix(i) + bisect.bisect_left(self._blocks[i], value)
+
+    def head(self, k):
+        return list(itertools.islice(itertools.chain.from_iterable(self._blocks), k))
+
+
+class ContestLeaderboard:
+    """单个评测的排行榜：有序排名键列表 + 参赛者最佳成绩。"""
+
+    def __init__(self, spec):
+        self.spec = spec
+        self.sort, self.tie_breaks = spec
+        # 有序分块列表，元素为 (rank_key, participant_id)
+        self._keys = BlockedSortedList()
+        # participant_id -> (rank_key, entry)
+        self._best = {}
+
+    def rank_key(self, entry):
+        """计算排名键（越小越靠前），缺少排序指标时返回 None。"""
+        indicators = entry.get('indicators') or {}
+        parts = []
+        for key, descending in self.sort:
+            value = next(iter(indicators.values()), None) if key is None else _number(indicators.get(key))
+            if value is None:
+                return None
+            parts.append(-value if descending else value)
+        runtime_info = entry.get('runtime_info') or {}
+        for key, descending in self.tie_breaks:
+            value = _number(runtime_info.get(key))
+            # 缺少平局字段的提交排在有该字段的提交之后
+            parts.append(math.inf if value is None else (-value if descending else value))
+        parts.append(entry.get('timestamp') or '')
+        parts.append(str(entry.get('submission_id') or ''))
+        return tuple(parts)
+
+    def offer(self, entry):
+        """加入一个评测成功的提交，成为该参赛者新的最佳成绩时返回 True。"""
+        key = self.rank_key(entry)
+        if key is None:
+            return False
+        participant_id = entry.get('participant_id') or 'default'
+        current = self._best.get(participant_id)
+        if current is not None:
+            if current[0] <= key:
+                return False
+            self._keys.remove((current[0], participant_id))
+        self._keys.add((key, participant_id))
+        self._best[participant_id] = (key, entry)
+        return True
+
+    def __len__(self):
+        return len(self._keys)
+
+    def top(self, k):
+        return [(rank, self._best[pid][1]) for rank, (_, pid) in enumerate(self._keys.head(k), start=1)]
+
+    def rank_of(self, participant_id):
+        """返回 (名次, 最佳提交)，未上榜时返回 (None, None)。"""
+        current = self._best.get(participant_id)
+        if current is None:
+            return None, None
+        return self._keys.index((current[0], participant_id)) + 1, current[1]
+
+
+def ranking_fields(organizer_results):
+    """提交记录中用于排名的字段（queue_runner 在评测结束时写入 extra）。"""
+    runtime_info = organizer_results.get('runtimeInfo') if isinstance(organizer_results, dict) else None
+    return {
+        'indicators': extract_indicators(organizer_results),
+        'runtime_info': runtime_info if isinstance(runtime_info, dict) else {}
+    }
+
+
+def _entry_from_record(record):
+    return {
+        'participant_id': record.get('participant_id') or 'default',
+        'submission_id': record.get('submission_id'),
+        'timestamp': record.get('timestamp'),
+        'indicators': record.get('indicators') or {},
+        'runtime_info': record.get('runtime_info') or {}
+    }
+
+
+class LeaderboardRegistry:
+    """
+    按评测缓存排行榜；info.json 中的排序规则变化时重建
+
+    构建（可能读取大量 organizer_results.json 并回写日志）不持有注册表锁，只持有该评测的构建锁，
+    不阻塞其他评测的读取与 record_result；构建期间到达的评测结果暂存，构建完成后补充到新排行榜。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._boards = {}
+        # contest_id -> Lock，同一评测只构建一次
+        self._build_locks = {}
+        # contest_id -> 构建期间到达的提交记录
+        self._pending = {}
+
+    def _spec(self, contest_id):
+        info = contest_catalog.get(contest_id) or {}
+        return parse_spec(info.get('leaderboard'))
+
+    def _build(self, contest_id, spec):
+        board = ContestLeaderboard(spec)
+        entries, persist = load_index_entries(contest_id)
+        backfill = {}
+        for record in entries:
+            if str(record.get('status_code')) != str(SUCCESS_STATUS):
+                continue
+            if 'indicators' not in record:
+                submission_dir = resolve_submission_dir(
+                    contest_id,
+                    submission_id=record.get('submission_id'),
+                    participant_id=record.get('participant_id'),
+                    storage_path=record.get('storage_path')
+                )
+                organizer_results = read_results_file(
+                    os.path.join(submission_dir, 'organizer_results.json')) if submission_dir else None
+                fields = ranking_fields(organizer_results)
+                record.update(fields)
+                backfill[record.get('submission_id')] = fields
+            board.offer(_entry_from_record(record))
+        if backfill and persist:
+            contest_journal(contest_id).update_many(backfill)
+        return board
+
+    def get(self, contest_id):
+        spec = self._spec(contest_id)
+        with self._lock:
+            board = self._boards.get(contest_id)
+            if board is not None and board.spec == spec:
+                return board
+            build_lock = self._build_locks.setdefault(contest_id, threading.Lock())
+
+        with build_lock:
+            # 等待构建锁期间可能已由其他线程构建完成
+            with self._lock:
+                board = self._boards.get(contest_id)
+                if board is not None and board.spec == spec:
+                    return board
+                self._pending[contest_id] = []
+            try:
+                board = self._build(contest_id, spec)
+            except Exception:
+                with self._lock:
+                    self._pending.pop(contest_id, None)
+                raise
+            with self._lock:
+                # 构建期间评测被删除（forget）时不再登记
+                pending = self._pending.pop(contest_id, None)
+                if pending is not None:
+                    for record in pending:
+                        board.offer(_entry_from_record(record))
+                    self._boards[contest_id] = board
+            return board
+
+    def record_result(self, contest_id, record):
+        """提交评测结束后调用（record 为更新后的提交记录），排行榜尚未构建时留待首次访问时构建。"""
+        if str(record.get('status_code')) != str(SUCCESS_STATUS):
+            return False
+        with self._lock:
+            pending = self._pending.get(contest_id)
+            if pending is not None:
+                pending.append(record)
+            board = self._boards.get(contest_id)
+            if board is None:
+                return False
+            return board.offer(_entry_from_record(record))
+
+    def top(self, contest_id, k):
+        """返回 (排行榜, [(名次, 提交), ...], 上榜人数)。"""
+        board = self.get(contest_id)
+        with self._lock:
+            return board, board.top(k), len(board)
+
+    def rank_of(self, contest_id, participant_id):
+        """返回 (排行榜, 名次, 最佳提交, 上榜人数)。"""
+        board = self.get(contest_id)
+        with self._lock:
+            rank, entry = board.rank_of(participant_id)
+            return board, rank, entry, len(board)
+
+    def forget(self, contest_id):
+        with self._lock:
+            self._boards.pop(contest_id, None)
+            self._pending.pop(contest_id, None)
+            self._build_locks.pop(contest_id, None)
+
+
+leaderboards = LeaderboardRegistry()
+
+
+def _format_item(rank, entry, user_map):
+    pid = entry['participant_id']
+    indicators = entry.get('indicators') or {}
+    return {
+        'rank': rank,
+        'participant_id': pid,
+        'participant_name': user_map.get(pid, pid),
+        'submission_id': entry.get('submission_id'),
+        'submission_time': entry.get('timestamp'),
+        'score': next(iter(indicators.values()), None),
+        'indicators': indicators,
+        'runtime_info': entry.get('runtime_info') or {}
+    }
+
+
+def _spec_description(board):
+    return {
+        'sort': [{'key': key, 'order': 'desc' if desc else 'asc'} for key, desc in board.sort],
+        'tie_breaks': [{'key': key, 'order': 'desc' if desc else 'asc'} for key, desc in board.tie_breaks]
+    }
+
+
+def get_leaderboard(contest_id, limit=20):
+    """排行榜前 limit 名（limit 最大 MAX_TOP_K）。"""
+    board, top, total = leaderboards.top(contest_id, max(1, min(limit, MAX_TOP_K)))
+    user_map = {u.get('id'): u.get('name', u.get('id')) for u in load_users()}
+    return {
+        'total': total,
+        'rules': _spec_description(board),
+        'items': [_format_item(rank, entry, user_map) for rank, entry in top]
+    }
+
+
+def get_participant_rank(contest_id, participant_id):
+    """参赛者的名次与最佳提交，未上榜时 rank 为 None。"""
+    board, rank, entry, total = leaderboards.rank_of(contest_id, participant_id)
+    user_map = {u.get('id'): u.get('name', u.get('id')) for u in load_users()}
+    return {
+        'total': total,
+        'participant_id': participant_id,
+        'rank': rank,
+        'entry': _format_item(rank, entry, user_map) if entry is not None else None
+    }
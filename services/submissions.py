@@ -2,43 +2,263 @@ import json
 import os
 
 from services.contests import contest_paths, resolve_submission_dir
+from services.journal import get_journal, has_submission_records
+from submission_events import publish_submission, publish_status
 from utils import normalize_rel_path, read_results_file, load_users
 
 
+def contest_journal(contest_id):
+    """返回评测的提交记录（submissions.json 快照 + 追加日志，进程内共享、线程安全）。"""
+    return get_journal(contest_paths(contest_id)[3])
+
+
 def append_submission_record(contest_id, record):
-    _, _, _, submissions_json = contest_paths(contest_id)
-    data = {'submissions': []}
-    if os.path.exists(submissions_json):
+    contest_journal(contest_id).add(record)
+    publish_submission(contest_id, record)
+
+
+def update_submission_status(contest_id, submission_id, status_code, status_desc, extra=None):
+    fields = {'status_code': status_code, 'status_desc': status_desc}
+    # 附加字段（如镜像加载耗时）一并写入提交记录
+    if extra:
+        fields.update(extra)
+    if contest_journal(contest_id).update(submission_id, fields):
+        publish_status(contest_id, submission_id, status_code, status_desc)
+
+
+# ==================== 摘要列表（分页/筛选/排序） ====================
+
+# 评测尚未结束的状态，这些提交不会有分数
+PENDING_STATUSES = {'QUEUED', 'RUNNING'}
+SUMMARY_SORT_KEYS = {'time', 'score'}
+MAX_PAGE_SIZE = 200
+
+
+def extract_indicators(organizer_results):
+    """
+    从主办方结果中提取数值型指标：indicator（[{key, value}, ...]）转换为 {key: float}
+
+    没有 key（或 name）的指标以其在数组中的下标作为 key，非数值的指标忽略。
+    """
+    if not isinstance(organizer_results, dict):
+        return {}
+    indicators = {}
+    for index, item in enumerate(organizer_results.get('indicator') or []):
+        if not isinstance(item, dict):
+            continue
+        value = item.get('value')
+        if isinstance(value, bool):
+            continue
+        try:
+            value = float(value)
+        except (TypeError, ValueError):
+            continue
+        if value != value:
+            continue
+        key = item.get('key') or item.get('name') or str(index)
+        indicators.setdefault(str(key), value)
+    return indicators
+
+
+def extract_score(organizer_results):
+    """
+    从主办方结果中提取排序用分数：indicator（[{key, value}, ...]）中第一个数值型的 value
+
+    没有可用分数时返回 None。
+    """
+    return next(iter(extract_indicators(organizer_results).values()), None)
+
+
+def load_index_entries(contest_id):
+    """
+    读取提交索引（提交记录的内存视图，不访问各提交目录）
+
+    旧版按参赛者分目录的布局只有参赛者级别的 submissions.json，取每个参赛者的最新一次提交。
+
+    Returns:
+        (entries, persist)：persist 为 False 表示旧版布局，补齐的字段无法写回
+    """
+    _, evaluation_dir, _, submissions_json = contest_paths(contest_id)
+    if not os.path.exists(evaluation_dir):
+        return [], False
+    if has_submission_records(submissions_json):
+        return contest_journal(contest_id).records(), True
+
+    entries = []
+    for participant_id in os.listdir(evaluation_dir):
+        participant_json = os.path.join(evaluation_dir, participant_id, 'submissions.json')
+        if not os.path.isfile(participant_json):
+            continue
         try:
-            with open(submissions_json, 'r', encoding='utf-8') as f:
-                data = json.load(f)
+            with open(participant_json, 'r', encoding='utf-8') as f:
+                subs = json.load(f).get('submissions') or []
         except Exception:
-            data = {'submissions': []}
-
-    data.setdefault('submissions', []).append(record)
-    with open(submissions_json, 'w', encoding='utf-8') as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
-
-
-def update_submission_status(contest_id, submission_id, status_code, status_desc):
-    _, _, _, submissions_json = contest_paths(contest_id)
-    if not os.path.exists(submissions_json):
-        return
-    try:
-        with open(submissions_json, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-    except Exception:
-        return
-
-    updated = False
-    for sub in data.get('submissions', []):
-        if sub.get('submission_id') == submission_id:
-            sub['status_code'] = status_code
-            sub['status_desc'] = status_desc
-            updated = True
-            break
-
-    if updated:
-        with open(submissions_json, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+            continue
+        if subs:
+            entry = dict(subs[-1])
+            entry.setdefault('participant_id', participant_id)
+            entries.append(entry)
+    return entries, False
+
+
+def _backfill_scores(contest_id, entries, persist):
+    """
+    为升级前完成的提交补齐 score 字段
+
+    只在第一次列出时读取一次 organizer_results.json，并批量写回提交记录，之后的请求只读索引。
+    """
+    scores = {}
+    for entry in entries:
+        if 'score' in entry or entry.get('status_code') in PENDING_STATUSES:
+            continue
+        organizer_results = entry.get('organizer_results')
+        if organizer_results is None:
+            submission_dir = resolve_submission_dir(
+                contest_id,
+                submission_id=entry.get('submission_id'),
+                participant_id=entry.get('participant_id'),
+                storage_path=entry.get('storage_path')
+            )
+            if submission_dir:
+                organizer_results = read_results_file(os.path.join(submission_dir, 'organizer_results.json'))
+        entry['score'] = extract_score(organizer_results)
+        scores[entry.get('submission_id')] = entry['score']
+
+    if scores and persist:
+        contest_journal(contest_id).update_many({sid: {'score': score} for sid, score in scores.items()})
+
+
+def list_submission_summaries(contest_id, page=1, page_size=20, participant_id=None, statuses=None,
+                              sort='time', order='desc'):
+    """
+    分页返回提交摘要，只读取提交索引，不读取日志和结果文件
+
+    Args:
+        participant_id: 只返回该参赛者的提交
+        statuses: 状态筛选（如 {'QUEUED', 'RUNNING', '0'}），按字符串比较
+        sort: 'time'（提交时间）或 'score'（分数，无分数的提交始终排在最后）
+        order: 'asc' 或 'desc'
+
+    Returns:
+        dict: total、page、page_size、items
+    """
+    entries, persist = load_index_entries(contest_id)
+    _backfill_scores(contest_id, entries, persist)
+
+    if participant_id:
+        entries = [e for e in entries if (e.get('participant_id') or 'default') == participant_id]
+    if statuses:
+        entries = [e for e in entries if str(e.get('status_code')) in statuses]
+
+    reverse = order != 'asc'
+    if sort == 'score':
+        scored = [e for e in entries if e.get('score') is not None]
+        unscored = [e for e in entries if e.get('score') is None]
+        scored.sort(key=lambda e: (e['score'], e.get('timestamp') or ''), reverse=reverse)
+        unscored.sort(key=lambda e: e.get('timestamp') or '', reverse=True)
+        entries = scored + unscored
+    else:
+        entries.sort(key=lambda e: e.get('timestamp') or '', reverse=reverse)
+
+    page_size = max(1, min(page_size, MAX_PAGE_SIZE))
+    page = max(page, 1)
+    start = (page - 1) * page_size
+    user_map = {u.get('id'): u.get('name', u.get('id')) for u in load_users()}
+
+    items = []
+    for entry in entries[start:start + page_size]:
+        pid = entry.get('participant_id') or 'default'
+        items.append({
+            'participant_id': pid,
+            'participant_name': user_map.get(pid, pid),
+            'submission_id': entry.get('submission_id'),
+            'submission_time': entry.get('timestamp'),
+            'status_code': entry.get('status_code'),
+            'status_desc': entry.get('status_desc') or '',
+            'score': entry.get('score'),
+            'runtime': entry.get('runtime'),
+            'timings': entry.get('timings')
+        })
+    return {'total': len(entries), 'page': page, 'page_size': page_size, 'items': items}
+
+
+def get_submission_results(contest_id, submission_id, participant_id=None):
+    """读取单个提交的主办方结果与参赛者输出，提交目录不存在时返回 None。"""
+    contest_dir = contest_paths(contest_id)[0]
+    submission_dir = resolve_submission_dir(contest_id, submission_id, participant_id)
+    if not submission_dir:
+        return None
+    output_dir = os.path.join(submission_dir, 'output')
+    record = None
+    if has_submission_records(contest_paths(contest_id)[3]):
+        record = contest_journal(contest_id).get(submission_id)
+    return {
+        'submission_id': submission_id,
+        'timings': (record or {}).get('timings'),
+        'organizer_results': read_results_file(os.path.join(submission_dir, 'organizer_results.json')),
+        'participant_output_results': read_results_file(os.path.join(output_dir, 'results.json')),
+        'participant_output_path': normalize_rel_path(output_dir, contest_dir) if os.path.exists(output_dir) else None
+    }
+
+
+# ==================== 分阶段耗时汇总 ====================
+
+MAX_TIMING_SAMPLES = 5000
+
+
+def _percentile(sorted_values, q):
+    """线性插值百分位数，sorted_values 需已升序排列。"""
+    pos = (len(sorted_values) - 1) * q
+    lower = int(pos)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (pos - lower)
+
+
+def summarize_timings(contest_id, limit=500, participant_id=None, slowest=5):
+    """
+    汇总最近 limit 个已完成提交的分阶段耗时（提交记录的 timings 字段，单位秒）
+
+    Returns:
+        dict: count、phases（按均值降序，每项含 count/mean/p50/p95/p99/max）、
+        slowest（process_total 最长的若干提交及其完整 timings）
+    """
+    entries, _ = load_index_entries(contest_id)
+    entries = [e for e in entries
+               if isinstance(e.get('timings'), dict) and e.get('status_code') not in PENDING_STATUSES]
+    if participant_id:
+        entries = [e for e in entries if (e.get('participant_id') or 'default') == participant_id]
+    entries.sort(key=lambda e: e.get('timestamp') or '', reverse=True)
+    entries = entries[:max(1, min(limit, MAX_TIMING_SAMPLES))]
+
+    values = {}
+    for entry in entries:
+        for phase, seconds in entry['timings'].items():
+            if isinstance(seconds, (int, float)) and not isinstance(seconds, bool):
+                values.setdefault(phase, []).append(float(seconds))
+
+    phases = []
+    for phase, samples in values.items():
+        samples.sort()
+        phases.append({
+            'phase': phase,
+            'count': len(samples),
+            'mean': round(sum(samples) / len(samples), 4),
+            'p50': round(_percentile(samples, 0.50), 4),
+            'p95': round(_percentile(samples, 0.95), 4),
+            'p99': round(_percentile(samples, 0.99), 4),
+            'max': round(samples[-1], 4),
+        })
+    phases.sort(key=lambda p: p['mean'], reverse=True)
 
+    ranked = sorted(entries, key=lambda e: e['timings'].get('process_total') or 0, reverse=True)
+    return {
+        'count': len(entries),
+        'phases': phases,
+        'slowest': [{
+            'submission_id': e.get('submission_id'),
+            'participant_id': e.get('participant_id') or 'default',
+            'submission_time': e.get('timestamp'),
+            'status_code': e.get('status_code'),
+            'timings': e['timings'],
+        } for e in ranked[:max(0, slowest)]],
+    }
@@ -0,0 +1,195 @@
+"""
+提交状态事件推送（Server-Sent Events）
+
+评测流程中的状态变化在进程内发布到本模块，前端通过 `/api/contests/<contest_id>/events`
+订阅，不再反复拉取完整的提交列表：
+- submitted：新提交进入队列
+- status：状态迁移（QUEUED → RUNNING → 结果码）
+- queue：排队位置变化（入队时推送新提交的位置；出队时向有订阅者的评测推送队头游标，
+  客户端按自己的 queue_id 计算位置，不再在每次入队/出队时读取整个队列）
+- result：评测完成后的主办方指标与运行时信息
+
+每个评测保留最近 EVENT_HISTORY_SIZE 条事件，客户端断线重连时携带 Last-Event-ID 即可补发；
+若所需事件已不在历史中（或服务重启导致 ID 重置），推送 reset 事件提示客户端重新拉取一次列表。
+"""
+
+import itertools
+import json
+import threading
+import time
+from collections import defaultdict, deque
+
+from config import EVENTS_HEARTBEAT_INTERVAL
+
+EVENT_HISTORY_SIZE = 500
+
+
+class EventBroker:
+    """按评测分组的进程内事件广播。"""
+
+    def __init__(self, history_size=EVENT_HISTORY_SIZE):
+        self._cond = threading.Condition()
+        self._seq = itertools.count(1)
+        self._last_id = 0
+        # contest_id -> deque[(event_id, event_type, data)]
+        self._history = defaultdict(lambda: deque(maxlen=history_size))
+        # contest_id -> 已被挤出历史的最大事件 ID
+        self._evicted = {}
+        # contest_id -> 当前连接的 SSE 客户端数
+        self._subscribers = defaultdict(int)
+
+    @property
+    def last_id(self):
+        return self._last_id
+
+    def publish(self, contest_id, event_type, data):
+        with self._cond:
+            event_id = next(self._seq)
+            self._last_id = event_id
+            history = self._history[contest_id]
+            if len(history) == history.maxlen:
+                self._evicted[contest_id] = history[0][0]
+            history.append((event_id, event_type, data))
+            self._cond.notify_all()
+        return event_id
+
+    def _events_after(self, contest_id, last_id):
+        """
+        返回 last_id 之后的事件，需持有 _cond
+
+        Returns:
+            list 或 None（last_id 之后的事件已部分丢失，需要客户端重新同步）
+        """
+        if last_id > self._last_id or self._evicted.get(contest_id, 0) > last_id:
+            return None
+        history = self._history.get(contest_id)
+        if not history:
+            return []
+        return [e for e in history if e[0] > last_id]
+
+    def wait(self, contest_id, last_id, timeout):
+        """等待 last_id 之后的事件，超时返回空列表。"""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while True:
+                events = self._events_after(contest_id, last_id)
+                if events is None or events:
+                    return events
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return []
+                self._cond.wait(remaining)
+
+    def subscribe(self, contest_id):
+        with self._cond:
+            self._subscribers[contest_id] += 1
+
+    def unsubscribe(self, contest_id):
+        with self._cond:
+            self._subscribers[contest_id] -= 1
+            if self._subscribers[contest_id] <= 0:
+                self._subscribers.pop(contest_id, None)
+
+    def subscribed_contests(self):
+        with self._cond:
+            return list(self._subscribers)
+
+    def forget(self, contest_id):
+        """评测删除时丢弃其事件历史。"""
+        with self._cond:
+            self._history.pop(contest_id, None)
+            self._evicted.pop(contest_id, None)
+
+
+broker = EventBroker()
+
+
+def _format(event_id, event_type, data):
+    payload = json.dumps(data, ensure_ascii=False)
+    return f'id: {event_id}\nevent: {event_type}\ndata: {payload}\n\n'
+
+
+def stream_events(contest_id, last_event_id=None, heartbeat=None):
+    """
+    生成 SSE 数据流
+
+    Args:
+        last_event_id: 客户端上次收到的事件 ID（Last-Event-ID），为空时只推送此后的新事件
+        heartbeat: 无事件时发送注释行保活的间隔（秒），默认 EVENTS_HEARTBEAT_INTERVAL
+    """
+    heartbeat = heartbeat or EVENTS_HEARTBEAT_INTERVAL
+    try:
+        last_id = int(last_event_id) if last_event_id else None
+    except ValueError:
+        last_id = None
+    if last_id is None:
+        last_id = broker.last_id
+        yield _format(last_id, 'ready', {'contest_id': contest_id})
+    # 建议客户端断线后 3 秒重连
+    yield 'retry: 3000\n\n'
+
+    broker.subscribe(contest_id)
+    try:
+        while True:
+            events = broker.wait(contest_id, last_id, heartbeat)
+            if events is None:
+                last_id = broker.last_id
+                yield _format(last_id, 'reset', {'contest_id': contest_id})
+                continue
+            if not events:
+                yield ': keep-alive\n\n'
+                continue
+            for event_id, event_type, data in events:
+                last_id = event_id
+                yield _format(event_id, event_type, data)
+    finally:
+        broker.unsubscribe(contest_id)
+
+
+def publish_submission(contest_id, record):
+    broker.publish(contest_id, 'submitted', {
+        'submission_id': record.get('submission_id'),
+        'participant_id': record.get('participant_id'),
+        'timestamp': record.get('timestamp'),
+        'status_code': record.get('status_code'),
+        'status_desc': record.get('status_desc')
+    })
+
+
+def publish_status(contest_id, submission_id, status_code, status_desc):
+    broker.publish(contest_id, 'status', {
+        'submission_id': submission_id,
+        'status_code': status_code,
+        'status_desc': status_desc
+    })
+
+
+def publish_result(contest_id, submission_id, organizer_results):
+    """推送评测完成后的主办方指标（indicator）与运行时信息。"""
+    if not isinstance(organizer_results, dict):
+        return
+    broker.publish(contest_id, 'result', {
+        'submission_id': submission_id,
+        'indicator': organizer_results.get('indicator'),
+        'runtimeInfo': organizer_results.get('runtimeInfo')
+    })
+
+
+def publish_queued(contest_id, submission_id, queue_id, queue_size, head):
+    """推送新提交的排队位置（新任务总在队尾，位置即队列长度，其余任务的位置不变）。"""
+    broker.publish(contest_id, 'queue', {
+        'queue_size': queue_size,
+        'head': head,
+        'positions': [{'submission_id': submission_id, 'queue_id': queue_id, 'position': queue_size}]
+    })
+
+
+def publish_queue_cursor(queue_size, head):
+    """
+    出队后向有订阅者的评测推送队头游标
+
+    队列按 queue_id 先进先出，排队中的提交位置为 queue_id - head + 1；head 为 None 表示队列已空。
+    """
+    data = {'queue_size': queue_size, 'head': head}
+    for contest_id in broker.subscribed_contests():
+        broker.publish(contest_id, 'queue', data)
@@ -1,54 +1,301 @@
+"""
+评测任务队列
+
+基于 SQLite（WAL 模式）的持久化队列，替代原先每次操作都整体读写的 task_queue.json：
+- 入队 / 出队 / 队列长度均为 O(1)（按 (state, id) 索引取队头，长度由计数表维护）
+- 出队采用租约（lease）：任务被取出后进入 leased 状态，超过可见性超时仍未确认则自动回到队列
+- 进程重启时调用 recover_leased_tasks() 将上次未完成的任务重新入队
+- 超过最大投递次数的任务标记为 dead，保留在库中便于排查；调用方通过 on_dead 回调更新对应提交的状态
+
+对外接口保持 enqueue_task / dequeue_task / peek_queue / queue_size 不变；排队位置由队头 ID
+（queue_head，按 (state, id) 索引取得）与任务自身的队列 ID 计算，不需要读取整个队列。
+"""
+
 import json
 import os
+import sqlite3
 import threading
+import time
 from datetime import datetime
 
+from config import QUEUE_DB_PATH, QUEUE_VISIBILITY_TIMEOUT, QUEUE_MAX_ATTEMPTS
+
+# 旧版 JSON 队列文件，首次初始化时迁移其中尚未处理的任务
 QUEUE_FILE = './task_queue.json'
-_queue_lock = threading.Lock()
 
+_local = threading.local()
+_init_lock = threading.Lock()
+_initialized = False
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    payload TEXT NOT NULL,
+    state TEXT NOT NULL DEFAULT 'queued',
+    enqueued_at TEXT,
+    lease_until REAL,
+    attempts INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_tasks_state_id ON tasks (state, id);
+CREATE INDEX IF NOT EXISTS idx_tasks_state_lease ON tasks (state, lease_until);
+CREATE TABLE IF NOT EXISTS queue_meta (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+"""
+
+
+def _connect():
+    os.makedirs(os.path.dirname(QUEUE_DB_PATH) or '.', exist_ok=True)
+    conn = sqlite3.connect(QUEUE_DB_PATH, timeout=30, isolation_level=None, check_same_thread=False)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.execute('PRAGMA busy_timeout=30000')
+    return conn
+
+
+def _get_conn():
+    """每个线程复用一个连接；首次调用时建表并迁移旧队列。"""
+    _ensure_initialized()
+    conn = getattr(_local, 'conn', None)
+    if conn is None:
+        conn = _connect()
+        _local.conn = conn
+    return conn
+
+
+def _ensure_initialized():
+    global _initialized
+    if _initialized:
+        return
+    with _init_lock:
+        if _initialized:
+            return
+        conn = _connect()
+        try:
+            conn.executescript(_SCHEMA)
+            conn.execute("INSERT OR IGNORE INTO queue_meta (key, value) VALUES ('queued', 0)")
+            # 计数表与实际数据对齐（防止异常退出导致计数漂移）
+            conn.execute(
+                "UPDATE queue_meta SET value = (SELECT COUNT(*) FROM tasks WHERE state = 'queued') "
+                "WHERE key = 'queued'"
+            )
+            _migrate_legacy_queue(conn)
+        finally:
+            conn.close()
+        _initialized = True
 
-def _load_queue():
+
+def _migrate_legacy_queue(conn):
+    """将旧版 task_queue.json 中遗留的任务导入 SQLite 队列。"""
     if not os.path.exists(QUEUE_FILE):
-        return []
+        return
     try:
         with open(QUEUE_FILE, 'r', encoding='utf-8') as f:
-            return json.load(f)
+            legacy = json.load(f)
     except Exception:
-        return []
+        return
+    if not legacy:
+        return
 
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        for task in legacy:
+            conn.execute(
+                "INSERT INTO tasks (payload, state, enqueued_at) VALUES (?, 'queued', ?)",
+                (json.dumps(task, ensure_ascii=False), task.get('enqueued_at'))
+            )
+        conn.execute("UPDATE queue_meta SET value = value + ? WHERE key = 'queued'", (len(legacy),))
+        conn.execute('COMMIT')
+    except Exception:
+        conn.execute('ROLLBACK')
+        raise
 
-def _save_queue(queue):
-    os.makedirs(os.path.dirname(QUEUE_FILE) or '.', exist_ok=True)
+    # 迁移完成后清空旧文件，避免重复导入
     with open(QUEUE_FILE, 'w', encoding='utf-8') as f:
-        json.dump(queue, f, ensure_ascii=False, indent=2)
+        json.dump([], f)
+
+
+def _row_to_task(row):
+    task_id, payload, attempts = row
+    task = json.loads(payload)
+    task['_queue_id'] = task_id
+    task['_attempts'] = attempts
+    return task
+
+
+def _mark_dead(conn, condition, params):
+    """将满足条件、已超过最大投递次数的租出任务标记为 dead，返回这些任务。"""
+    rows = conn.execute(
+        f"SELECT id, payload, attempts FROM tasks WHERE state = 'leased' AND attempts >= ? {condition}",
+        (QUEUE_MAX_ATTEMPTS, *params)
+    ).fetchall()
+    if rows:
+        conn.executemany(
+            "UPDATE tasks SET state = 'dead', lease_until = NULL WHERE id = ?",
+            [(row[0],) for row in rows]
+        )
+    return [_row_to_task(row) for row in rows]
+
+
+def _reclaim_expired(conn, now):
+    """将租约已过期的任务放回队列；超过最大投递次数的标记为 dead 并返回。"""
+    dead = _mark_dead(conn, 'AND lease_until < ?', (now,))
+    cur = conn.execute(
+        "UPDATE tasks SET state = 'queued', lease_until = NULL "
+        "WHERE state = 'leased' AND lease_until < ?",
+        (now,)
+    )
+    if cur.rowcount:
+        conn.execute("UPDATE queue_meta SET value = value + ? WHERE key = 'queued'", (cur.rowcount,))
+    return dead
 
 
 def enqueue_task(task):
-    with _queue_lock:
-        queue = _load_queue()
-        task['enqueued_at'] = datetime.utcnow().isoformat()
-        queue.append(task)
-        _save_queue(queue)
-        # 返回当前队列长度（包含本任务）
-        return len(queue)
+    conn = _get_conn()
+    task['enqueued_at'] = datetime.utcnow().isoformat()
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        cur = conn.execute(
+            "INSERT INTO tasks (payload, state, enqueued_at) VALUES (?, 'queued', ?)",
+            (json.dumps(task, ensure_ascii=False), task['enqueued_at'])
+        )
+        task['_queue_id'] = cur.lastrowid
+        conn.execute("UPDATE queue_meta SET value = value + 1 WHERE key = 'queued'")
+        size = conn.execute("SELECT value FROM queue_meta WHERE key = 'queued'").fetchone()[0]
+        conn.execute('COMMIT')
+    except Exception:
+        conn.execute('ROLLBACK')
+        raise
+    # 返回当前队列长度（包含本任务）；本任务的队列 ID 写入 task['_queue_id']
+    return size
 
 
-def dequeue_task():
-    with _queue_lock:
-        queue = _load_queue()
-        if not queue:
-            return None
-        task = queue.pop(0)
-        _save_queue(queue)
-        return task
+def dequeue_task(visibility_timeout=None, on_dead=None):
+    """
+    取出队头任务并加租约
+
+    返回的任务字典带有 `_queue_id`，处理完成后需调用 complete_task() 确认（运行期间用 extend_lease() 续租）；
+    未确认的任务在 visibility_timeout 秒后重新可见。回收过期租约时被标记为 dead 的任务在提交后传给 on_dead。
+    """
+    if visibility_timeout is None:
+        visibility_timeout = QUEUE_VISIBILITY_TIMEOUT
+    conn = _get_conn()
+    now = time.time()
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        dead = _reclaim_expired(conn, now)
+        row = conn.execute(
+            "SELECT id, payload, attempts FROM tasks WHERE state = 'queued' ORDER BY id LIMIT 1"
+        ).fetchone()
+        if row is not None:
+            conn.execute(
+                "UPDATE tasks SET state = 'leased', lease_until = ?, attempts = attempts + 1 WHERE id = ?",
+                (now + visibility_timeout, row[0])
+            )
+            conn.execute("UPDATE queue_meta SET value = value - 1 WHERE key = 'queued'")
+        conn.execute('COMMIT')
+    except Exception:
+        conn.execute('ROLLBACK')
+        raise
+    if dead and on_dead is not None:
+        on_dead(dead)
+    if row is None:
+        return None
+    return _row_to_task((row[0], row[1], row[2] + 1))
+
+
+def complete_task(task):
+    """确认任务已处理完成，从队列中删除。"""
+    queue_id = task.get('_queue_id') if isinstance(task, dict) else task
+    if queue_id is None:
+        return
+    conn = _get_conn()
+    conn.execute("DELETE FROM tasks WHERE id = ? AND state = 'leased'", (queue_id,))
+
+
+def extend_lease(task, seconds=None):
+    """
+    延长任务租约（长时间运行的任务周期性调用）
+
+    Returns:
+        bool：任务仍由调用方持有（租约已延长）；False 表示租约已被回收
+    """
+    if seconds is None:
+        seconds = QUEUE_VISIBILITY_TIMEOUT
+    queue_id = task.get('_queue_id') if isinstance(task, dict) else task
+    if queue_id is None:
+        return False
+    conn = _get_conn()
+    cur = conn.execute(
+        "UPDATE tasks SET lease_until = ? WHERE id = ? AND state = 'leased'",
+        (time.time() + seconds, queue_id)
+    )
+    return cur.rowcount > 0
+
+
+def requeue_task(task):
+    """放弃租约，将任务放回队列（保持原有排队位置）。"""
+    queue_id = task.get('_queue_id') if isinstance(task, dict) else task
+    if queue_id is None:
+        return
+    conn = _get_conn()
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        cur = conn.execute(
+            "UPDATE tasks SET state = 'queued', lease_until = NULL WHERE id = ? AND state = 'leased'",
+            (queue_id,)
+        )
+        if cur.rowcount:
+            conn.execute("UPDATE queue_meta SET value = value + 1 WHERE key = 'queued'")
+        conn.execute('COMMIT')
+    except Exception:
+        conn.execute('ROLLBACK')
+        raise
+
+
+def recover_leased_tasks(on_dead=None):
+    """
+    进程启动时调用：上一次运行中被租出但未确认的任务全部重新入队
+
+    超过最大投递次数的任务标记为 dead，在提交后传给 on_dead。
+
+    Returns:
+        int: 重新入队的任务数
+    """
+    conn = _get_conn()
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        dead = _mark_dead(conn, '', ())
+        cur = conn.execute(
+            "UPDATE tasks SET state = 'queued', lease_until = NULL WHERE state = 'leased'"
+        )
+        recovered = cur.rowcount
+        if recovered:
+            conn.execute("UPDATE queue_meta SET value = value + ? WHERE key = 'queued'", (recovered,))
+        conn.execute('COMMIT')
+    except Exception:
+        conn.execute('ROLLBACK')
+        raise
+    if dead and on_dead is not None:
+        on_dead(dead)
+    return recovered
 
 
 def peek_queue():
-    with _queue_lock:
-        return list(_load_queue())
+    conn = _get_conn()
+    rows = conn.execute(
+        "SELECT id, payload, attempts FROM tasks WHERE state = 'queued' ORDER BY id"
+    ).fetchall()
+    return [_row_to_task(row) for row in rows]
 
 
-def queue_size():
-    with _queue_lock:
-        return len(_load_queue())
+def queue_head():
+    """队头任务的队列 ID，队列为空时返回 None。"""
+    conn = _get_conn()
+    return conn.execute("SELECT MIN(id) FROM tasks WHERE state = 'queued'").fetchone()[0]
 
+
+def queue_size():
+    conn = _get_conn()
+    return conn.execute("SELECT value FROM queue_meta WHERE key = 'queued'").fetchone()[0]
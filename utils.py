@@ -2,11 +2,13 @@
 
 本模块提供一组轻量级的帮助函数，包括：
 - 从磁盘加载用户列表
-- 解压 ZIP 文件到目录
+- 解压 ZIP 文件到目录（大文件按成员多线程并行）
 - 简单的文件名/后缀校验
 - 路径归一化（生成相对路径并统一为 POSIX 风格）
 - 读取结果文件（优先解析为 JSON，否则返回原始文本）
 - 获取并判断磁盘可用空间
+- 解析 Docker 内存限制字符串、读取宿主机 CPU/内存信息
+- 以 reflink 生成目录快照（零复制，不支持时复制；硬链接需显式开启）
 
 这些函数尽量保持副作用最小、容错友好，以避免在运行时因为单个文件出错而导致整个服务中断。
 """
@@ -15,8 +17,12 @@ import json
 import os
 import zipfile
 import shutil
+from concurrent.futures import ThreadPoolExecutor
 
-from config import ALLOWED_TAR_EXTENSIONS, ALLOWED_ZIP_EXTENSIONS
+from config import ALLOWED_TAR_EXTENSIONS, ALLOWED_ZIP_EXTENSIONS, ZIP_MAX_EXPANDED_SIZE, ZIP_MAX_FILES
+
+# 解压总大小低于该值的 ZIP 不值得多线程并行
+ZIP_PARALLEL_MIN_BYTES = 64 * 1024 * 1024
 
 
 def load_users():
@@ -35,15 +41,72 @@ def load_users():
         return []
 
 
-def extract_zip_to_folder(zip_path, extract_path):
+def zip_member_target(extract_path, name):
+    """返回 ZIP 成员解压后的绝对路径；成员名为绝对路径或包含 `..` 时返回 None（路径穿越）。"""
+    name = name.replace('\\', '/')
+    if name.startswith('/') or (len(name) > 1 and name[1] == ':'):
+        return None
+    parts = [p for p in name.split('/') if p not in ('', '.')]
+    if not parts or '..' in parts:
+        return None
+    root = os.path.abspath(extract_path)
+    target = os.path.join(root, *parts)
+    if os.path.commonpath([root, target]) != root:
+        return None
+    return target
+
+
+def extract_zip_to_folder(zip_path, extract_path, workers=1):
     """将 ZIP 压缩包解压到目标目录。
 
+    `workers` 大于 1 且解压总大小超过 ZIP_PARALLEL_MIN_BYTES 时，按成员大小把文件均衡分配给多个线程
+    并行解压（每个线程独立打开 ZipFile，zlib 解压期间会释放 GIL）。
+
     返回 (success: bool, error: str|None)。解压成功时返回 (True, None)，
     失败时返回 (False, 错误信息)。
     """
     try:
         with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-            zip_ref.extractall(extract_path)
+            members = zip_ref.infolist()
+            total = sum(m.file_size for m in members)
+            # 解压炸弹防护（按中央目录声明的大小，流式接收的压缩包在 zip_stream 中按实际解压字节检查）
+            if len(members) > ZIP_MAX_FILES:
+                return False, f'压缩包成员数超过上限 {ZIP_MAX_FILES}'
+            if total > ZIP_MAX_EXPANDED_SIZE:
+                return False, f'解压后总大小超过上限 {ZIP_MAX_EXPANDED_SIZE} 字节'
+            if workers <= 1 or len(members) < 2 or total < ZIP_PARALLEL_MIN_BYTES:
+                zip_ref.extractall(extract_path)
+                return True, None
+
+        # 先在主线程创建全部目录，避免多个线程同时创建同一父目录
+        files = []
+        for member in members:
+            target = zip_member_target(extract_path, member.filename)
+            if target is None:
+                return False, f'非法的压缩包成员路径: {member.filename}'
+            if member.is_dir():
+                os.makedirs(target, exist_ok=True)
+            else:
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                files.append((member, target))
+
+        # 最长处理时间优先：从大到小依次分给当前负载最小的线程
+        buckets = [[] for _ in range(min(workers, len(files)))]
+        loads = [0] * len(buckets)
+        for member, target in sorted(files, key=lambda x: x[0].file_size, reverse=True):
+            i = loads.index(min(loads))
+            buckets[i].append((member, target))
+            loads[i] += member.file_size
+
+        def extract_bucket(bucket):
+            with zipfile.ZipFile(zip_path, 'r') as zf:
+                for member, target in bucket:
+                    with zf.open(member) as src, open(target, 'wb') as dst:
+                        shutil.copyfileobj(src, dst, 1024 * 1024)
+
+        with ThreadPoolExecutor(max_workers=len(buckets), thread_name_prefix='unzip') as pool:
+            for _ in pool.map(extract_bucket, buckets):
+                pass
         return True, None
     except Exception as e:
         return False, str(e)
@@ -152,3 +215,119 @@ def is_disk_space_sufficient(path, min_bytes):
         return True, None
     return (free >= min_bytes), free
 
+
+
+_MEM_UNITS = {'b': 1, 'k': 1024, 'm': 1024 ** 2, 'g': 1024 ** 3}
+
+
+def parse_mem_limit(value):
+    """将 Docker 风格的内存限制（如 '2g'、'512m'、'1024'）解析为字节数。
+
+    无法解析时返回 None。
+    """
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return int(value)
+    text = str(value).strip().lower()
+    if not text:
+        return None
+    unit = 1
+    if text[-1] in _MEM_UNITS:
+        unit = _MEM_UNITS[text[-1]]
+        text = text[:-1]
+    try:
+        return int(float(text) * unit)
+    except ValueError:
+        return None
+
+
+def get_host_memory():
+    """返回宿主机内存 (total_bytes, available_bytes)。
+
+    优先读取 /proc/meminfo；在非 Linux 平台上回退到 sysconf（此时 available 为 None），
+    都不可用时返回 (None, None)。
+    """
+    try:
+        values = {}
+        with open('/proc/meminfo', 'r', encoding='utf-8') as f:
+            for line in f:
+                key, _, rest = line.partition(':')
+                if key in ('MemTotal', 'MemAvailable'):
+                    values[key] = int(rest.split()[0]) * 1024
+        if 'MemTotal' in values:
+            return values['MemTotal'], values.get('MemAvailable')
+    except Exception:
+        pass
+    try:
+        total = os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+        return total, None
+    except Exception:
+        return None, None
+
+
+def get_host_load():
+    """返回最近 1 分钟的系统平均负载，不支持的平台返回 None。"""
+    try:
+        return os.getloadavg()[0]
+    except (AttributeError, OSError):
+        return None
+
+
+# Linux FICLONE ioctl：在 btrfs/xfs 等支持 reflink 的文件系统上共享数据块
+_FICLONE = 0x40049409
+
+
+def _reflink_file(src, dst):
+    """尝试以 reflink 方式克隆文件，不支持时抛出 OSError。"""
+    import fcntl
+
+    with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+        try:
+            fcntl.ioctl(fdst.fileno(), _FICLONE, fsrc.fileno())
+        except OSError:
+            fdst.close()
+            os.remove(dst)
+            raise
+    shutil.copystat(src, dst)
+
+
+def snapshot_file(src, dst, allow_hardlink=False):
+    """以尽量零复制的方式生成文件快照：reflink → （allow_hardlink 时）硬链接 → 普通复制。
+
+    reflink 与复制得到的是独立文件，源文件之后被原地修改不会影响快照；
+    硬链接与源文件共享同一 inode，只能防止源文件被整体替换（删除后重建、rename 覆盖）。
+
+    返回实际使用的方式：'reflink' / 'hardlink' / 'copy'。
+    """
+    try:
+        _reflink_file(src, dst)
+        return 'reflink'
+    except (OSError, ImportError):
+        pass
+    if allow_hardlink:
+        try:
+            os.link(src, dst)
+            return 'hardlink'
+        except OSError:
+            pass
+    shutil.copy2(src, dst)
+    return 'copy'
+
+
+def snapshot_tree(src_dir, dst_dir, allow_hardlink=False):
+    """为目录生成快照，文件逐个按 `snapshot_file` 的顺序尝试零复制。
+
+    返回各方式使用次数的统计字典。
+    """
+    counts = {'reflink': 0, 'hardlink': 0, 'copy': 0}
+    os.makedirs(dst_dir, exist_ok=True)
+    for root, dirs, files in os.walk(src_dir):
+        rel = os.path.relpath(root, src_dir)
+        target_root = dst_dir if rel == '.' else os.path.join(dst_dir, rel)
+        for d in dirs:
+            os.makedirs(os.path.join(target_root, d), exist_ok=True)
+        for name in files:
+            method = snapshot_file(os.path.join(root, name), os.path.join(target_root, name), allow_hardlink)
+            counts[method] += 1
+    return counts
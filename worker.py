@@ -1,7 +1,5 @@
-import docker
 import os
 import json
-import threading
 import time
 from enum import Enum
 from config import (
@@ -12,37 +10,118 @@ from config import (
     ORGANIZER_CPU_CORES, 
     ORGANIZER_MEM_LIMIT
 )
-from container_metrics import ContainerMetricsCollector
+from container_metrics import create_metrics_collector
+from executors import get_executor
+from log_capture import LogCapture
+from service_metrics import images_loaded_total, image_load_seconds
 from rules.organizer_rules import validate_organizer_results, OrganizerValidationError, add_runtime_info
 
+class PhaseTimer:
+    """
+    按阶段累计 run_worker 的耗时（time.monotonic）
+
+    begin(name) 结束当前阶段并开始新阶段，异常时耗时计入出错的阶段；
+    同名阶段多次出现时累加。record(name, seconds) 记录不由计时器测量的耗时
+    （例如容器自身的 StartedAt/FinishedAt）。
+    """
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.phases = {}
+        self._current = None
+        self._since = None
+
+    def begin(self, name):
+        now = time.monotonic()
+        if self._current is not None:
+            self.phases[self._current] = self.phases.get(self._current, 0.0) + now - self._since
+        self._current = name
+        self._since = now
+
+    def end(self):
+        self.begin(None)
+
+    def record(self, name, seconds):
+        if seconds is not None:
+            self.phases[name] = seconds
+
+    def as_dict(self):
+        """各阶段耗时（秒），total 为从创建到 end() 的总耗时。"""
+        result = {name: round(seconds, 4) for name, seconds in self.phases.items()}
+        result['total'] = round((self._since or time.monotonic()) - self.started, 4)
+        return result
+
+
+def container_timing(executor, container_id, start_requested):
+    """
+    根据容器自身的启动/退出时间计算启动延迟与容器内运行时间
+
+    Args:
+        start_requested: 调用 start 前的 time.time()
+
+    Returns:
+        (start_latency, runtime)：秒，无法获取时为 None
+    """
+    try:
+        started_at, finished_at = executor.container_times(container_id)
+    except Exception as e:
+        print(f"[WORKER] 获取容器运行时间失败: {e}")
+        return None, None
+    start_latency = max(0.0, started_at - start_requested) if started_at else None
+    runtime = max(0.0, finished_at - started_at) if started_at and finished_at else None
+    return start_latency, runtime
+
+
+def follow_logs(log, executor, container_id):
+    """跟随容器日志；获取日志流失败只在日志中说明，不影响评测本身。"""
+    try:
+        log.follow(executor.logs(container_id), container_id[:12])
+    except Exception as e:
+        print(f"[WORKER] 获取容器日志失败: {e}")
+        log.note(f"获取日志失败: {e}")
+
+
 class StatusCode(Enum):
     SUCCESS = "SUCCESS"  # 执行成功
     TIMEOUT = "TIMEOUT"  # 超时
     ERROR = "ERROR"  # 执行出错
     CONTAINER_ERROR = "CONTAINER_ERROR"  # 容器执行失败
 
-def run_worker(image_tar_path: str, output_dir: str, input_dir: str = None, contest_dir: str = None, timeout: int = None, participant_id: str = None):
+def run_worker(image_tar_path: str, output_dir: str, input_dir: str = None, contest_dir: str = None, timeout: int = None, participant_id: str = None, log_dir: str = None):
     # 使用配置中的超时时间作为默认值
     if timeout is None:
         timeout = PARTICIPANT_TIMEOUT
+    # 日志默认写入提交目录（output 的上一级）
+    if log_dir is None:
+        log_dir = os.path.dirname(os.path.abspath(output_dir))
     
-    client = docker.from_env()
+    # 镜像与容器都通过执行后端操作（EXECUTOR_BACKEND：docker 或进程内模拟的 fake）
+    executor = get_executor()
     container = None
     image = None
     organizer_container = None
-    organizer_image = None
-    logs_text = ""
+    organizer_image_digest = None
     status_code = StatusCode.ERROR
     organizer_output_abs = None
+
+    # 容器日志边运行边写入文件（超过 LOG_MAX_BYTES 时保留首尾）
+    participant_log = LogCapture(os.path.join(log_dir, 'participant_logs.txt'))
+    organizer_log = None
     
     # 参赛者容器统计
     metrics_collector = None
     participant_runtime = 0  # 运行时间（秒）
+    image_load_stats = None
+    # 各阶段耗时（镜像加载、容器创建/启动、运行、日志收尾、主办方评测、结果校验、清理）
+    timer = PhaseTimer()
     
     try:
-        # 加载镜像
-        with open(image_tar_path, 'rb') as f:
-            image = client.images.load(f.read())[0]
+        # 流式加载镜像（内存占用与镜像大小无关，.tar.gz 即时解压；已存在的层不重复传输）
+        timer.begin('image_load')
+        image, image_load_stats = executor.load_image(image_tar_path)
+        images_loaded_total.inc(kind='participant')
+        image_load_seconds.observe(image_load_stats.get('seconds'), kind='participant')
+        timer.begin('container_create')
 
         # 创建输出挂载目录（使用绝对路径，Windows Docker 需要）
         output_dir_abs = os.path.abspath(output_dir)
@@ -51,85 +130,72 @@ def run_worker(image_tar_path: str, output_dir: str, input_dir: str = None, cont
         # 准备挂载卷
         volumes = {output_dir_abs: {'bind': '/output', 'mode': 'rw'}}
         
-        # 挂载评测数据源 source 到 /input
-        if contest_dir:
+        # 挂载评测数据到 /input（只读）：优先使用任务指定的输入目录（共享数据源或提交快照），
+        # 未指定时挂载评测的 dataset/source
+        if input_dir and os.path.exists(input_dir):
+            volumes[os.path.abspath(input_dir)] = {'bind': '/input', 'mode': 'ro'}
+        elif contest_dir:
             source_dir = os.path.join(contest_dir, 'info', 'dataset', 'source')
             source_dir_abs = os.path.abspath(source_dir)
             if os.path.exists(source_dir_abs):
                 volumes[source_dir_abs] = {'bind': '/input', 'mode': 'ro'}
 
-        # 运行容器（使用镜像默认命令）
-        container = client.containers.run(
-            image=image.id,
-            detach=True,
-            volumes=volumes,
-            network_disabled=True,
+        # 创建容器（使用镜像默认命令），先注册事件等待再启动，避免错过快速退出容器的 die 事件
+        container = executor.create(
+            image,
+            volumes,
             mem_limit=PARTICIPANT_MEM_LIMIT,
-            nano_cpus=PARTICIPANT_CPU_CORES * 1_000_000_000,
-            user='root'
+            nano_cpus=PARTICIPANT_CPU_CORES * 1_000_000_000
         )
+        participant_watch = executor.watch(container)
+        timer.begin('container_start')
+        start_requested = time.time()
+        executor.start(container)
+        follow_logs(participant_log, executor, container)
 
-        # 启动参赛者容器的资源指标收集
-        # 使用更短的采样间隔以便快速任务也能收集到数据
-        metrics_collector = ContainerMetricsCollector(container.id, collection_interval=0.2)
-        metrics_thread = metrics_collector.start_collection()
+        # 启动参赛者容器的资源指标收集（数据源由执行后端提供，Docker 后端优先直接读取 cgroup v2）
+        metrics_collector = create_metrics_collector(container)
+        metrics_collector.start_collection()
         
         # 记录开始时间
-        start_time = time.time()
+        start_time = time.monotonic()
+        timer.begin('participant_run')
 
-        # 等待容器执行完成（带超时检测）
-        def wait_container():
-            try:
-                result = container.wait()
-                exit_code = result.get('StatusCode', -1)
-                return result, exit_code
-            except Exception as e:
-                return None, -1
-        
-        # 使用线程等待容器完成
-        wait_result = [None]
-        wait_exit_code = [-1]
-        
-        def wait_thread():
-            result, exit_code = wait_container()
-            wait_result[0] = result
-            wait_exit_code[0] = exit_code
-        
-        wait_thread_obj = threading.Thread(target=wait_thread)
-        wait_thread_obj.daemon = True
-        wait_thread_obj.start()
-        wait_thread_obj.join(timeout=timeout)
+        # 等待容器退出事件（超时由事件中心的定时器堆统一处理）
+        finished = participant_watch.wait(timeout=timeout)
         
-        # 计算运行时间
-        participant_runtime = round(time.time() - start_time, 2)
+        # 计算运行时间（优先使用容器自身的 StartedAt/FinishedAt，见下方）
+        participant_runtime = round(time.monotonic() - start_time, 2)
         
-        # 给采集线程一点额外的时间来完成最后的采样
-        # 特别是对于快速完成的容器，这确保了至少有一次有效采样
-        time.sleep(0.1)
-        
-        # 停止指标收集
+        # 停止指标收集（注销时会补采最后一次样本，无需额外等待）
+        timer.begin('log_drain')
         metrics_collector.stop_collection()
         
-        # 收集容器运行日志（在停止容器前收集，确保能获取到日志）
-        try:
-            logs = container.logs(stdout=True, stderr=True, timestamps=False)
-            logs_text = logs.decode('utf-8', errors='replace')
-        except Exception:
-            logs_text = "获取日志失败"
-        
         # 检查是否超时
-        if wait_thread_obj.is_alive():
+        if not finished:
             # 超时，强制停止容器
             try:
-                container.stop(timeout=10)
+                executor.stop(container, timeout=10)
             except Exception:
                 pass
             exit_code = -1
             status_code = StatusCode.TIMEOUT
-        else:
+        
+        # 容器退出后日志流随之结束，等待剩余输出写完
+        participant_log.wait(timeout=10)
+
+        # 容器内运行时间不含事件分发与线程调度的延迟
+        start_latency, container_runtime = container_timing(executor, container, start_requested)
+        timer.record('start_latency', start_latency)
+        timer.record('container_runtime', container_runtime)
+        if container_runtime is not None:
+            participant_runtime = round(container_runtime, 2)
+
+        if finished:
             # 正常完成
-            result = wait_result[0]
-            exit_code = wait_exit_code[0]
+            exit_code = participant_watch.exit_code
+            if participant_watch.oom_killed:
+                participant_log.note("错误: 容器内存超出限制被终止 (OOM)")
             if exit_code == 0:
                 # 检查是否输出了 result.json 文件predict_results
                 result_json_path = os.path.join(output_dir_abs, 'results.json')
@@ -138,16 +204,14 @@ def run_worker(image_tar_path: str, output_dir: str, input_dir: str = None, cont
                 else:
                     # 容器退出码为0但没有输出result.json，视为失败
                     status_code = StatusCode.CONTAINER_ERROR
-                    if logs_text and "获取日志失败" not in logs_text:
-                        logs_text += "\n错误: 容器执行完成但未找到 results.json 文件"
-                    else:
-                        logs_text = "错误: 容器执行完成但未找到 results.json 文件"
+                    participant_log.note("错误: 容器执行完成但未找到 results.json 文件")
             else:
                 status_code = StatusCode.CONTAINER_ERROR
 
         # -- 在参赛者容器执行完成后，尝试运行主办方镜像（如果提供 contest_dir 并且 info.json 指定了 image）
         organizer_result = None
         if contest_dir:
+            timer.begin('organizer_image')
             try:
                 info_json_path = os.path.join(contest_dir, 'info', 'info.json')
                 if os.path.exists(info_json_path):
@@ -163,11 +227,13 @@ def run_worker(image_tar_path: str, output_dir: str, input_dir: str = None, cont
                             organizer_output_abs = os.path.abspath(organizer_output_abs)
                             os.makedirs(organizer_output_abs, exist_ok=True)
 
-                            # 加载主办方镜像
-                            with open(org_image_tar, 'rb') as f:
-                                organizer_image = client.images.load(f.read())[0]
-
+                            # 从缓存获取主办方镜像（同一评测只在首次使用时加载）
+                            contest_id = os.path.basename(os.path.normpath(contest_dir))
+                            organizer_image, organizer_image_digest = executor.acquire_organizer_image(
+                                contest_id, org_image_tar
+                            )
 
+                            timer.begin('organizer_run')
                             # 挂载评测结果集 result 到 /result，参赛者 output -> /input，主办方 output -> /output
                             participant_output_abs = output_dir_abs
                             result_dir = os.path.join(contest_dir, 'info', 'dataset', 'result')
@@ -180,38 +246,36 @@ def run_worker(image_tar_path: str, output_dir: str, input_dir: str = None, cont
                                 org_volumes[result_dir_abs] = {'bind': '/result', 'mode': 'ro'}
 
                             # 运行主办方容器
-                            organizer_container = client.containers.run(
-                                image=organizer_image.id,
-                                detach=True,
-                                volumes=org_volumes,
-                                network_disabled=True,
+                            organizer_container = executor.create(
+                                organizer_image,
+                                org_volumes,
                                 mem_limit=ORGANIZER_MEM_LIMIT,
-                                nano_cpus=ORGANIZER_CPU_CORES * 1_000_000_000,
-                                user='root'
+                                nano_cpus=ORGANIZER_CPU_CORES * 1_000_000_000
                             )
+                            organizer_watch = executor.watch(organizer_container)
+                            organizer_log = LogCapture(os.path.join(log_dir, 'organizer_logs.txt'))
+                            organizer_start_requested = time.time()
+                            executor.start(organizer_container)
+                            follow_logs(organizer_log, executor, organizer_container)
 
-                            # 等待主办方容器完成（同步等待，沿用 timeout）
-                            try:
-                                org_wait = organizer_container.wait(timeout=timeout)
-                                org_exit = org_wait.get('StatusCode', -1)
-                            except Exception:
+                            # 等待主办方容器完成（沿用 timeout）
+                            if organizer_watch.wait(timeout=timeout):
+                                org_exit = organizer_watch.exit_code
+                            else:
                                 try:
-                                    organizer_container.stop(timeout=5)
+                                    executor.stop(organizer_container, timeout=5)
                                 except Exception:
                                     pass
                                 org_exit = -1
+                            organizer_log.wait(timeout=10)
 
-                            # 获取主办方日志
-                            try:
-                                org_logs = organizer_container.logs(stdout=True, stderr=True, timestamps=False)
-                                org_logs_text = org_logs.decode('utf-8', errors='replace')
-                            except Exception:
-                                org_logs_text = '获取主办方日志失败'
+                            org_start_latency, org_runtime = container_timing(
+                                executor, organizer_container, organizer_start_requested
+                            )
+                            timer.record('organizer_start_latency', org_start_latency)
+                            timer.record('organizer_container_runtime', org_runtime)
 
-                            organizer_result = {
-                                'exit_code': org_exit,
-                                'logs': org_logs_text
-                            }
+                            organizer_result = {'exit_code': org_exit}
                         else:
                             organizer_result = {'error': f'主办方镜像文件未找到: {org_image_tar}'}
                 else:
@@ -219,36 +283,48 @@ def run_worker(image_tar_path: str, output_dir: str, input_dir: str = None, cont
             except Exception as e:
                 organizer_result = {'error': f'运行主办方镜像失败: {str(e)}'}
 
+            # 主办方镜像未能运行时，把原因写入主办方日志
+            if organizer_result and organizer_result.get('error'):
+                if organizer_log is None:
+                    organizer_log = LogCapture(os.path.join(log_dir, 'organizer_logs.txt'))
+                organizer_log.note(organizer_result['error'])
+
     except Exception as e:
         # 打印完整回溯以便定位错误来源（例如 Docker API 连接超时）
         import traceback
         traceback.print_exc()
         print("Exception type:", type(e), e)
         status_code = StatusCode.ERROR
-        # 把回溯也放入返回的 logs_text，便于上层日志查看
-        logs_text = f"执行出错: {str(e)}\nTraceback:\n{traceback.format_exc()}"
+        # 把回溯也写入参赛者日志，便于上层日志查看
+        participant_log.note(f"执行出错: {str(e)}\nTraceback:\n{traceback.format_exc()}")
 
     finally:
         # 清理容器和镜像
+        timer.begin('cleanup')
         if container:
+            executor.unwatch(container)
             try:
-                container.remove(force=True)
+                executor.remove(container)
             except Exception:
                 pass
         if image:
             try:
-                client.images.remove(image.id, force=True)
+                # 参赛者镜像按配置保留最近一次或直接删除（由执行后端决定）
+                executor.dispose_image(
+                    image, os.path.basename(os.path.normpath(contest_dir)) if contest_dir else None, participant_id
+                )
             except Exception:
                 pass
-        # 清理主办方容器和镜像
+        # 清理主办方容器，并释放缓存镜像的引用（镜像本身保留在缓存中）
         if organizer_container:
+            executor.unwatch(organizer_container)
             try:
-                organizer_container.remove(force=True)
+                executor.remove(organizer_container)
             except Exception:
                 pass
-        if organizer_image:
+        if organizer_image_digest:
             try:
-                client.images.remove(organizer_image.id, force=True)
+                executor.release_organizer_image(organizer_image_digest)
             except Exception:
                 pass
     
@@ -271,13 +347,10 @@ def run_worker(image_tar_path: str, output_dir: str, input_dir: str = None, cont
     except Exception:
         participant_image_rel = os.path.basename(image_tar_path)
 
-    # 主办方日志与 results.json 内容
-    organizer_logs = None
+    # 主办方 results.json 内容（主办方日志已由 organizer_log 写入文件）
+    timer.begin('result_validation')
     organizer_results = None
     try:
-        if 'organizer_result' in locals() and organizer_result is not None:
-            organizer_logs = organizer_result.get('logs') if isinstance(organizer_result, dict) else None
-
         # 尝试读取主办方生成的 results.json，从本次提交的 organizer_output 目录读取
         candidate_paths = []
         if organizer_output_abs:
@@ -313,10 +386,9 @@ def run_worker(image_tar_path: str, output_dir: str, input_dir: str = None, cont
                     # 标记为主办方评测失败
                     status_code = StatusCode.CONTAINER_ERROR
                     code, _ = code_map.get(status_code, (3, '执行出错'))
-                    if organizer_logs:
-                        organizer_logs += f"\n主办方结果验证失败: {str(ve)}"
-                    else:
-                        organizer_logs = f"主办方结果验证失败: {str(ve)}"
+                    if organizer_log is None:
+                        organizer_log = LogCapture(os.path.join(log_dir, 'organizer_logs.txt'))
+                    organizer_log.note(f"主办方结果验证失败: {str(ve)}")
                 except Exception:
                     try:
                         with open(result_json_path, 'r', encoding='utf-8', errors='replace') as rf:
@@ -327,14 +399,22 @@ def run_worker(image_tar_path: str, output_dir: str, input_dir: str = None, cont
     except Exception:
         pass
 
+    # 结束日志采集（写入截断标记与尾部内容）
+    timer.begin('log_close')
+    participant_log.close()
+    if organizer_log is not None:
+        organizer_log.close()
+    timer.end()
+
     result_dict = {
         'code': code,
         'desc': desc,
-        'participant_logs': logs_text,
         'participant_image': participant_image_rel,
-        'organizer_logs': organizer_logs,
         'organizer_results': organizer_results,
-        'participant_id': participant_id
+        'participant_id': participant_id,
+        'image_load': image_load_stats,
+        'runtime_series': metrics_collector.get_series() if metrics_collector else None,
+        'phases': timer.as_dict()
     }
 
     return result_dict
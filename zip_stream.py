@@ -0,0 +1,374 @@
+"""
+ZIP 边接收边解压
+
+/create 上传的数据集 ZIP 不再先完整写入 UPLOAD_FOLDER 再解压：multipart 解析时每个 .zip 文件部分
+交给 ZipIngestStream，按本地文件头（local file header）顺序解析，数据到达即解压写入暂存目录，
+磁盘上不再保留压缩包本身。
+
+解析过程中即时执行安全检查，违规时立即停止写盘并删除已解压的内容：
+- 路径穿越：成员名为绝对路径或包含 `..`
+- 压缩包大小：已接收的字节数超过 ZIP_MAX_SIZE
+- 解压炸弹：实际解压出的总字节数超过 ZIP_MAX_EXPANDED_SIZE，或成员数超过 ZIP_MAX_FILES
+- CRC 校验失败、加密成员
+
+顺序解析无法确定数据长度的成员（stored + 数据描述符）、非 deflate 压缩算法或无法识别的结构时，
+从当前成员起改为落盘暂存（spool），接收完毕后借助中央目录用 zipfile 解压剩余成员；
+此前已经流式解压的成员不会重复处理。
+"""
+
+import os
+import shutil
+import struct
+import uuid
+import zipfile
+import zlib
+
+from config import UPLOAD_FOLDER, ZIP_MAX_EXPANDED_SIZE, ZIP_MAX_FILES, ZIP_MAX_SIZE
+from utils import zip_member_target
+
+INGEST_DIR = os.path.join(UPLOAD_FOLDER, 'ingest')
+
+LOCAL_HEADER_SIG = b'PK\x03\x04'
+CENTRAL_DIR_SIG = b'PK\x01\x02'
+END_OF_CENTRAL_DIR_SIGS = (b'PK\x05\x06', b'PK\x06\x06', b'PK\x06\x07')
+DATA_DESCRIPTOR_SIG = b'PK\x07\x08'
+LOCAL_HEADER = struct.Struct('<4sHHHHHIIIHH')
+
+FLAG_ENCRYPTED = 0x1
+FLAG_DATA_DESCRIPTOR = 0x8
+FLAG_UTF8 = 0x800
+
+# 每次解压输出的最大字节数，限制单个数据块在内存中展开的大小
+INFLATE_CHUNK = 1024 * 1024
+
+# 解析状态
+_HEADER, _DATA, _DESCRIPTOR, _TRAILER, _SPOOL, _DONE = range(6)
+
+
+class ZipRejected(Exception):
+    """压缩包未通过安全检查或格式无效。"""
+
+
+class ZipIngestStream:
+    """
+    可写的 multipart 文件容器：write() 接收数据并流式解压，seek(0)（解析器在文件部分结束时调用）完成解压
+
+    解压结果位于 staging_dir，由调用方通过 claim() 移动到最终位置；未被认领时 close() 会删除暂存内容。
+    """
+
+    def __init__(self, filename=None, max_size=None, max_expanded=None, max_files=None):
+        self.filename = filename
+        self.max_size = ZIP_MAX_SIZE if max_size is None else max_size
+        self.max_expanded = ZIP_MAX_EXPANDED_SIZE if max_expanded is None else max_expanded
+        self.max_files = ZIP_MAX_FILES if max_files is None else max_files
+        self.staging_dir = os.path.join(INGEST_DIR, uuid.uuid4().hex)
+        os.makedirs(self.staging_dir)
+
+        self.received = 0
+        self.expanded = 0
+        self.file_count = 0
+        self.spooled = False
+        self.error = None
+
+        self._state = _HEADER
+        self._buf = bytearray()
+        self._entry = None
+        self._out = None
+        self._remaining = 0
+        self._inflater = None
+        self._crc = 0
+        self._spool = None
+        self._claimed = False
+
+    # -------------------- 容器接口 --------------------
+
+    def write(self, data):
+        self.received += len(data)
+        if self.error is not None or self._state == _DONE:
+            return len(data)
+        if self.max_size and self.received > self.max_size:
+            self._reject(f'压缩包大小超过上限 {self.max_size / 1024 / 1024:.1f}MB')
+            return len(data)
+        try:
+            if self._state == _SPOOL:
+                self._spool.write(data)
+            else:
+                self._buf += data
+                self._process()
+        except ZipRejected as e:
+            self._reject(str(e))
+        except (OSError, zlib.error) as e:
+            self._reject(f'解压失败: {e}')
+        return len(data)
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        """multipart 解析器在文件部分结束时调用 seek(0)，此时完成解压；其余调用只返回接收的字节数。"""
+        if self._state != _DONE:
+            self._finish()
+        return self.received
+
+    def tell(self):
+        return self.received
+
+    def read(self, size=-1):
+        return b''
+
+    def readable(self):
+        return False
+
+    def writable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def close(self):
+        """请求结束时调用：释放文件句柄，未被认领的暂存内容一并删除。"""
+        self._close_handles()
+        if not self._claimed:
+            shutil.rmtree(self.staging_dir, ignore_errors=True)
+
+    # -------------------- 结果 --------------------
+
+    def claim(self, dest_dir):
+        """把解压结果移动到 dest_dir（dest_dir 不存在或为空目录），之后 close() 不再删除。"""
+        if self._state != _DONE:
+            self._finish()
+        if self.error is not None:
+            raise ZipRejected(self.error)
+        if os.path.isdir(dest_dir) and not os.listdir(dest_dir):
+            os.rmdir(dest_dir)
+        os.makedirs(os.path.dirname(os.path.abspath(dest_dir)), exist_ok=True)
+        shutil.move(self.staging_dir, dest_dir)
+        self._claimed = True
+
+    # -------------------- 流式解析 --------------------
+
+    def _take(self, n):
+        data = bytes(self._buf[:n])
+        del self._buf[:n]
+        return data
+
+    def _process(self):
+        while self._state not in (_TRAILER, _SPOOL, _DONE):
+            if self._state == _HEADER:
+                if not self._read_header():
+                    return
+            elif self._state == _DATA:
+                if not self._read_data():
+                    return
+            elif self._state == _DESCRIPTOR:
+                if not self._read_descriptor():
+                    return
+        if self._state == _TRAILER:
+            # 中央目录：流式解析已经处理完全部成员，剩余字节无需写盘
+            self._buf.clear()
+
+    def _read_header(self):
+        if len(self._buf) < 4:
+            return False
+        sig = bytes(self._buf[:4])
+        if sig == CENTRAL_DIR_SIG or sig in END_OF_CENTRAL_DIR_SIGS:
+            self._state = _TRAILER
+            return True
+        if sig != LOCAL_HEADER_SIG:
+            # 无法识别的结构（如自解压文件的前缀），交给 zipfile 通过中央目录处理
+            self._start_spool()
+            return False
+        if len(self._buf) < LOCAL_HEADER.size:
+            return False
+        (_, _, flags, method, _, _, crc, csize, usize, name_len, extra_len) = LOCAL_HEADER.unpack_from(self._buf)
+        header_len = LOCAL_HEADER.size + name_len + extra_len
+        if len(self._buf) < header_len:
+            return False
+
+        raw_name = bytes(self._buf[LOCAL_HEADER.size:LOCAL_HEADER.size + name_len])
+        extra = bytes(self._buf[LOCAL_HEADER.size + name_len:header_len])
+        zip64 = False
+        if csize == 0xFFFFFFFF or usize == 0xFFFFFFFF:
+            sizes = _zip64_sizes(extra)
+            if sizes is None:
+                self._start_spool()
+                return False
+            usize, csize = sizes
+            zip64 = True
+
+        if flags & FLAG_ENCRYPTED:
+            raise ZipRejected('不支持加密的压缩包')
+        if method not in (zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED) or (
+                method == zipfile.ZIP_STORED and flags & FLAG_DATA_DESCRIPTOR):
+            # 数据长度只记录在中央目录中，或需要 zipfile 支持的其他压缩算法
+            self._start_spool()
+            return False
+
+        name = raw_name.decode('utf-8' if flags & FLAG_UTF8 else 'cp437')
+        self._begin_entry(name)
+        self._take(header_len)
+        self._entry = {'name': name, 'flags': flags, 'method': method, 'crc': crc, 'zip64': zip64}
+        self._crc = 0
+        if method == zipfile.ZIP_DEFLATED:
+            self._inflater = zlib.decompressobj(-15)
+        else:
+            self._inflater = None
+            self._remaining = csize
+        self._state = _DATA
+        return True
+
+    def _begin_entry(self, name):
+        self.file_count += 1
+        if self.file_count > self.max_files:
+            raise ZipRejected(f'压缩包成员数超过上限 {self.max_files}')
+        target = zip_member_target(self.staging_dir, name)
+        if target is None:
+            raise ZipRejected(f'非法的压缩包成员路径: {name}')
+        if name.endswith('/'):
+            os.makedirs(target, exist_ok=True)
+            self._out = None
+        else:
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            self._out = open(target, 'wb')
+
+    def _emit(self, data):
+        if not data:
+            return
+        self.expanded += len(data)
+        if self.expanded > self.max_expanded:
+            raise ZipRejected(f'解压后总大小超过上限 {self.max_expanded} 字节')
+        self._crc = zlib.crc32(data, self._crc)
+        if self._out is None:
+            raise ZipRejected(f"目录成员包含数据: {self._entry['name']}")
+        self._out.write(data)
+
+    def _read_data(self):
+        if self._inflater is None:
+            n = min(len(self._buf), self._remaining)
+            self._emit(self._take(n))
+            self._remaining -= n
+            if self._remaining:
+                return False
+        else:
+            data = self._take(len(self._buf))
+            while True:
+                out = self._inflater.decompress(data, INFLATE_CHUNK)
+                self._emit(out)
+                if self._inflater.eof:
+                    self._buf[:0] = self._inflater.unused_data
+                    break
+                data = self._inflater.unconsumed_tail
+                if not data and len(out) < INFLATE_CHUNK:
+                    return False
+        self._state = _DESCRIPTOR if self._entry['flags'] & FLAG_DATA_DESCRIPTOR else _HEADER
+        if self._state == _HEADER:
+            self._end_entry(self._entry['crc'])
+        return True
+
+    def _read_descriptor(self):
+        size_len = 16 if self._entry['zip64'] else 8
+        if len(self._buf) < 4:
+            return False
+        with_sig = bytes(self._buf[:4]) == DATA_DESCRIPTOR_SIG
+        need = (4 if with_sig else 0) + 4 + size_len
+        if len(self._buf) < need:
+            return False
+        descriptor = self._take(need)
+        crc = struct.unpack_from('<I', descriptor, 4 if with_sig else 0)[0]
+        self._end_entry(crc)
+        self._state = _HEADER
+        return True
+
+    def _end_entry(self, expected_crc):
+        if self._out is not None:
+            self._out.close()
+            self._out = None
+        if self._crc != expected_crc:
+            raise ZipRejected(f"CRC 校验失败: {self._entry['name']}")
+        self._entry = None
+        self._inflater = None
+
+    # -------------------- 暂存回退 --------------------
+
+    def _start_spool(self):
+        """从当前成员起把剩余数据写入暂存文件，接收完毕后通过中央目录解压。"""
+        self.spooled = True
+        self._spool = open(os.path.join(self.staging_dir, '.spool.zip'), 'wb')
+        self._spool.write(self._buf)
+        self._buf.clear()
+        self._state = _SPOOL
+
+    def _extract_spool(self):
+        spool_path = self._spool.name
+        self._spool.close()
+        self._spool = None
+        try:
+            # 暂存文件缺少开头已流式处理的部分，zipfile 会据此把成员偏移整体前移；
+            # 偏移为负的成员即为已经解压过的成员
+            with zipfile.ZipFile(spool_path) as zf:
+                for info in zf.infolist():
+                    if info.header_offset < 0:
+                        continue
+                    self._begin_entry(info.filename)
+                    self._entry = {'name': info.filename}
+                    self._crc = 0
+                    if self._out is None:
+                        continue
+                    with zf.open(info) as src:
+                        while True:
+                            block = src.read(INFLATE_CHUNK)
+                            if not block:
+                                break
+                            self._emit(block)
+                    self._out.close()
+                    self._out = None
+        except zipfile.BadZipFile as e:
+            raise ZipRejected(f'不是有效的 ZIP 文件: {e}')
+        finally:
+            try:
+                os.remove(spool_path)
+            except OSError:
+                pass
+
+    # -------------------- 结束 --------------------
+
+    def _finish(self):
+        if self.error is None:
+            try:
+                if self._state == _SPOOL:
+                    self._extract_spool()
+                elif self._state != _TRAILER:
+                    raise ZipRejected('ZIP 文件不完整或格式无效')
+            except ZipRejected as e:
+                self._reject(str(e))
+            except (OSError, zlib.error, RuntimeError, NotImplementedError) as e:
+                self._reject(f'解压失败: {e}')
+        self._close_handles()
+        self._buf = bytearray()
+        self._state = _DONE
+
+    def _reject(self, message):
+        """拒绝压缩包：停止写盘并删除已解压的内容，后续数据直接丢弃。"""
+        self.error = message
+        self._close_handles()
+        self._buf = bytearray()
+        shutil.rmtree(self.staging_dir, ignore_errors=True)
+        self._state = _DONE
+
+    def _close_handles(self):
+        for handle in (self._out, self._spool):
+            if handle is not None:
+                try:
+                    handle.close()
+                except OSError:
+                    pass
+        self._out = None
+        self._spool = None
+
+
+def _zip64_sizes(extra):
+    """从 extra 字段中解析 zip64 的 (原始大小, 压缩后大小)。"""
+    pos = 0
+    while pos + 4 <= len(extra):
+        header_id, size = struct.unpack_from('<HH', extra, pos)
+        if header_id == 0x0001 and size >= 16:
+            return struct.unpack_from('<QQ', extra, pos + 4)
+        pos += 4 + size
+    return None